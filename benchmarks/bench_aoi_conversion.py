@@ -0,0 +1,126 @@
+# ---- This is <bench_aoi_conversion.py> ----
+
+"""
+Benchmark of GeoJSON to WKT conversion for large AOIs: geomet based
+convert_geojson_obj_2_wkt against the vectorized NumPy conversion.
+The outputs of both conversions are compared for every AOI size.
+"""
+
+import sys
+import copy
+import json
+import math
+import time
+import argparse
+
+from loguru import logger
+
+import CDSE.json_utils as CDSE_json
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def build_aoi(n_vertices, three_d=True):
+    """
+    Synthetic AOI: feature collection with a detailed polygon (with hole) and a line
+
+    Returns
+    -------
+    geojson_obj : dictionary with geojson data
+    """
+
+    def ring(n, radius, lon0=15.0, lat0=70.0):
+        points = []
+        for i in range(n):
+            angle = 2 * math.pi * i / n
+            r = radius * (1 + 0.1 * math.sin(37 * angle))
+            point = [lon0 + 2 * r * math.cos(angle), lat0 + r * math.sin(angle)]
+            if three_d:
+                point.append(12.5)
+            points.append(point)
+        points.append(list(points[0]))
+        return points
+
+    n_outer = int(n_vertices * 0.7)
+    n_inner = int(n_vertices * 0.2)
+    n_line = n_vertices - n_outer - n_inner
+
+    return {
+        'type': 'FeatureCollection',
+        'features': [
+            {'type': 'Feature', 'properties': {}, 'geometry': {'type': 'Polygon', 'coordinates': [ring(n_outer, 2.0), ring(n_inner, 0.5)]}},
+            {'type': 'Feature', 'properties': {}, 'geometry': {'type': 'LineString', 'coordinates': ring(n_line, 3.0)[:-1]}},
+        ]
+    }
+
+def time_conversion(function, geojson_obj, decimals, n_repeats):
+    """
+    Best time of n_repeats conversions (each on a fresh copy, convert_geojson_obj_2_wkt modifies its input)
+
+    Returns
+    -------
+    seconds : best conversion time
+    wkt : converted string
+    """
+
+    best = float('inf')
+    for i in range(n_repeats):
+        obj = copy.deepcopy(geojson_obj)
+        t_start = time.perf_counter()
+        wkt = function(obj, decimals=decimals)
+        best = min(best, time.perf_counter() - t_start)
+
+    return best, wkt
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def main():
+
+    p = argparse.ArgumentParser(description='Benchmark GeoJSON to WKT conversion for large AOIs.')
+    p.add_argument('--n-vertices', type=int, nargs='+', default=[1000, 10000, 100000, 500000], help='AOI sizes')
+    p.add_argument('--decimals', type=int, default=4, help='number of decimals')
+    p.add_argument('--n-repeats', type=int, default=3, help='conversions per variant (best time is reported)')
+    p.add_argument('--output', default=None, help='write results to json file')
+    args = p.parse_args()
+
+    logger.remove()
+    logger.add(sys.stderr, level='WARNING')
+
+    results = []
+
+    for n_vertices in args.n_vertices:
+        geojson_obj = build_aoi(n_vertices)
+
+        t_geomet, wkt_geomet = time_conversion(CDSE_json.convert_geojson_obj_2_wkt, geojson_obj, args.decimals, args.n_repeats)
+        t_vectorized, wkt_vectorized = time_conversion(CDSE_json.convert_geojson_obj_2_wkt_vectorized, geojson_obj, args.decimals, args.n_repeats)
+
+        identical = wkt_geomet == wkt_vectorized
+        if not identical:
+            logger.error(f"Different WKT for {n_vertices} vertices")
+
+        result = {
+            'n_vertices': n_vertices,
+            'geomet_s': round(t_geomet, 4),
+            'vectorized_s': round(t_vectorized, 4),
+            'speedup': round(t_geomet / t_vectorized, 1),
+            'identical': identical,
+        }
+        results.append(result)
+
+        print(f"{n_vertices:10d} vertices   geomet {t_geomet:8.3f} s   vectorized {t_vectorized:8.3f} s   speedup {result['speedup']:6.1f}x   identical {identical}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'decimals': args.decimals, 'results': results}, f, indent=2)
+
+    if not all(result['identical'] for result in results):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+# ---- End of <bench_aoi_conversion.py> ----
@@ -0,0 +1,179 @@
+# ---- This is <bench_end_to_end.py> ----
+
+"""
+End-to-end throughput benchmark of search and download against the local mock CDSE server.
+"""
+
+import sys
+import json
+import time
+import pathlib
+import argparse
+import tempfile
+import resource
+import tracemalloc
+
+from loguru import logger
+
+import CDSE.search_and_download as CDSE_sd
+import CDSE.access_token_credentials as CDSE_atc
+import CDSE.mock_server as CDSE_mock
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def run_stage(name, function, n_items, unit):
+    """
+    Run benchmark stage twice: once timed, once with traced memory allocations
+    (tracing slows down allocation heavy code, so it is not used for timing)
+
+    The stage function returns its number of failed items (e.g. queries or
+    downloads failing with injected errors), which is reported with the timed run.
+
+    Returns
+    -------
+    result : dict with stage results
+    """
+
+    t_start = time.perf_counter()
+    n_failed = function()
+    elapsed = time.perf_counter() - t_start
+
+    tracemalloc.start()
+    function()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    result = {
+        'stage': name,
+        'elapsed_s': round(elapsed, 4),
+        f"{unit}_per_s": round(n_items / elapsed, 2),
+        'peak_traced_MB': round(peak / 1e6, 2),
+        'n_failed': n_failed,
+    }
+
+    print(f"{name:35s} {n_items / elapsed:10.2f} {unit}/s   {elapsed:8.3f} s   peak {peak / 1e6:8.2f} MB   failed {n_failed}")
+
+    return result
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def main():
+
+    p = argparse.ArgumentParser(description='Benchmark CDSE search and download against a local mock server.')
+    p.add_argument('--n-queries', type=int, default=20, help='number of repeated search queries')
+    p.add_argument('--n-products', type=int, default=2500, help='number of products in the mock catalogue')
+    p.add_argument('--page-size', type=int, default=1000, help='products per page ($top)')
+    p.add_argument('--n-downloads', type=int, default=5, help='number of products to download')
+    p.add_argument('--product-size', type=int, default=20 * 1024 * 1024, help='synthetic product size in bytes')
+    p.add_argument('--latency', type=float, default=0, help='server latency per request in seconds')
+    p.add_argument('--bandwidth', type=float, default=None, help='server bandwidth cap in bytes/s')
+    p.add_argument('--error-rate', type=float, default=0, help='probability of injected error responses')
+    p.add_argument('--output', default=None, help='write results to json file')
+    args = p.parse_args()
+
+    logger.remove()
+    logger.add(sys.stderr, level='WARNING')
+
+    results = []
+
+    search_kwargs = dict(
+        sensor = 'SENTINEL-1',
+        area = {'lat': 78.5, 'lon': 16.0},
+        start_date = '2022-06-01',
+        end_date = '2022-06-30',
+        max_results = args.page_size,
+        loglevel = 'WARNING'
+    )
+
+    with CDSE_mock.MockCDSEServer(
+        n_products = args.n_products,
+        product_size = args.product_size,
+        latency = args.latency,
+        bandwidth = args.bandwidth,
+        error_rate = args.error_rate,
+        seed = 0
+    ) as server, CDSE_mock.use_mock_endpoints(server):
+
+        # ------------------------ #
+
+        def search():
+            # failed queries return an empty list
+            return sum(type(CDSE_sd.search_CDSE_catalogue(**search_kwargs)) is not dict for i in range(args.n_queries))
+
+        results.append(run_stage('search_CDSE_catalogue', search, args.n_queries, 'queries'))
+
+        def search_by_name():
+            return sum(
+                type(CDSE_sd.search_CDSE_catalogue_by_name('S1A_EW_GRDM_1SDH_20220602T073727_20220602T073831_043481_05310C_53F3', loglevel='WARNING')) is not dict
+                for i in range(args.n_queries)
+            )
+
+        results.append(run_stage('search_CDSE_catalogue_by_name', search_by_name, args.n_queries, 'queries'))
+
+        # ------------------------ #
+
+        # first page for the following stages (queries can fail with injected errors)
+        for i in range(10):
+            response_json = CDSE_sd.search_CDSE_catalogue(**search_kwargs)
+            if type(response_json) is dict:
+                break
+        else:
+            sys.exit("Search failed 10 times, stopping")
+
+        n_pages = -(-args.n_products // args.page_size)
+
+        def paginate():
+            # iteration stops at a failed page
+            n_iterated = sum(1 for page_json in CDSE_sd.iterate_CDSE_response_pages(response_json, loglevel='WARNING'))
+            return n_pages - n_iterated
+
+        results.append(run_stage('iterate_CDSE_response_pages', paginate, n_pages, 'pages'))
+
+        # ------------------------ #
+
+        product_list = response_json['value'][:args.n_downloads]
+        total_MB = len(server.payload) * len(product_list) / 1e6
+
+        def download_or_fail(product, download_dir):
+            try:
+                return CDSE_sd.download_product_from_cdse(product, download_dir, 'user', 'password')
+            except CDSE_atc.TokenRequestError:
+                return False
+
+        def download():
+            with tempfile.TemporaryDirectory() as download_dir:
+                return sum(not download_or_fail(product, download_dir) for product in product_list)
+
+        results.append(run_stage('download_product_from_cdse', download, total_MB, 'MB'))
+
+        def download_list():
+            with tempfile.TemporaryDirectory() as download_dir:
+                try:
+                    CDSE_sd.download_product_list_from_cdse(product_list, download_dir, 'user', 'password')
+                except CDSE_atc.TokenRequestError:
+                    pass
+                return len(product_list) - len(list(pathlib.Path(download_dir).glob('*.zip')))
+
+        results.append(run_stage('download_product_list_from_cdse', download_list, total_MB, 'MB'))
+
+        counters = dict(server.counters)
+
+    # ------------------------ #
+
+    max_rss_MB = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"{'max RSS':35s} {max_rss_MB:10.2f} MB")
+    print(f"{'server requests':35s} {counters}")
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump({'args': vars(args), 'results': results, 'max_rss_MB': max_rss_MB, 'server': counters}, f, indent=4)
+
+if __name__ == '__main__':
+    main()
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+# ---- End of <bench_end_to_end.py> ----
@@ -0,0 +1,119 @@
+# ---- This is <bench_import_time.py> ----
+
+"""
+Benchmark of cold-start latency: import time of the CDSE modules and
+start-up time of the cdse command line interface, each measured in a
+fresh interpreter. With --max-ms the benchmark fails if a median exceeds
+the threshold (e.g. in CI).
+"""
+
+import re
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+# statements timed in a fresh interpreter (label, python arguments)
+default_targets = [
+    ('python (baseline)', ['-c', 'pass']),
+    ('import CDSE.json_utils', ['-c', 'import CDSE.json_utils']),
+    ('import CDSE.utils', ['-c', 'import CDSE.utils']),
+    ('import CDSE.search_and_download', ['-c', 'import CDSE.search_and_download']),
+    ('cdse --help', ['-m', 'CDSE.cli', '--help']),
+]
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def time_process(python_args, n_repeats):
+    """
+    Median wall time of n_repeats interpreter runs
+
+    Returns
+    -------
+    ms : median run time in milliseconds
+    """
+
+    times = []
+    for i in range(n_repeats):
+        # perf_counter in the parent, so the interpreter start-up is included
+        code = (
+            "import subprocess, sys, time;"
+            "t = time.perf_counter();"
+            f"subprocess.run([sys.executable] + {python_args!r}, check=True, stdout=subprocess.DEVNULL);"
+            "print(time.perf_counter() - t)"
+        )
+        output = subprocess.run([sys.executable, '-c', code], check=True, capture_output=True, text=True).stdout
+        times.append(float(output) * 1000)
+
+    return statistics.median(times)
+
+def get_slowest_imports(module, n_top):
+    """
+    Packages imported by a module with the largest cumulative import time (python -X importtime),
+    interpreter start-up (site, encodings) and the CDSE package itself are left out
+
+    Returns
+    -------
+    slowest : list of (package, ms)
+    """
+
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], check=True, capture_output=True, text=True).stderr
+
+    cumulative = dict()
+    for line in stderr.splitlines():
+        match = re.match(r'import time:\s+\d+ \|\s+(\d+) \|\s*(\S+)', line)
+        if not match:
+            continue
+        package = match.group(2).split('.')[0]
+        if package in ('site', 'encodings', module.split('.')[0]):
+            continue
+        # outermost entry of a package has the largest cumulative time
+        cumulative[package] = max(cumulative.get(package, 0), int(match.group(1)) / 1000)
+
+    return sorted(cumulative.items(), key=lambda item: -item[1])[:n_top]
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def main():
+
+    p = argparse.ArgumentParser(description='Benchmark import time of the CDSE modules and start-up time of the cdse CLI.')
+    p.add_argument('--n-repeats', type=int, default=7, help='runs per target (median is reported)')
+    p.add_argument('--n-top', type=int, default=5, help='slowest imports listed per module (0 to skip)')
+    p.add_argument('--max-ms', type=float, default=None, help='fail if a median exceeds this time')
+    p.add_argument('--output', default=None, help='write results to json file')
+    args = p.parse_args()
+
+    results = []
+
+    for label, python_args in default_targets:
+        ms = time_process(python_args, args.n_repeats)
+        results.append({'target': label, 'median_ms': round(ms, 1)})
+        print(f"{label:35s} {ms:8.1f} ms")
+
+        if args.n_top and label.startswith('import '):
+            for package, package_ms in get_slowest_imports(label.split()[-1], args.n_top):
+                print(f"{'':5s}{package:30s} {package_ms:8.1f} ms")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'n_repeats': args.n_repeats, 'results': results}, f, indent=2)
+
+    if args.max_ms is not None:
+        too_slow = [r['target'] for r in results if r['median_ms'] > args.max_ms]
+        if too_slow:
+            print(f"Above {args.max_ms} ms: {', '.join(too_slow)}")
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+# ---- End of <bench_import_time.py> ----
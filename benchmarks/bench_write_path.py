@@ -0,0 +1,162 @@
+# ---- This is <bench_write_path.py> ----
+
+"""
+Benchmark of the download write path: throughput and client CPU time per GB
+for the previous 8 KiB iter_content loop and the buffered readinto engine
+(fixed and auto-tuned chunk sizes, fsync policies).
+
+The mock server runs in a separate process, so the measured CPU time is
+the CPU time of the downloading client only.
+"""
+
+import sys
+import json
+import time
+import socket
+import argparse
+import tempfile
+import pathlib
+import subprocess
+
+import requests
+from loguru import logger
+
+import CDSE.search_and_download as CDSE_sd
+import CDSE.access_token_credentials as CDSE_atc
+import CDSE.mock_server as CDSE_mock
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def start_mock_server_process(product_size):
+    """
+    Start mock server in a subprocess and wait until it accepts connections
+
+    Returns
+    -------
+    process : subprocess.Popen
+    url : server url
+    """
+
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'CDSE.mock_server', '--port', str(port), '--n-products', '10', '--product-size', str(product_size)],
+        stdout = subprocess.DEVNULL,
+        stderr = subprocess.DEVNULL
+    )
+
+    url = f"http://127.0.0.1:{port}"
+    for i in range(100):
+        try:
+            requests.get(f"{url}{CDSE_mock.catalogue_path}?$top=1", timeout=1)
+            return process, url
+        except requests.exceptions.ConnectionError:
+            time.sleep(0.1)
+
+    process.kill()
+    raise RuntimeError("Mock server did not start")
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def legacy_download(product, download_zip_path, username, password):
+    # write path before the buffered engine: 8 KiB iter_content chunks
+    access_token = CDSE_atc.get_cached_access_token(username, password)
+    url = f"{CDSE_sd.zipper_url}({product['Id']})/$value"
+    with requests.get(url, headers={"Authorization": f"Bearer {access_token}"}, stream=True) as response:
+        with open(download_zip_path, "wb") as file:
+            for chunk in response.iter_content(chunk_size=8192):
+                if chunk:
+                    file.write(chunk)
+    return True
+
+def run_variant(name, download, product, download_dir, n_repeats):
+    """
+    Download product n_repeats times
+
+    Returns
+    -------
+    result : dict with wall and cpu time per GB
+    """
+
+    download_zip_path = pathlib.Path(download_dir) / f"{name}.zip"
+    n_bytes = 0
+    t_wall = time.perf_counter()
+    t_cpu = time.process_time()
+
+    for i in range(n_repeats):
+        download_zip_path.unlink(missing_ok=True)
+        if not download(product, download_zip_path):
+            raise RuntimeError(f"Download failed in variant {name}")
+        n_bytes += download_zip_path.stat().st_size
+
+    wall = time.perf_counter() - t_wall
+    cpu = time.process_time() - t_cpu
+    download_zip_path.unlink(missing_ok=True)
+
+    result = {
+        'variant': name,
+        'MB_per_s': round(n_bytes / 1e6 / wall, 1),
+        'cpu_s_per_GB': round(cpu / (n_bytes / 1e9), 3),
+    }
+
+    print(f"{name:30s} {result['MB_per_s']:10.1f} MB/s   {result['cpu_s_per_GB']:8.3f} CPU s/GB")
+
+    return result
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def main():
+
+    p = argparse.ArgumentParser(description='Benchmark the download write path against a local mock server.')
+    p.add_argument('--product-size', type=int, default=200 * 1024 * 1024, help='synthetic product size in bytes')
+    p.add_argument('--n-repeats', type=int, default=5, help='downloads per variant')
+    p.add_argument('--download-dir', default=None, help='download directory (default: temporary directory)')
+    p.add_argument('--output', default=None, help='write results to json file')
+    args = p.parse_args()
+
+    logger.remove()
+    logger.add(sys.stderr, level='WARNING')
+
+    process, url = start_mock_server_process(args.product_size)
+
+    CDSE_sd.zipper_url = f"{url}{CDSE_mock.catalogue_path}"
+    CDSE_atc.token_url = f"{url}{CDSE_mock.token_path}"
+
+    username, password = 'benchmark', 'benchmark'
+
+    variants = {
+        'legacy iter_content 8 KiB': lambda product, path: legacy_download(product, path, username, password),
+        'readinto 64 KiB': lambda product, path: CDSE_sd._download_product_zip(product, path, username, password, chunk_size=64*1024),
+        'readinto 1 MiB': lambda product, path: CDSE_sd._download_product_zip(product, path, username, password, chunk_size=1024*1024),
+        'readinto auto': lambda product, path: CDSE_sd._download_product_zip(product, path, username, password),
+        'readinto auto, fsync end': lambda product, path: CDSE_sd._download_product_zip(product, path, username, password, fsync_policy='end'),
+        'readinto auto, fsync interval': lambda product, path: CDSE_sd._download_product_zip(product, path, username, password, fsync_policy='interval'),
+    }
+
+    results = []
+
+    try:
+        product = requests.get(f"{url}{CDSE_mock.catalogue_path}?$top=1").json()['value'][0]
+        with tempfile.TemporaryDirectory(dir=args.download_dir) as download_dir:
+            for name, download in variants.items():
+                results.append(run_variant(name, download, product, download_dir, args.n_repeats))
+    finally:
+        process.terminate()
+        process.wait()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'product_size': args.product_size, 'results': results}, f, indent=2)
+
+if __name__ == '__main__':
+    main()
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+# ---- End of <bench_write_path.py> ----
@@ -18,15 +18,21 @@ setup(
         'requests',
         'geojson',
         'geomet',
+        'numpy',
         'python-dotenv',
         'pathlib',
         'ipython',
     ],
+    extras_require = {
+        'parquet': ['pyarrow', 'shapely'],
+        's3': ['boto3'],
+    },
     packages = find_packages(where='src'),
     package_dir = {'': 'src'},
     package_data = {'': ['*.xml']},
     entry_points = {
         'console_scripts': [
+            'cdse = CDSE.cli:main',
         ]
     },
     include_package_data=True,
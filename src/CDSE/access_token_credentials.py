@@ -4,8 +4,43 @@
 Generate access token for CDSE.
 """
 
+import os
+import time
+import threading
+
 import requests
 
+import CDSE.token_store as CDSE_token_store
+import CDSE.tracing as CDSE_tracing
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+# CDSE identity endpoint (can be redirected, e.g. to CDSE.mock_server)
+token_url = "https://identity.dataspace.copernicus.eu/auth/realms/CDSE/protocol/openid-connect/token"
+
+# cached tokens are renewed when they are valid for less than this many seconds
+default_min_validity = 60
+
+# per-process token cache (username -> token dict), the lock guards the dicts only
+_token_cache = dict()
+_token_cache_lock = threading.Lock()
+
+# per-username locks held while a token is renewed (username -> lock)
+_token_renew_locks = dict()
+
+# token store shared by all processes on this host (None: disabled, see use_shared_token_store)
+token_store_path = os.environ.get("CDSE_TOKEN_STORE")
+_token_store = None
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+class TokenRequestError(Exception):
+    """
+    The identity endpoint rejected a token request (e.g. wrong credentials)
+    """
+
 # -------------------------------------------------------------------------- #
 # -------------------------------------------------------------------------- #
 
@@ -31,17 +66,175 @@ def get_access_token(username: str, password: str) -> str:
     }
 
     try:
-        r = requests.post(
-            "https://identity.dataspace.copernicus.eu/auth/realms/CDSE/protocol/openid-connect/token",
+        r = CDSE_tracing.request(
+            'POST',
+            token_url,
             data = data,
         )
         r.raise_for_status()
     except Exception as e:
-        raise Exception(f"Access token creation failed. Reponse from the server was: {r.json()}")
+        raise TokenRequestError(f"Access token creation failed. Reponse from the server was: {r.json()}")
 
     return r.json()["access_token"]
 
 # -------------------------------------------------------------------------- #
 # -------------------------------------------------------------------------- #
 
+def request_token(data: dict) -> dict:
+    """
+    Request token from the CDSE identity endpoint.
+
+    Parameters
+    ----------
+    data : form data (password or refresh_token grant)
+
+    Returns
+    -------
+    token : token dict from the server, with added 'expires_at' and 'refresh_expires_at' (epoch seconds)
+
+    Raises
+    ------
+    TokenRequestError : the server did not answer with status 200
+    """
+
+    t_request = time.time()
+
+    r = CDSE_tracing.request('POST', token_url, data=data)
+
+    if r.status_code != 200:
+        try:
+            detail = r.json()
+        except ValueError:
+            detail = r.text[:200]
+        raise TokenRequestError(f"Access token creation failed with status {r.status_code}. Reponse from the server was: {detail}")
+
+    token = r.json()
+    token['expires_at'] = t_request + token.get('expires_in', 0)
+    token['refresh_expires_at'] = t_request + token.get('refresh_expires_in', 0)
+
+    return token
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def get_cached_access_token(username: str, password: str, min_validity: float = default_min_validity) -> str:
+    """
+    Get access token for CDSE, reusing a cached token of this process while it is valid.
+    Expired tokens are renewed with the refresh token if possible, otherwise with a password grant.
+    With a shared token store (see use_shared_token_store), tokens are also shared
+    between processes and only one process renews an expiring token.
+
+    Parameters
+    ----------
+    username : CDSE username
+    password : CDSE password
+    min_validity : minimum remaining validity of a cached token in seconds (default=60)
+
+    Returns
+    -------
+    access_token : CDSE access token
+
+    Raises
+    ------
+    TokenRequestError : the token request was rejected
+    """
+
+    global _token_store
+
+    with _token_cache_lock:
+        token = _token_cache.get(username)
+        if token is not None and token['expires_at'] - time.time() > min_validity:
+            return token['access_token']
+        renew_lock = _token_renew_locks.setdefault(username, threading.Lock())
+
+    # the token request only blocks threads of the same account
+    with renew_lock:
+        with _token_cache_lock:
+            token = _token_cache.get(username)
+            if token is not None and token['expires_at'] - time.time() > min_validity:
+                # renewed by another thread while waiting
+                return token['access_token']
+            if token_store_path is not None and _token_store is None:
+                _token_store = CDSE_token_store.SharedTokenStore(token_store_path)
+            token_store = None if token_store_path is None else _token_store
+
+        if token_store is None:
+            token = _renew_token(token, username, password, min_validity)
+        else:
+            cached_token = token
+            token = token_store.get(
+                username,
+                min_validity,
+                lambda shared_token: _renew_token(shared_token or cached_token, username, password, min_validity)
+            )
+
+        with _token_cache_lock:
+            _token_cache[username] = token
+
+        return token['access_token']
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def _renew_token(token, username, password, min_validity):
+    # refresh grant while the refresh token is valid, password grant otherwise
+
+    if token is not None and token.get('refresh_token') and token['refresh_expires_at'] - time.time() > min_validity:
+        try:
+            return request_token({
+                "client_id": "cdse-public",
+                "grant_type": "refresh_token",
+                "refresh_token": token['refresh_token'],
+            })
+        except Exception:
+            pass
+
+    return request_token({
+        "client_id": "cdse-public",
+        "username": username,
+        "password": password,
+        "grant_type": "password",
+    })
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def invalidate_cached_access_token(username: str):
+    """
+    Remove cached token (e.g. after the server rejected it)
+
+    Parameters
+    ----------
+    username : CDSE username
+    """
+
+    with _token_cache_lock:
+        token = _token_cache.pop(username, None)
+        store_path = token_store_path
+
+    if store_path is not None and token is not None:
+        CDSE_token_store.SharedTokenStore(store_path).invalidate(username, token['access_token'])
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def use_shared_token_store(store_path=CDSE_token_store.default_token_store_path):
+    """
+    Share cached tokens between all processes on this host through a locked file (mode 0600).
+    Can also be enabled by setting the environment variable CDSE_TOKEN_STORE to the file path.
+
+    Parameters
+    ----------
+    store_path : path of the token store file (default=~/.cache/CDSE/tokens.json, None to disable)
+    """
+
+    global token_store_path, _token_store
+
+    with _token_cache_lock:
+        token_store_path = None if store_path is None else str(store_path)
+        _token_store = None
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
 # ---- End of <access_token_credentials.py> ----
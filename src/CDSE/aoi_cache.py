@@ -0,0 +1,233 @@
+# ---- This is <aoi_cache.py> ----
+
+"""
+Bounded in-process cache of AOI strings and parsed geometries.
+"""
+
+import pathlib
+import threading
+import collections
+
+from loguru import logger
+
+import CDSE.json_utils as CDSE_json
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+# default number of cached AOIs (per AOI source and number of decimals)
+default_max_entries = 256
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+class AOIEntry:
+    """
+    Cached AOI: well-known text and parsed geometry (geojson object, must not be modified),
+    'derived' holds values computed from the AOI (e.g. S2 tile IDs) and is dropped with the entry
+    """
+
+    __slots__ = ['aoi_string', 'geometry', 'signature', 'derived']
+
+    def __init__(self, aoi_string, geometry, signature):
+        self.aoi_string = aoi_string
+        self.geometry = geometry
+        self.signature = signature
+        self.derived = dict()
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+class AOICache:
+    """
+    Least recently used cache of AOIs given as GeoJSON file or lat/lon dict.
+
+    GeoJSON files are keyed on their resolved path and 'decimals'. Every
+    lookup compares the file's mtime and size with the cached entry, so
+    changed files are read and converted again (counted as invalidation).
+    Lat/lon dicts are keyed on their coordinates and 'decimals'.
+    """
+
+    def __init__(self, max_entries=default_max_entries):
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'invalidations': 0, 'evictions': 0}
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    # ------------------------ #
+
+    def _key_and_signature(self, area, decimals):
+        if type(area) is dict:
+            return ('lat_lon', area['lat'], area['lon'], decimals), None
+        geojson_path = pathlib.Path(area).resolve()
+        stat = geojson_path.stat()
+        return ('geojson', str(geojson_path), decimals), (stat.st_mtime_ns, stat.st_size)
+
+    def _load(self, area, decimals):
+        if type(area) is dict:
+            geometry = {'type': 'Point', 'coordinates': [area['lon'], area['lat']]}
+            return CDSE_json.get_aoi_string_from_lat_lon_dict(area, decimals=decimals), geometry
+        geometry = CDSE_json.read_geojson(area)
+        # the cached geometry stays as read from the file (the vectorized conversion and its fallback do not modify it)
+        return CDSE_json.convert_geojson_obj_2_wkt_vectorized(geometry, decimals=decimals), geometry
+
+    def get(self, area, decimals=4):
+        """
+        Cached AOI of a GeoJSON file or lat/lon dict (read and converted on a miss)
+
+        Parameters
+        ----------
+        area : geojson file with search area or dict with 'lat'/'lon' keys
+        decimals : number of decimal to round coordinate to (default=4)
+
+        Returns
+        -------
+        entry : AOIEntry
+        """
+
+        key, signature = self._key_and_signature(area, decimals)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry.signature == signature:
+                    self._entries.move_to_end(key)
+                    self._stats['hits'] += 1
+                    return entry
+                logger.debug(f"AOI file changed, invalidating cached AOI: {key[1]}")
+                del self._entries[key]
+                self._stats['invalidations'] += 1
+            self._stats['misses'] += 1
+
+        # read and convert outside of the lock (concurrent misses of one AOI convert it twice)
+        aoi_string, geometry = self._load(area, decimals)
+        entry = AOIEntry(aoi_string, geometry, signature)
+
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            self._evict()
+
+        return entry
+
+    def _evict(self):
+        # caller holds the lock
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats['evictions'] += 1
+
+    def resize(self, max_entries):
+        """
+        Change the maximum number of entries (evicting least recently used entries)
+        """
+
+        with self._lock:
+            self.max_entries = max_entries
+            self._evict()
+
+    def invalidate(self, area=None):
+        """
+        Remove cached entries of one AOI (all decimals), or all entries if area is None
+
+        Returns
+        -------
+        n_removed : number of removed entries
+        """
+
+        with self._lock:
+            if area is None:
+                keys = list(self._entries)
+            elif type(area) is dict:
+                keys = [k for k in self._entries if k[:3] == ('lat_lon', area['lat'], area['lon'])]
+            else:
+                path = str(pathlib.Path(area).resolve())
+                keys = [k for k in self._entries if k[:2] == ('geojson', path)]
+            for key in keys:
+                del self._entries[key]
+            self._stats['invalidations'] += len(keys)
+
+        return len(keys)
+
+    def get_stats(self):
+        """
+        Cache statistics
+
+        Returns
+        -------
+        stats : dict with hits, misses, invalidations, evictions, entries and hit_rate
+        """
+
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+
+        n_lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / n_lookups if n_lookups else None
+
+        return stats
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+# per-process cache used by the search functions
+_aoi_cache = AOICache()
+
+def get_aoi_string(area, decimals=4):
+    """
+    Well-known text of an AOI from the per-process cache
+
+    Parameters
+    ----------
+    area : geojson file with search area or dict with 'lat'/'lon' keys
+    decimals : number of decimal to round coordinate to (default=4)
+
+    Returns
+    -------
+    aoi_string : well-known text string representation of the geometry
+    """
+
+    return _aoi_cache.get(area, decimals=decimals).aoi_string
+
+def get_aoi_entry(area, decimals=4):
+    """
+    AOIEntry of an AOI from the per-process cache
+    """
+
+    return _aoi_cache.get(area, decimals=decimals)
+
+def get_aoi_geometry(area):
+    """
+    Parsed geometry (geojson object) of an AOI from the per-process cache (must not be modified)
+    """
+
+    return _aoi_cache.get(area).geometry
+
+def invalidate_aoi_cache(area=None):
+    """
+    Remove one AOI (or all AOIs if area is None) from the per-process cache
+    """
+
+    return _aoi_cache.invalidate(area)
+
+def get_aoi_cache_stats():
+    """
+    Statistics of the per-process cache (see AOICache.get_stats)
+    """
+
+    return _aoi_cache.get_stats()
+
+def set_aoi_cache_size(max_entries):
+    """
+    Change the maximum number of entries of the per-process cache
+    """
+
+    _aoi_cache.resize(max_entries)
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+# ---- End of <aoi_cache.py> ----
@@ -0,0 +1,272 @@
+# ---- This is <cli.py> ----
+
+"""
+Command line interface 'cdse' with search, lookup, download, sync and watch subcommands.
+
+Modules are imported inside the subcommands, so 'cdse --help' and
+argument errors return without loading requests or the search modules.
+"""
+
+import os
+import sys
+import json
+import pathlib
+import argparse
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def _parse_area(area):
+    # geojson file or 'lat,lon'
+    parts = area.split(',')
+    if len(parts) == 2:
+        try:
+            return {'lat': float(parts[0]), 'lon': float(parts[1])}
+        except ValueError:
+            pass
+    return area
+
+def _get_credentials(env_path):
+    # credentials from a .env file, or from the CDSE_USER and CDSE_PASSWORD environment variables
+    if pathlib.Path(env_path).is_file():
+        import CDSE.utils as CDSE_utils
+        return CDSE_utils.get_user_and_passwd(env_path)
+    return os.environ.get('CDSE_USER'), os.environ.get('CDSE_PASSWORD')
+
+def _search(args):
+    # products of all result pages (up to --max-pages)
+    import CDSE.search_and_download as CDSE_sd
+
+    response_json = CDSE_sd.search_CDSE_catalogue(
+        sensor = args.sensor,
+        area = _parse_area(args.area),
+        start_date = args.start_date,
+        end_date = args.end_date,
+        start_time = args.start_time,
+        end_time = args.end_time,
+        sensor_mode = args.sensor_mode,
+        product_type = args.product_type,
+        processing_level = args.processing_level,
+        relative_orbit = args.relative_orbit,
+        max_cloud_cover = args.max_cloud_cover,
+        max_results = args.max_results,
+        use_tile_index = args.use_tile_index,
+        loglevel = args.loglevel
+    )
+
+    if not response_json:
+        return None
+
+    product_list = []
+    for page_json in CDSE_sd.iterate_CDSE_response_pages(response_json, max_pages=args.max_pages, loglevel=args.loglevel):
+        product_list.extend(page_json['value'])
+
+    return product_list
+
+def _download(product_list, args):
+    # download products, returns the number of failed downloads
+    import CDSE.search_and_download as CDSE_sd
+
+    username, password = _get_credentials(args.env)
+    if not username or not password:
+        print(f"No CDSE credentials in '{args.env}' or in CDSE_USER/CDSE_PASSWORD", file=sys.stderr)
+        return len(product_list)
+
+    pathlib.Path(args.download_dir).mkdir(parents=True, exist_ok=True)
+
+    n_failed = 0
+    for product in product_list:
+        downloaded = CDSE_sd.download_product_from_cdse(product, args.download_dir, username, password, overwrite=args.overwrite)
+        if not downloaded:
+            n_failed += 1
+        print(f"{'ok' if downloaded else 'FAILED'}\t{product['Name']}")
+
+    return n_failed
+
+def _print_products(product_list, output):
+    # product names (one per line) or full products as json
+    if output is None:
+        for product in product_list:
+            print(product['Name'])
+    elif output == '-':
+        json.dump({'value': product_list}, sys.stdout)
+        print()
+    else:
+        with open(output, 'w') as f:
+            json.dump({'value': product_list}, f)
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def command_search(args):
+    product_list = _search(args)
+    if product_list is None:
+        return 1
+    _print_products(product_list, args.output)
+    return 0
+
+def command_lookup(args):
+    import CDSE.search_and_download as CDSE_sd
+
+    product_list = []
+    for product_name in args.product_names:
+        response_json = CDSE_sd.search_CDSE_catalogue_by_name(product_name, loglevel=args.loglevel)
+        product_list.extend(response_json['value'])
+
+    if args.output is not None:
+        _print_products(product_list, args.output)
+    else:
+        for product in product_list:
+            print(f"{product['Name']}\t{product['Id']}\t{product.get('ContentLength')}\t{product['ContentDate']['Start']}\t{'online' if product.get('Online') else 'offline'}")
+
+    return 0 if len(product_list) >= len(args.product_names) else 1
+
+def command_download(args):
+    import CDSE.search_and_download as CDSE_sd
+
+    if not args.product_names and args.from_json is None:
+        print("No products given (product names or --from-json)", file=sys.stderr)
+        return 2
+
+    product_list = []
+    n_not_found = 0
+    if args.from_json is not None:
+        with open(args.from_json) as f:
+            product_list.extend(json.load(f)['value'])
+    for product_name in args.product_names:
+        response_json = CDSE_sd.search_CDSE_catalogue_by_name(product_name, loglevel=args.loglevel)
+        if not response_json['value']:
+            print(f"NOT FOUND\t{product_name}")
+            n_not_found += 1
+        product_list.extend(response_json['value'])
+
+    n_failed = _download(product_list, args)
+
+    return 1 if n_failed or n_not_found else 0
+
+def command_sync(args):
+    import CDSE.inventory as CDSE_inventory
+
+    product_list = _search(args)
+    if product_list is None:
+        return 1
+
+    pathlib.Path(args.download_dir).mkdir(parents=True, exist_ok=True)
+    inventory = CDSE_inventory.scan_download_dir(args.download_dir)
+    missing = CDSE_inventory.filter_product_list_by_inventory(product_list, inventory)
+    print(f"{len(product_list)} products found, {len(missing)} missing in {args.download_dir}")
+
+    # corrupt or incomplete zips are downloaded again
+    args.overwrite = True
+    n_failed = _download(missing, args)
+
+    return 1 if n_failed else 0
+
+def command_watch(args):
+    import CDSE.watcher as CDSE_watcher
+
+    username, password = _get_credentials(args.env)
+    if not username or not password:
+        print(f"No CDSE credentials in '{args.env}' or in CDSE_USER/CDSE_PASSWORD, products are not downloaded", file=sys.stderr)
+        username, password = None, None
+
+    status = CDSE_watcher.run_watcher(
+        args.config,
+        state_path = args.state,
+        username = username,
+        password = password,
+        poll_interval = args.interval,
+        max_cycles = 1 if args.once else None,
+        n_download_threads = args.n_download_threads,
+        lock_policy = args.lock_policy,
+        loglevel = args.loglevel
+    )
+
+    for name, subscription_status in status.items():
+        print(f"{name}\t{subscription_status['n_matched']} matched\t{subscription_status['n_downloaded']} downloaded\t{subscription_status['n_pending']} pending\t{subscription_status['n_dropped']} dropped")
+
+    return 0
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def build_parser():
+    """
+    Argument parser of the 'cdse' command
+
+    Returns
+    -------
+    parser : argparse.ArgumentParser
+    """
+
+    parser = argparse.ArgumentParser(prog='cdse', description='Search and download data from the Copernicus Data Space Ecosystem (CDSE).')
+    parser.add_argument('--loglevel', default='WARNING', help='loglevel setting (default: WARNING)')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    def add_search_arguments(p):
+        p.add_argument('sensor', help='SENTINEL-1 or SENTINEL-2')
+        p.add_argument('area', help="geojson file with search area or 'lat,lon'")
+        p.add_argument('start_date', help='YYYY-MM-DD')
+        p.add_argument('end_date', help='YYYY-MM-DD')
+        p.add_argument('--start-time', default='00:00:00', help='hh:mm:ss')
+        p.add_argument('--end-time', default='00:00:00', help='hh:mm:ss')
+        p.add_argument('--sensor-mode', default=None, help='S1 sensor mode (EW, IW)')
+        p.add_argument('--product-type', default=None, help='product type (S1: GRD, SLC; S2: 1C, 2A)')
+        p.add_argument('--processing-level', default=None, help='processing level')
+        p.add_argument('--relative-orbit', type=int, default=None, help='S1 relative orbit number')
+        p.add_argument('--max-cloud-cover', type=float, default=100, help='S2 maximum cloud cover')
+        p.add_argument('--max-results', type=int, default=1000, help='products per result page')
+        p.add_argument('--max-pages', type=int, default=None, help='maximum number of result pages')
+        p.add_argument('--use-tile-index', action='store_true', help='S2: query the tiles of the area by name')
+
+    def add_download_arguments(p):
+        p.add_argument('-d', '--download-dir', required=True, help='download directory')
+        p.add_argument('--env', default='.env', help='.env file with CDSE_USER and CDSE_PASSWORD (default: .env, else environment)')
+        p.add_argument('--overwrite', action='store_true', help='overwrite existing files')
+
+    p = subparsers.add_parser('search', help='search the catalogue and print product names')
+    add_search_arguments(p)
+    p.add_argument('-o', '--output', default=None, help="write products as json to a file ('-' for stdout)")
+    p.set_defaults(function=command_search)
+
+    p = subparsers.add_parser('lookup', help='look up products by name')
+    p.add_argument('product_names', nargs='+', help='product names (with or without .SAFE)')
+    p.add_argument('-o', '--output', default=None, help="write products as json to a file ('-' for stdout)")
+    p.set_defaults(function=command_lookup)
+
+    p = subparsers.add_parser('download', help='download products by name or from a search result json')
+    p.add_argument('product_names', nargs='*', help='product names (with or without .SAFE)')
+    p.add_argument('--from-json', default=None, help="json file written by 'cdse search -o'")
+    add_download_arguments(p)
+    p.set_defaults(function=command_download)
+
+    p = subparsers.add_parser('sync', help='search and download all products missing in the download directory')
+    add_search_arguments(p)
+    add_download_arguments(p)
+    p.set_defaults(function=command_sync)
+
+    p = subparsers.add_parser('watch', help='poll the catalogue for new products of AOI subscriptions and download them')
+    p.add_argument('config', help='json file with subscriptions (see CDSE.watcher.load_subscriptions)')
+    p.add_argument('--state', default=None, help='json state file (default: <config>.state.json)')
+    p.add_argument('--interval', type=float, default=600, help='seconds between poll cycles (default: 600)')
+    p.add_argument('--once', action='store_true', help='run a single poll cycle')
+    p.add_argument('--n-download-threads', type=int, default=2, help='parallel downloads (default: 2)')
+    p.add_argument('--lock-policy', default=None, choices=['wait', 'skip'], help='coordinate with other workers using lock files')
+    p.add_argument('--env', default='.env', help='.env file with CDSE_USER and CDSE_PASSWORD (default: .env, else environment)')
+    p.set_defaults(function=command_watch)
+
+    return parser
+
+def main(argv=None):
+
+    args = build_parser().parse_args(argv)
+
+    return args.function(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+# ---- End of <cli.py> ----
@@ -0,0 +1,333 @@
+# ---- This is <credential_pool.py> ----
+
+"""
+Pool of several CDSE accounts for concurrent downloads.
+"""
+
+import sys
+import time
+import queue
+import threading
+import contextlib
+
+from loguru import logger
+
+import CDSE.access_token_credentials as CDSE_atc
+import CDSE.search_and_download as CDSE_sd
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+# default number of parallel downloads per account
+default_max_concurrent_per_account = 4
+
+# accounts are taken out of the pool for this many seconds after auth or quota errors
+default_cooldown_seconds = 900
+
+# http status codes that disable an account (authentication and quota errors)
+account_error_codes = [401, 403, 429]
+
+# status used for failed token requests
+TOKEN_ERROR = 'token_error'
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+class CredentialPool:
+    """
+    Several CDSE accounts, each with its own cached access token and a limit
+    of concurrent downloads.
+
+    Download slots are handed out to the least loaded active account. Accounts
+    that return authentication or quota errors (or fail to get a token) are
+    taken out of the pool for 'cooldown_seconds' and then tried again.
+    """
+
+    def __init__(
+        self,
+        credentials,
+        max_concurrent_per_account = default_max_concurrent_per_account,
+        cooldown_seconds = default_cooldown_seconds
+    ):
+
+        if not credentials:
+            raise ValueError("'credentials' must contain at least one (username, password) pair")
+
+        self.cooldown_seconds = cooldown_seconds
+        self.accounts = dict()
+        for username, password in credentials:
+            self.accounts[username] = {
+                'password': password,
+                'max_concurrent': max_concurrent_per_account,
+                'in_use': 0,
+                'disabled_until': 0,
+                'n_downloads': 0,
+                'n_errors': 0,
+            }
+
+        self._condition = threading.Condition()
+
+    @property
+    def n_slots(self):
+        """
+        Total number of download slots of all accounts
+        """
+
+        return sum(account['max_concurrent'] for account in self.accounts.values())
+
+    def _active_accounts(self, now):
+        return [username for username, account in self.accounts.items() if account['disabled_until'] <= now]
+
+    # ------------------------ #
+
+    def acquire(self, timeout=None):
+        """
+        Acquire a download slot of the least loaded active account
+
+        Parameters
+        ----------
+        timeout : maximum waiting time in seconds (default=None, no limit)
+
+        Returns
+        -------
+        credentials : (username, password) tuple (None on timeout)
+        """
+
+        t_end = None if timeout is None else time.time() + timeout
+
+        with self._condition:
+            while True:
+                now = time.time()
+                free = [
+                    username for username in self._active_accounts(now)
+                    if self.accounts[username]['in_use'] < self.accounts[username]['max_concurrent']
+                ]
+
+                if free:
+                    username = min(free, key=lambda u: self.accounts[u]['in_use'])
+                    self.accounts[username]['in_use'] += 1
+                    return username, self.accounts[username]['password']
+
+                # wait for a released slot or the end of the next cooldown
+                wait_seconds = None
+                if not self._active_accounts(now):
+                    wait_seconds = min(account['disabled_until'] for account in self.accounts.values()) - now
+                    logger.debug(f"All accounts are disabled, waiting {wait_seconds:.0f} seconds")
+                if t_end is not None:
+                    if now >= t_end:
+                        return None
+                    wait_seconds = t_end - now if wait_seconds is None else min(wait_seconds, t_end - now)
+
+                self._condition.wait(wait_seconds)
+
+    def release(self, username, status=None):
+        """
+        Release download slot of an account
+
+        Parameters
+        ----------
+        username : CDSE username of the slot
+        status : http status code of a failed request, 'token_error' or other error string (default=None, no error)
+                 auth and quota errors take the account out of the pool for the cooldown period
+        """
+
+        with self._condition:
+            account = self.accounts[username]
+            account['in_use'] -= 1
+            if status is None:
+                account['n_downloads'] += 1
+            elif status in account_error_codes or status == TOKEN_ERROR:
+                account['n_errors'] += 1
+                self._disable(username, status)
+            self._condition.notify_all()
+
+    def _disable(self, username, reason):
+        self.accounts[username]['disabled_until'] = time.time() + self.cooldown_seconds
+        CDSE_atc.invalidate_cached_access_token(username)
+        logger.warning(f"Disabled account {username} for {self.cooldown_seconds} seconds ({reason})")
+
+    def disable(self, username, reason=''):
+        """
+        Take account out of the pool for the cooldown period
+        """
+
+        with self._condition:
+            self._disable(username, reason)
+            self._condition.notify_all()
+
+    @contextlib.contextmanager
+    def slot(self, timeout=None):
+        """
+        Context manager for a download slot, yields (username, password).
+        The slot is released without error status, use acquire/release to report errors.
+        """
+
+        credentials = self.acquire(timeout)
+        if credentials is None:
+            raise TimeoutError("No download slot available")
+        try:
+            yield credentials
+        finally:
+            self.release(credentials[0])
+
+    # ------------------------ #
+
+    def get_token(self, username):
+        """
+        Get (cached) access token of an account. If the token request is rejected,
+        the slot should be released with status 'token_error' (disables the account).
+
+        Returns
+        -------
+        access_token : CDSE access token (None if the token request was rejected)
+        """
+
+        try:
+            return CDSE_atc.get_cached_access_token(username, self.accounts[username]['password'])
+        except CDSE_atc.TokenRequestError as e:
+            logger.error(f"Token request for {username} failed: {e}")
+            return None
+
+    def get_status(self):
+        """
+        Status of all accounts
+
+        Returns
+        -------
+        status : dict with username as key and dict with active, in_use, n_downloads and n_errors as value
+        """
+
+        now = time.time()
+        with self._condition:
+            return {
+                username: {
+                    'active': account['disabled_until'] <= now,
+                    'in_use': account['in_use'],
+                    'n_downloads': account['n_downloads'],
+                    'n_errors': account['n_errors'],
+                }
+                for username, account in self.accounts.items()
+            }
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def download_product_list_with_pool(
+    product_list,
+    download_dir,
+    pool,
+    n_workers = None,
+    overwrite = False,
+    chunk_size = None,
+    lock_policy = None,
+    cache = None,
+    event_callback = None,
+    loglevel = 'INFO'
+):
+    """
+    Download products in parallel, using the accounts of a credential pool.
+    Downloads that fail with an auth or quota error are retried with another account.
+
+    Parameters
+    ----------
+    product_list : list of product dictionaries or CDSE.product.Product objects
+    download_dir : download directory
+    pool : CredentialPool
+    n_workers : number of parallel download threads (default=None, all slots of the pool)
+    overwrite : overwrite existing files (default=False)
+    chunk_size : download buffer size in bytes (default=None, auto-tuned)
+    lock_policy : coordinate with other workers using lock files (None, 'wait', 'skip') (default=None)
+    cache : shared CDSE.product_cache.ProductCache to fetch products through (default=None)
+    event_callback : function called with a dict for download events, e.g. CDSE.telemetry.DownloadTelemetry (default=None)
+    loglevel : loglevel setting (default='INFO')
+
+    Returns
+    -------
+    results : dict with product name as key and True/False for succesful download as value
+    """
+
+    # remove default logger handler and add personal one
+    logger.remove()
+    logger.add(sys.stderr, level=loglevel)
+
+    n_workers = n_workers or pool.n_slots
+    max_attempts = len(pool.accounts)
+
+    product_queue = queue.Queue()
+    for product in product_list:
+        product_queue.put(product)
+
+    results = dict()
+    results_lock = threading.Lock()
+
+    # ------------------------ #
+
+    def work():
+        while True:
+            try:
+                product = product_queue.get_nowait()
+            except queue.Empty:
+                return
+
+            downloaded = False
+            for attempt in range(max_attempts):
+                username, password = pool.acquire()
+                errors = []
+                def on_event(event, attempt=attempt):
+                    # earlier attempts with other accounts
+                    event['retries'] = max(event.get('retries', 0), attempt)
+                    if event['event'] == 'http_error':
+                        errors.append(event.get('status'))
+                    if event_callback is not None:
+                        event_callback(event)
+                downloaded = False
+                try:
+                    # token of the account before the download (renewed while still valid)
+                    if pool.get_token(username) is None:
+                        status = TOKEN_ERROR
+                    else:
+                        downloaded = CDSE_sd.download_product_from_cdse(
+                            product,
+                            download_dir,
+                            username,
+                            password,
+                            overwrite = overwrite,
+                            chunk_size = chunk_size,
+                            lock_policy = lock_policy,
+                            cache = cache,
+                            event_callback = on_event
+                        )
+                        status = None if downloaded else (errors[-1] if errors else 'download_error')
+                except CDSE_atc.TokenRequestError as e:
+                    logger.error(f"Token request for {username} failed: {e}")
+                    status = TOKEN_ERROR
+                except Exception as e:
+                    # e.g. disk or network errors, the account stays active
+                    logger.error(f"Download of {product['Name']} with account {username} failed: {e}")
+                    status = 'download_error'
+                pool.release(username, status)
+
+                if downloaded or not (status in account_error_codes or status == TOKEN_ERROR):
+                    break
+                logger.info(f"Retrying {product['Name']} with another account")
+
+            with results_lock:
+                results[product['Name']] = bool(downloaded)
+
+    # ------------------------ #
+
+    workers = [threading.Thread(target=work, daemon=True) for i in range(min(n_workers, len(product_list)))]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    n_downloaded = sum(results.values())
+    logger.info(f"Downloaded {n_downloaded} of {len(results)} products, accounts: {pool.get_status()}")
+
+    return results
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+# ---- End of <credential_pool.py> ----
@@ -0,0 +1,235 @@
+# ---- This is <disk_space.py> ----
+
+"""
+Disk-space-aware admission of downloads and placement across several download directories.
+"""
+
+import time
+import shutil
+import pathlib
+import threading
+
+from loguru import logger
+
+import CDSE.sinks as CDSE_sinks
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+# placement policies for several download directories
+valid_placement_policies = ['free_space', 'throughput', 'first']
+
+# default space that is kept free on every volume
+default_min_free_bytes = 1024 * 1024 * 1024
+
+# weight of the newest measurement in the moving average of write throughput
+throughput_smoothing = 0.3
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+class Reservation:
+    """
+    Space reserved for one in-flight product download, on the volume of
+    reserve_dir (the download directory, or e.g. the directory of a product
+    cache that receives the data and links it into the download directory)
+    """
+
+    def __init__(self, download_dir, product_name, size, reserve_dir=None):
+        self.download_dir = download_dir
+        self.reserve_dir = download_dir if reserve_dir is None else reserve_dir
+        self.product_name = product_name
+        self.size = size
+        self.zip_path = download_dir / f"{product_name.split('.SAFE')[0]}.zip"
+        self.part_path = self.zip_path.with_name(f"{self.zip_path.name}{CDSE_sinks.part_suffix}")
+        self.t_start = time.monotonic()
+
+    def pending_bytes(self):
+        """
+        Reserved bytes not yet allocated on disk (preallocated or written blocks already reduce the free space),
+        data written outside the download directory (reserve_dir) is not tracked, its size stays reserved
+        """
+
+        if self.reserve_dir != self.download_dir:
+            return self.size
+
+        try:
+            allocated = self.part_path.stat().st_blocks * 512
+        except FileNotFoundError:
+            allocated = 0
+
+        return max(self.size - allocated, 0)
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+class DiskSpaceManager:
+    """
+    Admits downloads only if their ContentLength fits into the free space of
+    a download directory, minus the space reserved for in-flight transfers
+    and 'min_free_bytes'. With several download directories, each product
+    is placed into one of them:
+
+      'free_space' : directory with the most available space
+      'throughput' : directory with the best measured write throughput (per active transfer)
+      'first'      : first directory (in the given order) with enough space
+    """
+
+    def __init__(self, download_dirs, min_free_bytes=default_min_free_bytes, placement='free_space'):
+
+        if placement not in valid_placement_policies:
+            raise ValueError(f"'placement' must be one of {valid_placement_policies}")
+
+        if isinstance(download_dirs, (str, pathlib.Path)):
+            download_dirs = [download_dirs]
+
+        self.download_dirs = [pathlib.Path(d) for d in download_dirs]
+        for download_dir in self.download_dirs:
+            if not download_dir.is_dir():
+                raise FileNotFoundError(f"Could not find download directory {download_dir}")
+
+        self.min_free_bytes = min_free_bytes
+        self.placement = placement
+
+        self._lock = threading.Lock()
+        self._reservations = []
+        # download directory -> measured write throughput in bytes/s
+        self._throughput = dict()
+
+    # ------------------------ #
+
+    def _available_bytes(self, download_dir):
+        # caller holds the lock
+        device = download_dir.stat().st_dev
+        reserved = sum(
+            r.pending_bytes() for r in self._reservations
+            if r.reserve_dir.stat().st_dev == device
+        )
+        return shutil.disk_usage(download_dir).free - reserved - self.min_free_bytes
+
+    def get_available_bytes(self, download_dir):
+        """
+        Free space of download_dir minus pending reservations on the same volume and min_free_bytes
+        """
+
+        with self._lock:
+            return self._available_bytes(pathlib.Path(download_dir))
+
+    def find_existing(self, product):
+        """
+        Directory that already contains the product (zip or .SAFE), None if not downloaded
+        """
+
+        stem = product['Name'].split('.SAFE')[0]
+        for download_dir in self.download_dirs:
+            if (download_dir / f"{stem}.zip").is_file() or (download_dir / f"{stem}.SAFE").is_dir():
+                return download_dir
+
+        return None
+
+    # ------------------------ #
+
+    def admit(self, product, overwrite=False, reserve_dir=None):
+        """
+        Reserve space for a product download
+
+        Parameters
+        ----------
+        product : product dictionary or CDSE.product.Product (with 'ContentLength')
+        overwrite : place product even if it exists in one of the directories (default=False)
+        reserve_dir : directory that receives the data, if not the download directory
+                      (e.g. ProductCache.cache_dir), the space is checked and reserved on its volume (default=None)
+
+        Returns
+        -------
+        reservation : Reservation with the chosen download_dir (None if no directory has enough space)
+                      products that already exist get a reservation of size 0 in their directory
+        """
+
+        if not overwrite:
+            existing_dir = self.find_existing(product)
+            if existing_dir is not None:
+                return Reservation(existing_dir, product['Name'], 0)
+
+        size = product.get('ContentLength') or 0
+
+        if reserve_dir is not None:
+            reserve_dir = pathlib.Path(reserve_dir)
+
+        with self._lock:
+            reserve_available = None if reserve_dir is None else self._available_bytes(reserve_dir)
+            candidates = []
+            for download_dir in self.download_dirs:
+                available = self._available_bytes(download_dir)
+                if (available if reserve_available is None else reserve_available) >= size:
+                    n_active = sum(1 for r in self._reservations if r.download_dir == download_dir)
+                    candidates.append((download_dir, available, n_active))
+
+            if not candidates:
+                logger.error(f"Not enough free space for {product['Name']} ({size} bytes) in {[str(d) for d in self.download_dirs] if reserve_dir is None else str(reserve_dir)}")
+                return None
+
+            if self.placement == 'free_space':
+                download_dir = max(candidates, key=lambda c: c[1])[0]
+            elif self.placement == 'throughput':
+                # unmeasured directories first, then best throughput per active transfer
+                download_dir = max(
+                    candidates,
+                    key=lambda c: float('inf') if c[0] not in self._throughput else self._throughput[c[0]] / (c[2] + 1)
+                )[0]
+            else:
+                download_dir = candidates[0][0]
+
+            reservation = Reservation(download_dir, product['Name'], size, reserve_dir)
+            self._reservations.append(reservation)
+
+        logger.debug(f"Reserved {size} bytes in {reservation.reserve_dir} for {product['Name']}")
+
+        return reservation
+
+    def release(self, reservation):
+        """
+        Release reservation after the download (and record the write throughput of its directory)
+        """
+
+        with self._lock:
+            if reservation in self._reservations:
+                self._reservations.remove(reservation)
+            else:
+                return
+
+            elapsed = time.monotonic() - reservation.t_start
+            if reservation.size and elapsed > 0 and reservation.zip_path.is_file():
+                throughput = reservation.zip_path.stat().st_size / elapsed
+                previous = self._throughput.get(reservation.download_dir)
+                if previous is None:
+                    self._throughput[reservation.download_dir] = throughput
+                else:
+                    self._throughput[reservation.download_dir] = (1 - throughput_smoothing) * previous + throughput_smoothing * throughput
+
+    def get_status(self):
+        """
+        Available space, active reservations and measured throughput per download directory
+
+        Returns
+        -------
+        status : dict with download directory as key
+        """
+
+        status = dict()
+        for download_dir in self.download_dirs:
+            with self._lock:
+                n_active = sum(1 for r in self._reservations if r.download_dir == download_dir)
+                throughput = self._throughput.get(download_dir)
+            status[str(download_dir)] = {
+                'available_bytes': self.get_available_bytes(download_dir),
+                'active': n_active,
+                'MB_per_s': None if throughput is None else throughput / 1e6,
+            }
+
+        return status
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+# ---- End of <disk_space.py> ----
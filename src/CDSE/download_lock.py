@@ -0,0 +1,309 @@
+# ---- This is <download_lock.py> ----
+
+"""
+Per-product lock files for coordinating downloads across processes and hosts
+(e.g. several workers sharing one download directory on NFS).
+"""
+
+import os
+import json
+import time
+import uuid
+import socket
+import pathlib
+import threading
+
+from loguru import logger
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+# locks without heartbeat for this many seconds are considered stale
+default_stale_seconds = 300
+
+# interval of lock heartbeats (lock file mtime updates)
+default_heartbeat_seconds = 30
+
+# interval for polling a lock held by another worker
+default_poll_seconds = 5
+
+lock_suffix = '.lock'
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+class ProductDownloadLock:
+    """
+    Lock file next to the product zip in the download directory.
+
+    The lock is created atomically (O_CREAT | O_EXCL) and holds the owner
+    (host, pid, unique token). While held, a heartbeat thread updates the
+    lock file mtime, as long as the file still holds the owner's token.
+    A lock whose mtime is older than 'stale_seconds' is considered abandoned
+    and can be taken over by another worker: the first worker that creates
+    the takeover claim for the stale owner token removes the lock. Claims of
+    workers that died during a takeover become stale after 'stale_seconds' too.
+    """
+
+    def __init__(
+        self,
+        download_dir,
+        product_name,
+        stale_seconds = default_stale_seconds,
+        heartbeat_seconds = default_heartbeat_seconds
+    ):
+        self.lock_path = pathlib.Path(download_dir) / f"{product_name.split('.SAFE')[0]}.zip{lock_suffix}"
+        self.stale_seconds = stale_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self.owner = {
+            'host': socket.gethostname(),
+            'pid': os.getpid(),
+            'token': uuid.uuid4().hex,
+        }
+        self.acquired = False
+        self._stop_heartbeat = None
+        self._heartbeat_thread = None
+
+    # ------------------------ #
+
+    def read_owner(self):
+        """
+        Read owner information of the current lock file
+
+        Returns
+        -------
+        owner : dict with host, pid, token and created (None if not locked)
+        """
+
+        try:
+            return json.loads(self.lock_path.read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def is_stale(self):
+        """
+        Check if the existing lock file has not seen a heartbeat for 'stale_seconds'
+        """
+
+        try:
+            age = time.time() - self.lock_path.stat().st_mtime
+        except FileNotFoundError:
+            return False
+
+        return age > self.stale_seconds
+
+    def _read_lock_file(self):
+        # owner and stat of the same lock file (inode), (None, None) if not locked
+        try:
+            fd = os.open(self.lock_path, os.O_RDONLY)
+        except FileNotFoundError:
+            return None, None
+        with os.fdopen(fd) as f:
+            stat = os.fstat(fd)
+            try:
+                return json.loads(f.read()), stat
+            except json.JSONDecodeError:
+                # lock file is being written
+                return {}, stat
+
+    def _break_stale_lock(self):
+        # only the worker that creates the claim file for the stale owner token removes the lock,
+        # and only if the lock file still holds that token and is still stale
+        owner, stat = self._read_lock_file()
+        if owner is None or time.time() - stat.st_mtime <= self.stale_seconds:
+            return
+        stale_token = owner.get('token', 'unknown')
+
+        claim_path = self.lock_path.with_name(f"{self.lock_path.name}.takeover.{stale_token}")
+        try:
+            os.close(os.open(claim_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644))
+        except FileExistsError:
+            # another worker takes over this lock, or died during its takeover
+            if not self._remove_stale_claim(claim_path):
+                return
+            try:
+                os.close(os.open(claim_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644))
+            except FileExistsError:
+                return
+
+        try:
+            current_owner, current_stat = self._read_lock_file()
+            if (
+                current_owner is not None
+                and current_owner.get('token', 'unknown') == stale_token
+                and current_stat.st_ino == stat.st_ino
+                and time.time() - current_stat.st_mtime > self.stale_seconds
+            ):
+                self.lock_path.unlink(missing_ok=True)
+                logger.warning(f"Took over stale lock {self.lock_path} from {owner}")
+        finally:
+            claim_path.unlink(missing_ok=True)
+
+    def _remove_stale_claim(self, claim_path):
+        # remove a takeover claim older than 'stale_seconds', returns True if the claim is gone
+        try:
+            age = time.time() - claim_path.stat().st_mtime
+        except FileNotFoundError:
+            return True
+        if age <= self.stale_seconds:
+            return False
+
+        # rename first, so only one of several workers removes the abandoned claim
+        orphan_path = claim_path.with_name(f"{claim_path.name}.{self.owner['token']}")
+        try:
+            os.rename(claim_path, orphan_path)
+        except FileNotFoundError:
+            return False
+
+        if time.time() - orphan_path.stat().st_mtime <= self.stale_seconds:
+            # a new claim was created in the meantime: put it back
+            try:
+                os.link(orphan_path, claim_path)
+            except FileExistsError:
+                pass
+            orphan_path.unlink(missing_ok=True)
+            return False
+
+        orphan_path.unlink(missing_ok=True)
+        logger.warning(f"Removed abandoned takeover claim {claim_path}")
+
+        return True
+
+    @staticmethod
+    def read_owner_of(path):
+        try:
+            return json.loads(pathlib.Path(path).read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    # ------------------------ #
+
+    def try_acquire(self):
+        """
+        Try to acquire the lock once (taking over a stale lock)
+
+        Returns
+        -------
+        acquired : True/False
+        """
+
+        if self.is_stale():
+            self._break_stale_lock()
+
+        try:
+            fd = os.open(self.lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            return False
+
+        with os.fdopen(fd, 'w') as f:
+            json.dump({**self.owner, 'created': time.time()}, f)
+
+        self.acquired = True
+        self._start_heartbeat()
+        logger.debug(f"Acquired lock {self.lock_path}")
+
+        return True
+
+    def acquire(self, wait=True, timeout=None, poll_seconds=default_poll_seconds):
+        """
+        Acquire the lock
+
+        Parameters
+        ----------
+        wait : wait for a lock held by another worker (default=True)
+        timeout : maximum waiting time in seconds (default=None, no limit)
+        poll_seconds : interval for checking the lock (default=5)
+
+        Returns
+        -------
+        acquired : True/False
+        """
+
+        t_start = time.time()
+
+        while not self.try_acquire():
+            if not wait:
+                return False
+            if timeout is not None and time.time() - t_start > timeout:
+                logger.warning(f"Timeout waiting for lock {self.lock_path}")
+                return False
+            logger.debug(f"Waiting for lock {self.lock_path} held by {self.read_owner()}")
+            time.sleep(poll_seconds)
+
+        return True
+
+    def wait_for_release(self, timeout=None, poll_seconds=default_poll_seconds):
+        """
+        Wait until the lock is released or stale (without acquiring it)
+
+        Returns
+        -------
+        released : True/False (False on timeout)
+        """
+
+        t_start = time.time()
+
+        while self.lock_path.exists() and not self.is_stale():
+            if timeout is not None and time.time() - t_start > timeout:
+                return False
+            time.sleep(poll_seconds)
+
+        return True
+
+    def release(self):
+        """
+        Release the lock (only if it is still owned by this instance)
+        """
+
+        if not self.acquired:
+            return
+
+        self._stop_heartbeat.set()
+        self._heartbeat_thread.join()
+
+        owner = self.read_owner()
+        if owner is not None and owner.get('token') == self.owner['token']:
+            self.lock_path.unlink(missing_ok=True)
+            logger.debug(f"Released lock {self.lock_path}")
+        else:
+            logger.warning(f"Lock {self.lock_path} was taken over by {owner}")
+
+        self.acquired = False
+
+    # ------------------------ #
+
+    def _start_heartbeat(self):
+        self._stop_heartbeat = threading.Event()
+
+        def heartbeat():
+            while not self._stop_heartbeat.wait(self.heartbeat_seconds):
+                # refresh only our own lock file: the checked file is refreshed through its descriptor
+                try:
+                    fd = os.open(self.lock_path, os.O_RDONLY)
+                except FileNotFoundError:
+                    logger.warning(f"Lock {self.lock_path} disappeared")
+                    return
+                with os.fdopen(fd) as f:
+                    try:
+                        owner = json.loads(f.read())
+                    except json.JSONDecodeError:
+                        owner = None
+                    if owner is None or owner.get('token') != self.owner['token']:
+                        logger.warning(f"Lock {self.lock_path} was taken over by {owner}")
+                        return
+                    os.utime(fd if os.utime in os.supports_fd else self.lock_path)
+
+        self._heartbeat_thread = threading.Thread(target=heartbeat, daemon=True)
+        self._heartbeat_thread.start()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+# ---- End of <download_lock.py> ----
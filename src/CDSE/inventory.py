@@ -0,0 +1,186 @@
+# ---- This is <inventory.py> ----
+
+"""
+Inventory and integrity scan of a download directory.
+"""
+
+import os
+import struct
+import pathlib
+from concurrent.futures import ThreadPoolExecutor
+
+from loguru import logger
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+# product states in the inventory
+COMPLETE = 'complete'
+PARTIAL = 'partial'
+EXTRACTED = 'extracted'
+CORRUPT = 'corrupt'
+
+# suffixes written by CDSE.search_and_download and CDSE.download_lock
+part_suffix = '.part'
+lock_suffix = '.lock'
+
+# zip end of central directory records
+eocd_signature = b'PK\x05\x06'
+eocd_size = 22
+eocd_max_comment = 65535
+zip64_locator_signature = b'PK\x06\x07'
+zip64_locator_size = 20
+
+# default number of threads for zip checks
+default_n_threads = 8
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def check_zip_end_record(zip_path, file_size=None):
+    """
+    Check that a zip file ends with a consistent end of central directory record.
+    Truncated downloads miss this record, so this detects incomplete zips
+    without reading the full file.
+
+    Parameters
+    ----------
+    zip_path : path to zip file
+    file_size : file size in bytes (default=None, read from file system)
+
+    Returns
+    -------
+    valid : True/False
+    """
+
+    try:
+        with open(zip_path, 'rb') as f:
+            if file_size is None:
+                file_size = os.fstat(f.fileno()).st_size
+            if file_size < eocd_size:
+                return False
+
+            tail_size = min(file_size, eocd_size + eocd_max_comment)
+            f.seek(file_size - tail_size)
+            tail = f.read(tail_size)
+    except OSError as e:
+        logger.warning(f"Could not read {zip_path}: {e}")
+        return False
+
+    eocd_position = tail.rfind(eocd_signature)
+    if eocd_position < 0:
+        return False
+
+    cd_size, cd_offset, comment_length = struct.unpack('<IIH', tail[eocd_position+12:eocd_position+22])
+
+    # the record must be followed by exactly its comment
+    if eocd_position + eocd_size + comment_length != tail_size:
+        return False
+
+    # zip64 archives keep sizes and offsets in a separate record
+    if cd_offset == 0xFFFFFFFF or cd_size == 0xFFFFFFFF:
+        locator_position = eocd_position - zip64_locator_size
+        return locator_position >= 0 and tail[locator_position:locator_position+4] == zip64_locator_signature
+
+    return cd_offset + cd_size == file_size - tail_size + eocd_position
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def scan_download_dir(download_dir, check_zips=True, n_threads=default_n_threads):
+    """
+    Scan download directory once and build an inventory of all products.
+
+    Parameters
+    ----------
+    download_dir : download directory
+    check_zips : check zip end of central directory records (default=True)
+    n_threads : number of threads for zip checks (default=8)
+
+    Returns
+    -------
+    inventory : dict with product name (without .SAFE) as key and dict with 'state' and 'size' as value
+                states are 'complete', 'partial', 'extracted' and 'corrupt'
+    """
+
+    inventory = dict()
+
+    download_dir = pathlib.Path(download_dir)
+    if not download_dir.is_dir():
+        logger.error(f"Could not find download directory {download_dir}")
+        return inventory
+
+    zip_entries = []
+
+    with os.scandir(download_dir) as it:
+        for entry in it:
+            name = entry.name
+            if name.endswith('.SAFE') and entry.is_dir():
+                inventory[name[:-5]] = {'state': EXTRACTED, 'size': None}
+            elif name.endswith('.zip' + part_suffix):
+                stem = name[:-len('.zip' + part_suffix)]
+                # a complete zip or .SAFE wins over a leftover partial file
+                inventory.setdefault(stem, {'state': PARTIAL, 'size': entry.stat().st_size})
+            elif name.endswith('.zip') and entry.is_file():
+                zip_entries.append((name[:-4], entry.path, entry.stat().st_size))
+
+    if check_zips:
+        with ThreadPoolExecutor(max_workers=n_threads) as executor:
+            valid_list = list(executor.map(lambda e: check_zip_end_record(e[1], e[2]), zip_entries))
+    else:
+        valid_list = [True] * len(zip_entries)
+
+    for (stem, path, size), valid in zip(zip_entries, valid_list):
+        if inventory.get(stem, {}).get('state') == EXTRACTED:
+            continue
+        inventory[stem] = {'state': COMPLETE if valid else CORRUPT, 'size': size}
+
+    n_states = {}
+    for entry in inventory.values():
+        n_states[entry['state']] = n_states.get(entry['state'], 0) + 1
+    logger.info(f"Inventory of {download_dir}: {n_states}")
+
+    return inventory
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def filter_product_list_by_inventory(product_list, inventory, check_size=True):
+    """
+    Remove products that are complete or extracted in the inventory
+
+    Parameters
+    ----------
+    product_list : list of product dictionaries or CDSE.product.Product objects
+    inventory : inventory from scan_download_dir
+    check_size : treat complete zips with size different from 'ContentLength' as corrupt (default=True)
+
+    Returns
+    -------
+    missing_products : list of products that still need to be downloaded
+    """
+
+    missing_products = []
+
+    for product in product_list:
+        entry = inventory.get(product['Name'].split('.SAFE')[0])
+
+        if entry is not None and entry['state'] == EXTRACTED:
+            continue
+
+        if entry is not None and entry['state'] == COMPLETE:
+            content_length = product.get('ContentLength')
+            if not check_size or not content_length or entry['size'] == content_length:
+                continue
+            logger.warning(f"Size of {product['Name']} ({entry['size']}) does not match ContentLength ({content_length})")
+
+        missing_products.append(product)
+
+    logger.info(f"{len(missing_products)} of {len(product_list)} products are missing in the inventory")
+
+    return missing_products
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+# ---- End of <inventory.py> ----
@@ -0,0 +1,464 @@
+# ---- This is <job_queue.py> ----
+
+"""
+Durable (SQLite-backed) download job queue with worker leases.
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import sqlite3
+import pathlib
+import threading
+
+from loguru import logger
+
+import CDSE.product as CDSE_product
+import CDSE.download_lock as CDSE_lock
+import CDSE.search_and_download as CDSE_sd
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+# job states
+PENDING = 'pending'
+IN_PROGRESS = 'in_progress'
+DONE = 'done'
+FAILED = 'failed'
+
+# default lease duration in seconds (renewed by worker heartbeats)
+default_lease_seconds = 600
+
+# default number of attempts before a job is marked as failed
+default_max_attempts = 3
+
+_schema = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    product TEXT NOT NULL,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_expires REAL,
+    last_error TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, lease_expires);
+"""
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def get_worker_id():
+    """
+    Default worker id (host name and process id)
+    """
+
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+class DownloadJobQueue:
+    """
+    Persistent queue of product download jobs in a SQLite database.
+
+    Every job is in one of the states 'pending', 'in_progress', 'done' or
+    'failed'. Workers acquire a job with a lease, which has to be renewed
+    with heartbeats. Jobs with an expired lease (e.g. after a worker crash)
+    are handed out again, so a restart continues where it stopped. A job
+    whose lease expires in its last attempt (e.g. a product that crashes its
+    worker) is marked as failed instead. Several worker processes can use
+    the same database file at the same time.
+    """
+
+    def __init__(self, db_path, lease_seconds=default_lease_seconds, max_attempts=default_max_attempts):
+
+        self.db_path = pathlib.Path(db_path).resolve()
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+        with self._connect() as con:
+            con.execute("PRAGMA journal_mode=WAL")
+            con.executescript(_schema)
+
+    def _connect(self):
+        # one short-lived connection per operation, so the queue can be used from several threads
+        con = sqlite3.connect(self.db_path, timeout=60, isolation_level=None)
+        con.row_factory = sqlite3.Row
+        return _Connection(con)
+
+    # ------------------------ #
+
+    def enqueue(self, product_list):
+        """
+        Add products to the queue (products already in the queue are ignored)
+
+        Parameters
+        ----------
+        product_list : list of product dictionaries or CDSE.product.Product objects
+
+        Returns
+        -------
+        n_added : number of new jobs
+        """
+
+        now = time.time()
+        rows = []
+        for product in product_list:
+            if isinstance(product, CDSE_product.Product):
+                product = product.to_dict()
+            rows.append((product['Id'], product['Name'], json.dumps(product), PENDING, now, now))
+
+        with self._connect() as con:
+            con.execute("BEGIN IMMEDIATE")
+            n_before = con.execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+            con.executemany(
+                "INSERT OR IGNORE INTO jobs (id, name, product, state, created, updated) VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            n_added = con.execute("SELECT COUNT(*) FROM jobs").fetchone()[0] - n_before
+            con.execute("COMMIT")
+
+        logger.info(f"Added {n_added} of {len(rows)} products to download queue")
+
+        return n_added
+
+    def acquire(self, worker_id=None, exclude_ids=()):
+        """
+        Acquire next pending job (or job with expired lease)
+
+        Jobs whose lease expired in their last allowed attempt are marked as failed.
+
+        Parameters
+        ----------
+        worker_id : id of the acquiring worker (default=None, host name and pid)
+        exclude_ids : product Ids not to acquire, e.g. jobs released by this worker (default=())
+
+        Returns
+        -------
+        product : product dictionary (None if no job is available)
+        """
+
+        worker_id = worker_id or get_worker_id()
+        exclude_ids = list(exclude_ids)
+        now = time.time()
+
+        exclude_clause = f"AND id NOT IN ({', '.join('?' * len(exclude_ids))}) " if exclude_ids else ""
+
+        with self._connect() as con:
+            con.execute("BEGIN IMMEDIATE")
+
+            # workers died during the last allowed attempt (e.g. a product that crashes the worker)
+            cursor = con.execute(
+                "UPDATE jobs SET state = ?, lease_owner = NULL, lease_expires = NULL, last_error = ?, updated = ? "
+                "WHERE state = ? AND lease_expires < ? AND attempts >= ?",
+                (FAILED, 'lease expired in last attempt', now, IN_PROGRESS, now, self.max_attempts)
+            )
+            if cursor.rowcount > 0:
+                logger.error(f"Marked {cursor.rowcount} jobs with expired lease in their last attempt as failed")
+
+            row = con.execute(
+                "SELECT id, product, state FROM jobs "
+                "WHERE (state = ? OR (state = ? AND lease_expires < ?)) "
+                + exclude_clause +
+                "ORDER BY created, rowid LIMIT 1",
+                (PENDING, IN_PROGRESS, now, *exclude_ids)
+            ).fetchone()
+
+            if row is None:
+                con.execute("COMMIT")
+                return None
+
+            if row['state'] == IN_PROGRESS:
+                logger.warning(f"Taking over job with expired lease: {row['id']}")
+
+            con.execute(
+                "UPDATE jobs SET state = ?, attempts = attempts + 1, lease_owner = ?, lease_expires = ?, updated = ? WHERE id = ?",
+                (IN_PROGRESS, worker_id, now + self.lease_seconds, now, row['id'])
+            )
+            con.execute("COMMIT")
+
+        return json.loads(row['product'])
+
+    def heartbeat(self, product_id, worker_id=None):
+        """
+        Renew lease of an acquired job
+
+        Returns
+        -------
+        renewed : True/False (False if the lease was lost to another worker)
+        """
+
+        worker_id = worker_id or get_worker_id()
+        now = time.time()
+
+        with self._connect() as con:
+            cursor = con.execute(
+                "UPDATE jobs SET lease_expires = ?, updated = ? WHERE id = ? AND state = ? AND lease_owner = ?",
+                (now + self.lease_seconds, now, product_id, IN_PROGRESS, worker_id)
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, product_id, worker_id=None):
+        """
+        Mark acquired job as done
+
+        Returns
+        -------
+        completed : True/False (False if the lease was lost to another worker)
+        """
+
+        worker_id = worker_id or get_worker_id()
+
+        with self._connect() as con:
+            cursor = con.execute(
+                "UPDATE jobs SET state = ?, lease_owner = NULL, lease_expires = NULL, last_error = NULL, updated = ? "
+                "WHERE id = ? AND state = ? AND lease_owner = ?",
+                (DONE, time.time(), product_id, IN_PROGRESS, worker_id)
+            )
+            return cursor.rowcount == 1
+
+    def fail(self, product_id, error='', worker_id=None):
+        """
+        Release failed job: back to 'pending' for another attempt, or 'failed' after max_attempts
+
+        Returns
+        -------
+        state : new job state (None if the job is unknown or the lease was lost to another worker)
+        """
+
+        worker_id = worker_id or get_worker_id()
+
+        with self._connect() as con:
+            con.execute("BEGIN IMMEDIATE")
+            row = con.execute(
+                "SELECT attempts FROM jobs WHERE id = ? AND state = ? AND lease_owner = ?",
+                (product_id, IN_PROGRESS, worker_id)
+            ).fetchone()
+            if row is None:
+                con.execute("COMMIT")
+                return None
+            state = FAILED if row['attempts'] >= self.max_attempts else PENDING
+            con.execute(
+                "UPDATE jobs SET state = ?, lease_owner = NULL, lease_expires = NULL, last_error = ?, updated = ? WHERE id = ?",
+                (state, str(error), time.time(), product_id)
+            )
+            con.execute("COMMIT")
+
+        return state
+
+    def release(self, product_id, worker_id=None):
+        """
+        Release acquired job back to 'pending' without using an attempt
+        (e.g. the product is being downloaded by a worker of another queue)
+
+        Returns
+        -------
+        released : True/False (False if the lease was lost to another worker)
+        """
+
+        worker_id = worker_id or get_worker_id()
+
+        with self._connect() as con:
+            cursor = con.execute(
+                "UPDATE jobs SET state = ?, attempts = MAX(attempts - 1, 0), lease_owner = NULL, lease_expires = NULL, updated = ? "
+                "WHERE id = ? AND state = ? AND lease_owner = ?",
+                (PENDING, time.time(), product_id, IN_PROGRESS, worker_id)
+            )
+            return cursor.rowcount == 1
+
+    def reset_failed(self):
+        """
+        Move all failed jobs back to 'pending' with reset attempt count
+
+        Returns
+        -------
+        n_reset : number of reset jobs
+        """
+
+        with self._connect() as con:
+            cursor = con.execute(
+                "UPDATE jobs SET state = ?, attempts = 0, updated = ? WHERE state = ?",
+                (PENDING, time.time(), FAILED)
+            )
+            return cursor.rowcount
+
+    # ------------------------ #
+
+    def counts(self):
+        """
+        Number of jobs per state
+
+        Returns
+        -------
+        counts : dict with state as key
+        """
+
+        counts = {PENDING: 0, IN_PROGRESS: 0, DONE: 0, FAILED: 0}
+
+        with self._connect() as con:
+            for row in con.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state"):
+                counts[row[0]] = row[1]
+
+        return counts
+
+    def get_jobs(self, state=None):
+        """
+        List jobs (optionally in a given state)
+
+        Returns
+        -------
+        jobs : list of dicts with keys id, name, state, attempts, lease_owner, last_error
+        """
+
+        query = "SELECT id, name, state, attempts, lease_owner, last_error FROM jobs"
+        parameters = ()
+        if state is not None:
+            query += " WHERE state = ?"
+            parameters = (state,)
+
+        with self._connect() as con:
+            return [dict(row) for row in con.execute(query + " ORDER BY created, rowid", parameters)]
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+class _Connection:
+    # context manager that closes the sqlite connection (sqlite3's own only commits)
+
+    def __init__(self, con):
+        self.con = con
+
+    def __enter__(self):
+        return self.con
+
+    def __exit__(self, exc_type, *args):
+        if exc_type is not None and self.con.in_transaction:
+            self.con.execute("ROLLBACK")
+        self.con.close()
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def run_download_worker(
+    queue_path,
+    download_dir,
+    username,
+    password,
+    worker_id = None,
+    overwrite = False,
+    chunk_size = None,
+    lock_policy = None,
+    max_jobs = None,
+    loglevel = 'INFO'
+):
+    """
+    Download products from a persistent job queue until the queue is empty.
+    Several workers (processes) can run on the same queue.
+
+    Parameters
+    ----------
+    queue_path : path to SQLite queue database
+    download_dir : download directory
+    username : CDSE username
+    password : CDSE password
+    worker_id : worker id used for leases (default=None, host name and pid)
+    overwrite : overwrite existing files (default=False)
+    chunk_size : download buffer size in bytes (default=None, auto-tuned)
+    lock_policy : coordinate with workers of other queues using lock files (None, 'wait', 'skip') (default=None)
+                  with 'skip', jobs locked by another worker are left pending for a later run
+    max_jobs : maximum number of jobs to process (default=None, until queue is empty)
+    loglevel : loglevel setting (default='INFO')
+
+    Returns
+    -------
+    n_done : number of successfully completed jobs
+    """
+
+    # remove default logger handler and add personal one
+    logger.remove()
+    logger.add(sys.stderr, level=loglevel)
+
+    queue = DownloadJobQueue(queue_path)
+    worker_id = worker_id or get_worker_id()
+
+    n_jobs = 0
+    n_done = 0
+    skipped_ids = set()
+
+    while max_jobs is None or n_jobs < max_jobs:
+
+        product = queue.acquire(worker_id, exclude_ids=skipped_ids)
+        if product is None:
+            logger.info("Download queue is empty")
+            break
+
+        # products locked by workers of other queues do not use an attempt
+        lock = None
+        if lock_policy == 'skip':
+            lock = CDSE_lock.ProductDownloadLock(download_dir, product['Name'])
+            if not lock.try_acquire():
+                logger.info(f"Product is being downloaded by another worker ({lock.read_owner()}), leaving job pending: {product['Name']}")
+                queue.release(product['Id'], worker_id)
+                skipped_ids.add(product['Id'])
+                continue
+
+        n_jobs += 1
+
+        # renew the lease while the download is running
+        stop_heartbeat = threading.Event()
+        def heartbeat():
+            while not stop_heartbeat.wait(queue.lease_seconds / 3):
+                if not queue.heartbeat(product['Id'], worker_id):
+                    logger.warning(f"Lost lease for {product['Name']}")
+        heartbeat_thread = threading.Thread(target=heartbeat, daemon=True)
+        heartbeat_thread.start()
+
+        try:
+            downloaded = CDSE_sd.download_product_from_cdse(
+                product,
+                download_dir,
+                username,
+                password,
+                overwrite = overwrite,
+                chunk_size = chunk_size,
+                lock_policy = None if lock is not None else lock_policy
+            )
+            error = '' if downloaded else 'Download failed'
+        except Exception as e:
+            downloaded = False
+            error = repr(e)
+        finally:
+            stop_heartbeat.set()
+            heartbeat_thread.join()
+            if lock is not None:
+                lock.release()
+
+        if downloaded:
+            if queue.complete(product['Id'], worker_id):
+                n_done += 1
+            else:
+                logger.warning(f"Lease for {product['Name']} was lost before completion")
+        else:
+            state = queue.fail(product['Id'], error, worker_id)
+            if state is None:
+                logger.warning(f"Lease for {product['Name']} was lost, job not released")
+            else:
+                logger.error(f"Job {product['Name']} failed ({error}), new state: {state}")
+
+    if skipped_ids:
+        logger.info(f"{len(skipped_ids)} jobs locked by other workers were left pending")
+
+    logger.info(f"Worker {worker_id} completed {n_done} of {n_jobs} jobs, queue: {queue.counts()}")
+
+    return n_done
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+# ---- End of <job_queue.py> ----
@@ -0,0 +1,305 @@
+# ---- This is <json_stream.py> ----
+
+"""
+Streaming (incremental) parsing of large CDSE catalogue responses.
+"""
+
+import re
+import sys
+import json
+import codecs
+
+from loguru import logger
+
+import requests
+
+import CDSE.tracing as CDSE_tracing
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+# chunk size for reading the response body
+default_stream_chunk_size = 65536
+
+_whitespace = re.compile(r'[ \t\n\r]*')
+_decoder = json.JSONDecoder()
+
+# scanning for the end of a JSON value: characters ending a number or literal,
+# brackets and quotes outside of strings, quotes and escapes inside of strings
+_scalar_end = re.compile(r'[ \t\n\r,:\]}]')
+_structural = re.compile(r'["\[\]{}]')
+_string_special = re.compile(r'["\\]')
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+class _ChunkBuffer:
+    """
+    Text buffer over an iterator of byte chunks.
+    Only the not yet consumed part of the stream is kept in memory.
+    Values are decoded once their end is found, the scan for the end
+    resumes where it stopped when more chunks are read.
+    """
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.text = ''
+        self.pos = 0
+        self.exhausted = False
+        # scan state of the current value: [offset from pos, bracket depth, in string]
+        self._scan = None
+
+    def fill(self):
+        # append next chunk and drop consumed text, returns False at end of stream
+        if self.exhausted:
+            return False
+        for chunk in self.chunks:
+            if chunk:
+                self.text = self.text[self.pos:] + self.decoder.decode(chunk)
+                self.pos = 0
+                return True
+        self.text = self.text[self.pos:] + self.decoder.decode(b'', final=True)
+        self.pos = 0
+        self.exhausted = True
+        return True
+
+    def peek(self):
+        # return next non-whitespace character without consuming it
+        while True:
+            self.pos = _whitespace.match(self.text, self.pos).end()
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if not self.fill():
+                raise ValueError("Unexpected end of JSON stream")
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected '{char}' in JSON stream but found '{found}'")
+        self.pos += 1
+
+    def _value_end(self):
+        # end index of the value starting at pos (None if it may continue in the next chunk)
+        text = self.text
+
+        if self._scan is None:
+            first = text[self.pos]
+            if first in '{[':
+                self._scan = [1, 1, False]
+            elif first == '"':
+                self._scan = [1, 0, True]
+            else:
+                # number or literal, ends at a delimiter (or at the end of the stream)
+                match = _scalar_end.search(text, self.pos)
+                if match is not None:
+                    return match.start()
+                return len(text) if self.exhausted else None
+
+        offset, depth, in_string = self._scan
+        i = self.pos + offset
+        while True:
+            if in_string:
+                match = _string_special.search(text, i)
+                if match is None:
+                    i = len(text)
+                    break
+                if match.group() == '\\':
+                    if match.end() == len(text):
+                        # escaped character is in the next chunk
+                        i = match.start()
+                        break
+                    i = match.end() + 1
+                    continue
+                in_string = False
+                i = match.end()
+                if depth == 0:
+                    return i
+            else:
+                match = _structural.search(text, i)
+                if match is None:
+                    i = len(text)
+                    break
+                i = match.end()
+                if match.group() == '"':
+                    in_string = True
+                elif match.group() in '{[':
+                    depth += 1
+                else:
+                    depth -= 1
+                    if depth == 0:
+                        return i
+
+        self._scan = [i - self.pos, depth, in_string]
+        return None
+
+    def decode(self):
+        # decode next complete JSON value, reading more chunks as needed
+        self.peek()
+        self._scan = None
+        while True:
+            end = self._value_end()
+            if end is not None:
+                break
+            if not self.fill():
+                raise ValueError("Unexpected end of JSON stream")
+        self._scan = None
+
+        value, value_end = _decoder.raw_decode(self.text, self.pos)
+        if value_end != end:
+            # e.g. a truncated number ('12.', '1e')
+            raise ValueError(f"Invalid JSON value in stream: '{self.text[self.pos:end][:50]}'")
+        self.pos = end
+        return value
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def iterate_json_array_items(chunks, array_key='value', metadata=None):
+    """
+    Incrementally parse a JSON object from byte chunks and yield the items
+    of one of its array members one by one.
+
+    Parameters
+    ----------
+    chunks : iterable of bytes (e.g. response.iter_content())
+    array_key : key of the top-level array to stream (default='value')
+    metadata : optional dict, filled with all other top-level members (e.g. '@odata.nextLink')
+
+    Yields
+    ------
+    item : decoded array item (dict for CDSE products)
+    """
+
+    buffer = _ChunkBuffer(chunks)
+
+    buffer.expect('{')
+    if buffer.peek() == '}':
+        return
+
+    while True:
+        key = buffer.decode()
+        buffer.expect(':')
+
+        if key == array_key:
+            buffer.expect('[')
+            if buffer.peek() == ']':
+                buffer.pos += 1
+            else:
+                while True:
+                    yield buffer.decode()
+                    separator = buffer.peek()
+                    buffer.pos += 1
+                    if separator == ']':
+                        break
+                    if separator != ',':
+                        raise ValueError(f"Unexpected '{separator}' in JSON array")
+        else:
+            value = buffer.decode()
+            if metadata is not None:
+                metadata[key] = value
+
+        separator = buffer.peek()
+        buffer.pos += 1
+        if separator == '}':
+            break
+        if separator != ',':
+            raise ValueError(f"Unexpected '{separator}' in JSON object")
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def stream_CDSE_products(querySTR, follow_next_links=True, max_pages=None, chunk_size=default_stream_chunk_size, session=None, loglevel='INFO'):
+    """
+    Stream products from CDSE catalogue query without loading full pages into memory.
+
+    Parameters
+    ----------
+    querySTR : full query url (e.g. from CDSE.search_and_download.build_CDSE_query_url)
+    follow_next_links : follow '@odata.nextLink' to the following pages (default=True)
+    max_pages : maximum number of pages to request (default=None, all pages)
+    chunk_size : size of chunks read from the response body (default=65536)
+    session : requests.Session to reuse (default=None, new session)
+    loglevel : loglevel setting (default='INFO')
+
+    Yields
+    ------
+    product : product dictionary
+    """
+
+    # remove default logger handler and add personal one
+    logger.remove()
+    logger.add(sys.stderr, level=loglevel)
+
+    close_session = session is None
+    if session is None:
+        session = requests.Session()
+
+    n_pages = 0
+    n_products = 0
+    next_link = querySTR
+
+    try:
+        while next_link is not None:
+            n_pages += 1
+            logger.debug(f"Streaming page {n_pages}: {next_link}")
+
+            metadata = dict()
+            with CDSE_tracing.request('GET', next_link, session=session, stream=True) as response:
+                response.raise_for_status()
+                for product in iterate_json_array_items(response.iter_content(chunk_size=chunk_size), metadata=metadata):
+                    n_products += 1
+                    yield product
+
+            next_link = metadata.get('@odata.nextLink') if follow_next_links else None
+            if max_pages is not None and n_pages >= max_pages:
+                if next_link is not None:
+                    logger.warning(f"Stopping after {max_pages} pages, more results are available")
+                break
+    finally:
+        if close_session:
+            session.close()
+
+    logger.info(f"Streamed {n_products} products from {n_pages} pages")
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def stream_CDSE_products_to_callback(querySTR, callback, follow_next_links=True, max_pages=None, chunk_size=default_stream_chunk_size, session=None, loglevel='INFO'):
+    """
+    Stream products from CDSE catalogue query into a callback function.
+
+    Parameters
+    ----------
+    querySTR : full query url (e.g. from CDSE.search_and_download.build_CDSE_query_url)
+    callback : function called with each product dictionary
+    follow_next_links : follow '@odata.nextLink' to the following pages (default=True)
+    max_pages : maximum number of pages to request (default=None, all pages)
+    chunk_size : size of chunks read from the response body (default=65536)
+    session : requests.Session to reuse (default=None, new session)
+    loglevel : loglevel setting (default='INFO')
+
+    Returns
+    -------
+    n_products : number of products passed to callback
+    """
+
+    n_products = 0
+
+    for product in stream_CDSE_products(
+        querySTR,
+        follow_next_links = follow_next_links,
+        max_pages = max_pages,
+        chunk_size = chunk_size,
+        session = session,
+        loglevel = loglevel
+    ):
+        callback(product)
+        n_products += 1
+
+    return n_products
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+# ---- End of <json_stream.py> ----
@@ -9,9 +9,10 @@ import pathlib
 from loguru import logger
 
 import json
-import geojson
-import geomet.wkt
 import re
+import copy
+
+# geojson, geomet and numpy are imported on first use (fast import of the package)
 
 # -------------------------------------------------------------------------- #
 # -------------------------------------------------------------------------- #
@@ -90,6 +91,8 @@ def read_geojson(geojson_path):
         geojson_obj = []
         return geojson_obj
 
+    import geojson
+
     with open(geojson_path) as f:
         geojson_obj = geojson.load(f) 
 
@@ -150,6 +153,8 @@ def convert_geojson_obj_2_wkt(geojson_obj, decimals=4):
         geometry["coordinates"] = ensure_2d(geometry["coordinates"])
         check_bounds(geometry["coordinates"])
 
+    import geomet.wkt
+
     wkt = geomet.wkt.dumps(geometry, decimals=decimals)
 
     # Strip unnecessary spaces
@@ -160,6 +165,121 @@ def convert_geojson_obj_2_wkt(geojson_obj, decimals=4):
 # -------------------------------------------------------------------------- #
 # -------------------------------------------------------------------------- #
 
+# up to this number of decimals, '%.<decimals>f' of a coordinate within +-180
+# equals geomet's repr(round(value, decimals)) padded with zeros
+max_vectorized_decimals = 12
+
+class _UnsupportedGeometry(Exception):
+    # geometry is converted by convert_geojson_obj_2_wkt instead
+    pass
+
+def _coordinate_array(points, arrays):
+    # collect (n, 2) coordinate array of a list of 2D/3D points
+    import numpy as np
+    try:
+        array = np.asarray(points, dtype=np.float64)
+    except (ValueError, TypeError):
+        raise _UnsupportedGeometry()
+    if array.ndim != 2 or array.shape[0] == 0 or array.shape[1] < 2:
+        raise _UnsupportedGeometry()
+    arrays.append(array[:, :2])
+    return array.shape[0]
+
+def _wkt_template(geometry, arrays, point_format):
+    # WKT with a format placeholder for every point, coordinates are appended to arrays
+
+    geometry_type = geometry.get('type')
+    coordinates = geometry.get('coordinates')
+
+    if not coordinates or 'crs' in geometry or 'meta' in geometry:
+        raise _UnsupportedGeometry()
+
+    def sequence(points):
+        return '(' + ((point_format + ',') * _coordinate_array(points, arrays))[:-1] + ')'
+
+    def rings(polygon):
+        if not polygon:
+            raise _UnsupportedGeometry()
+        return '(' + ','.join(sequence(ring) for ring in polygon) + ')'
+
+    if geometry_type == 'Point':
+        return 'POINT' + sequence([coordinates])
+    if geometry_type == 'LineString':
+        return 'LINESTRING' + sequence(coordinates)
+    if geometry_type == 'Polygon':
+        return 'POLYGON' + rings(coordinates)
+    if geometry_type == 'MultiPoint':
+        n_points = _coordinate_array(coordinates, arrays)
+        return 'MULTIPOINT(' + (('(' + point_format + '),') * n_points)[:-1] + ')'
+    if geometry_type == 'MultiLineString':
+        return 'MULTILINESTRING' + rings(coordinates)
+    if geometry_type == 'MultiPolygon':
+        return 'MULTIPOLYGON(' + ','.join(rings(polygon) for polygon in coordinates) + ')'
+
+    raise _UnsupportedGeometry()
+
+def convert_geojson_obj_2_wkt_vectorized(geojson_obj, decimals=4):
+    """
+    Convert a GeoJSON object to compact well-known text, with the same output as
+    convert_geojson_obj_2_wkt (which it falls back to for empty geometries,
+    geometries with crs and decimals > max_vectorized_decimals).
+    Coordinates of all points are collected in one NumPy array for the bounds check
+    and 2D conversion, and written with a single format operation.
+    Unlike convert_geojson_obj_2_wkt, the input object is not modified (the
+    fallback converts a copy).
+
+    Parameters
+    ----------
+    geojson_obj : dictionary with geojson data
+    decimals : number of decimal to round coordinate to (default=4)
+
+    Returns
+    -------
+    aoi_string : well-known text string representation of the geometry
+    """
+
+    # convert_geojson_obj_2_wkt replaces the coordinates with their 2D version, so it gets a copy
+    if decimals > max_vectorized_decimals:
+        return convert_geojson_obj_2_wkt(copy.deepcopy(geojson_obj), decimals=decimals)
+
+    import numpy as np
+
+    # correctly rounded like python's round (np.round is not)
+    point_format = '%d %d' if decimals == 0 else f"%.{decimals}f %.{decimals}f"
+    arrays = []
+
+    try:
+        if "coordinates" in geojson_obj:
+            wkt = _wkt_template(geojson_obj, arrays, point_format)
+        elif "geometry" in geojson_obj:
+            wkt = _wkt_template(geojson_obj["geometry"], arrays, point_format)
+        else:
+            geometries = [feature["geometry"] for feature in geojson_obj["features"]]
+            if not geometries:
+                raise _UnsupportedGeometry()
+            wkt = 'GEOMETRYCOLLECTION(' + ','.join(_wkt_template(g, arrays, point_format) for g in geometries) + ')'
+    except _UnsupportedGeometry:
+        return convert_geojson_obj_2_wkt(copy.deepcopy(geojson_obj), decimals=decimals)
+
+    coordinates = np.concatenate(arrays) if len(arrays) > 1 else arrays[0]
+
+    # same order of checks and messages as convert_geojson_obj_2_wkt
+    lon_out_of_bounds = np.abs(coordinates[:, 0]) > 180
+    lat_out_of_bounds = np.abs(coordinates[:, 1]) > 90
+    out_of_bounds = lon_out_of_bounds | lat_out_of_bounds
+    if out_of_bounds.any():
+        if lon_out_of_bounds[np.argmax(out_of_bounds)]:
+            raise ValueError("Longitude is out of bounds, check your JSON format or data")
+        raise ValueError("Latitude is out of bounds, check your JSON format or data")
+
+    if decimals == 0:
+        coordinates = np.rint(coordinates).astype(np.int64)
+
+    return wkt % tuple(coordinates.ravel().tolist())
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
 def get_aoi_string_from_geojson(geojson_path, decimals=4):
     """
     Convert content of a GeoJSON file to well-known text.
@@ -178,7 +298,7 @@ def get_aoi_string_from_geojson(geojson_path, decimals=4):
 
     geojson_obj = read_geojson(geojson_path)
 
-    aoi_string = convert_geojson_obj_2_wkt(geojson_obj, decimals=decimals)
+    aoi_string = convert_geojson_obj_2_wkt_vectorized(geojson_obj, decimals=decimals)
 
     return aoi_string
 
@@ -213,7 +333,7 @@ def get_aoi_string_from_lat_lon_dict(lat_lon_dict, decimals=4):
     D['type'] = 'Point'
     D['coordinates'] = [lat_lon_dict['lon'], lat_lon_dict['lat']]
 
-    aoi_string = convert_geojson_obj_2_wkt(D, decimals=decimals)
+    aoi_string = convert_geojson_obj_2_wkt_vectorized(D, decimals=decimals)
 
     logger.debug(f"aoi_string: {aoi_string}")
 
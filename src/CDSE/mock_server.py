@@ -0,0 +1,592 @@
+# ---- This is <mock_server.py> ----
+
+"""
+Local stand-in for the CDSE catalogue, zipper and identity endpoints
+(and an in-memory S3 client for testing upload sinks).
+Serves synthetic products for offline testing and benchmarking.
+"""
+
+import io
+import re
+import time
+import json
+import uuid
+import hashlib
+import random
+import socket
+import zipfile
+import argparse
+import datetime
+import threading
+import contextlib
+import urllib.parse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from loguru import logger
+
+import CDSE.search_and_download as CDSE_sd
+import CDSE.access_token_credentials as CDSE_atc
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+# url paths served by the mock server
+catalogue_path = '/odata/v1/Products'
+assets_path = '/odata/v1/Assets'
+token_path = '/auth/realms/CDSE/protocol/openid-connect/token'
+
+# namespace for deterministic synthetic product Ids
+product_namespace = uuid.UUID('6f1e2c1a-3b0d-4a5e-9a7c-0c0de5e0cd5e')
+
+# first synthetic acquisition time and time between acquisitions
+first_acquisition = datetime.datetime(2022, 6, 2, 7, 37, 27, tzinfo=datetime.timezone.utc)
+acquisition_step = datetime.timedelta(minutes=1)
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def build_synthetic_payload(size):
+    """
+    Build a valid zip archive of (approximately) the given size
+
+    Parameters
+    ----------
+    size : approximate payload size in bytes
+
+    Returns
+    -------
+    payload : zip archive as bytes
+    """
+
+    block = random.Random(0).randbytes(min(size, 1 << 20))
+    buffer = io.BytesIO()
+
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_STORED) as zf:
+        with zf.open('measurement.tiff', 'w', force_zip64=size > 0x7fffffff) as f:
+            remaining = max(size - 256, 0)
+            while remaining > 0:
+                n = min(remaining, len(block))
+                f.write(block[:n])
+                remaining -= n
+
+    return buffer.getvalue()
+
+def build_synthetic_quicklook(size):
+    """
+    Build a quicklook image stand-in (JPEG markers around random bytes)
+
+    Parameters
+    ----------
+    size : quicklook size in bytes
+
+    Returns
+    -------
+    quicklook : bytes
+    """
+
+    return b'\xff\xd8\xff\xe0' + random.Random(1).randbytes(max(size - 6, 0)) + b'\xff\xd9'
+
+def get_quicklook_id(product_id):
+    """
+    Deterministic Id of the quicklook asset of a synthetic product
+    """
+
+    return str(uuid.uuid5(product_namespace, f"quicklook-{product_id}"))
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def build_synthetic_product(index, content_length, sensor='SENTINEL-1'):
+    """
+    Build synthetic OData product dictionary
+
+    Parameters
+    ----------
+    index : product index (determines Id, Name, dates and footprint)
+    content_length : product size in bytes
+    sensor : sensor collection (default='SENTINEL-1')
+
+    Returns
+    -------
+    product : product dictionary
+    """
+
+    start = first_acquisition + index * acquisition_step
+    end = start + datetime.timedelta(seconds=64)
+    fmt = '%Y%m%dT%H%M%S'
+    iso = lambda d: d.isoformat(timespec='milliseconds').replace('+00:00', 'Z')
+
+    relative_orbit = index % 175 + 1
+
+    if sensor.upper() == 'SENTINEL-2':
+        name = f"S2A_MSIL1C_{start.strftime(fmt)}_N0400_R{relative_orbit % 143 + 1:03d}_T33XVG_{end.strftime(fmt)}.SAFE"
+    else:
+        name = f"S1A_EW_GRDM_1SDH_{start.strftime(fmt)}_{end.strftime(fmt)}_{40000 + index:06d}_{index % 0xFFFFFF:06X}_{index % 0xFFFF:04X}.SAFE"
+
+    # footprints walk along a band over Svalbard
+    lon = -20 + (index % 40)
+    lat = 76 + (index % 8)
+    polygon = f"POLYGON (({lon} {lat}, {lon + 4} {lat}, {lon + 4} {lat + 2}, {lon} {lat + 2}, {lon} {lat}))"
+
+    attributes = [
+        ('String', 'origin', 'ESA'),
+        ('Integer', 'datatakeID', 340000 + index),
+        ('String', 'timeliness', 'Fast-24h'),
+        ('Integer', 'cycleNumber', 260 + index // 175),
+        ('Integer', 'orbitNumber', 40000 + index),
+        ('Integer', 'sliceNumber', index % 10 + 1),
+        ('Integer', 'totalSlices', 10),
+        ('String', 'productClass', 'S'),
+        ('DateTimeOffset', 'processingDate', iso(end + datetime.timedelta(hours=1))),
+        ('String', 'orbitDirection', 'DESCENDING' if index % 2 else 'ASCENDING'),
+        ('String', 'operationalMode', 'EW'),
+        ('String', 'processingLevel', 'LEVEL1'),
+        ('String', 'swathIdentifier', 'EW'),
+        ('String', 'productType', 'EW_GRDM_1S'),
+        ('String', 'platformShortName', sensor.upper()),
+        ('String', 'instrumentShortName', 'SAR'),
+        ('Integer', 'relativeOrbitNumber', relative_orbit),
+        ('String', 'polarisationChannels', 'HH&HV'),
+        ('String', 'platformSerialIdentifier', 'A'),
+        ('DateTimeOffset', 'beginningDateTime', iso(start)),
+        ('DateTimeOffset', 'endingDateTime', iso(end)),
+        ('Double', 'cloudCover', float(index % 101)),
+    ]
+
+    product = {
+        '@odata.mediaContentType': 'application/octet-stream',
+        'Id': str(uuid.uuid5(product_namespace, str(index))),
+        'Name': name,
+        'ContentType': 'application/octet-stream',
+        'ContentLength': content_length,
+        'OriginDate': iso(end + datetime.timedelta(hours=1)),
+        'PublicationDate': iso(end + datetime.timedelta(hours=2)),
+        'ModificationDate': iso(end + datetime.timedelta(hours=2)),
+        'Online': True,
+        'EvictionDate': '',
+        'S3Path': f"/eodata/Sentinel-1/SAR/EW_GRDM_1S/{start.strftime('%Y/%m/%d')}/{name}",
+        'Checksum': [],
+        'ContentDate': {'Start': iso(start), 'End': iso(end)},
+        'Footprint': f"geography'SRID=4326;{polygon}'",
+        'GeoFootprint': {
+            'type': 'Polygon',
+            'coordinates': [[[lon, lat], [lon + 4, lat], [lon + 4, lat + 2], [lon, lat + 2], [lon, lat]]],
+        },
+        'Attributes': [
+            {
+                '@odata.type': f"#OData.CSC.{value_type}Attribute",
+                'Name': attribute_name,
+                'Value': value,
+                'ValueType': value_type,
+            }
+            for value_type, attribute_name, value in attributes
+        ],
+    }
+
+    return product
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+class MockCDSEServer:
+    """
+    Local HTTP server imitating the CDSE catalogue, zipper and identity endpoints.
+
+    Parameters
+    ----------
+    n_products : number of synthetic products returned by catalogue queries (default=2500)
+    product_size : size of the synthetic product zip in bytes (default=10 MB)
+    latency : delay in seconds before each response (default=0)
+    bandwidth : download bandwidth cap in bytes per second (default=None, unlimited)
+    error_rate : probability of answering a request with an error status (default=0)
+    error_codes : error status codes to choose from (default=[429, 500, 503])
+    drop_rate : probability of dropping the connection during a download (default=0)
+    token_lifetime : lifetime of issued access tokens in seconds (default=600)
+    quicklook_size : size of the synthetic quicklook images in bytes (default=20 kB)
+    host : host to bind to (default='127.0.0.1')
+    port : port to bind to (default=0, any free port)
+    seed : seed for injected errors (default=None)
+    """
+
+    def __init__(
+        self,
+        n_products = 2500,
+        product_size = 10 * 1024 * 1024,
+        latency = 0,
+        bandwidth = None,
+        error_rate = 0,
+        error_codes = [429, 500, 503],
+        drop_rate = 0,
+        token_lifetime = 600,
+        quicklook_size = 20 * 1024,
+        host = '127.0.0.1',
+        port = 0,
+        seed = None
+    ):
+        self.n_products = n_products
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.error_codes = list(error_codes)
+        self.drop_rate = drop_rate
+        self.token_lifetime = token_lifetime
+        self.random = random.Random(seed)
+
+        self.payload = build_synthetic_payload(product_size)
+        self.quicklook = build_synthetic_quicklook(quicklook_size)
+
+        # product indices by product Id and quicklook Id (for single product and asset requests)
+        self.product_index = {str(uuid.uuid5(product_namespace, str(index))): index for index in range(n_products)}
+        self.quicklook_index = {get_quicklook_id(product_id): index for product_id, index in self.product_index.items()}
+
+        # request counters, keyed by endpoint
+        self.counters = {'catalogue': 0, 'download': 0, 'quicklook': 0, 'token': 0, 'errors': 0, 'drops': 0}
+        self._lock = threading.Lock()
+
+        self.httpd = ThreadingHTTPServer((host, port), _make_handler(self))
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, key):
+        with self._lock:
+            self.counters[key] += 1
+
+    def inject_error(self):
+        with self._lock:
+            return self.random.random() < self.error_rate
+
+    def inject_drop(self):
+        with self._lock:
+            return self.random.random() < self.drop_rate
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        logger.debug(f"Mock CDSE server running at {self.url}")
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def _make_handler(server):
+
+    class MockCDSEHandler(BaseHTTPRequestHandler):
+
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            logger.trace(f"mock server: {format % args}")
+
+        def send_json(self, status, obj):
+            body = json.dumps(obj).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def before_response(self):
+            if server.latency:
+                time.sleep(server.latency)
+            if server.error_codes and server.inject_error():
+                server.count('errors')
+                status = server.random.choice(server.error_codes)
+                self.send_json(status, {'detail': f"Injected error {status}"})
+                return False
+            return True
+
+        # ------------------------ #
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            form = urllib.parse.parse_qs(self.rfile.read(length).decode())
+
+            if urllib.parse.urlsplit(self.path).path != token_path:
+                self.send_json(404, {'detail': 'Not found'})
+                return
+
+            server.count('token')
+            if not self.before_response():
+                return
+
+            grant_type = form.get('grant_type', [''])[0]
+            if grant_type == 'password' and not (form.get('username') and form.get('password')):
+                self.send_json(401, {'error': 'invalid_grant', 'error_description': 'Invalid user credentials'})
+                return
+
+            self.send_json(200, {
+                'access_token': f"mock-access-{uuid.uuid4().hex}",
+                'expires_in': server.token_lifetime,
+                'refresh_token': f"mock-refresh-{uuid.uuid4().hex}",
+                'refresh_expires_in': 3600,
+                'token_type': 'Bearer',
+            })
+
+        # ------------------------ #
+
+        def do_GET(self):
+            split = urllib.parse.urlsplit(self.path)
+            download = re.fullmatch(re.escape(catalogue_path) + r"\(([0-9a-f-]+)\)/\$value", split.path)
+            single_product = re.fullmatch(re.escape(catalogue_path) + r"\(([0-9a-f-]+)\)", split.path)
+            quicklook = re.fullmatch(re.escape(assets_path) + r"\(([0-9a-f-]+)\)/\$value", split.path)
+
+            if download:
+                self.serve_download(download.group(1))
+            elif split.path == catalogue_path:
+                self.serve_catalogue(urllib.parse.parse_qs(split.query))
+            elif single_product:
+                self.serve_product(single_product.group(1), urllib.parse.parse_qs(split.query))
+            elif quicklook:
+                self.serve_quicklook(quicklook.group(1))
+            else:
+                self.send_json(404, {'detail': 'Not found'})
+
+        def expand_product(self, product, expand):
+            # remove attributes or add assets as requested by $expand
+            if 'Attributes' not in expand:
+                del product['Attributes']
+            if 'Assets' in expand:
+                quicklook_id = get_quicklook_id(product['Id'])
+                product['Assets'] = [{
+                    'Type': 'QUICKLOOK',
+                    'Id': quicklook_id,
+                    'DownloadLink': f"{server.url}{assets_path}({quicklook_id})/$value",
+                    'S3Path': f"{product['S3Path']}/preview/quick-look.png",
+                }]
+            return product
+
+        def serve_catalogue(self, query):
+            server.count('catalogue')
+            if not self.before_response():
+                return
+
+            query_filter = query.get('$filter', [''])[0]
+            top = int(query.get('$top', ['20'])[0])
+            skip = int(query.get('$skip', ['0'])[0])
+            expand = query.get('$expand', [])
+            sensor = 'SENTINEL-2' if 'SENTINEL-2' in query_filter else 'SENTINEL-1'
+
+            name_match = re.search(r"(?<!/)\bName eq '([^']+)'", query_filter)
+            if name_match:
+                product = build_synthetic_product(0, len(server.payload), sensor)
+                product['Name'] = name_match.group(1)
+                products = [product]
+                total = 1
+            else:
+                total = server.n_products
+                products = [
+                    build_synthetic_product(index, len(server.payload), sensor)
+                    for index in range(skip, min(skip + top, total))
+                ]
+
+            for product in products:
+                self.expand_product(product, expand)
+
+            response = {'@odata.context': '$metadata#Products', 'value': products}
+            if skip + top < total:
+                next_query = dict((key, value[0]) for key, value in query.items())
+                next_query['$skip'] = str(skip + top)
+                response['@odata.nextLink'] = f"{server.url}{catalogue_path}?{urllib.parse.urlencode(next_query, quote_via=urllib.parse.quote)}"
+
+            self.send_json(200, response)
+
+        def serve_product(self, product_id, query):
+            server.count('catalogue')
+            if not self.before_response():
+                return
+
+            if product_id not in server.product_index:
+                self.send_json(404, {'detail': 'Product not found'})
+                return
+
+            product = build_synthetic_product(server.product_index[product_id], len(server.payload))
+            self.send_json(200, self.expand_product(product, query.get('$expand', [])))
+
+        def serve_quicklook(self, quicklook_id):
+            server.count('quicklook')
+
+            if not self.headers.get('Authorization', '').startswith('Bearer '):
+                self.send_json(401, {'detail': 'Missing access token'})
+                return
+
+            if not self.before_response():
+                return
+
+            if quicklook_id not in server.quicklook_index:
+                self.send_json(404, {'detail': 'Asset not found'})
+                return
+
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/jpeg')
+            self.send_header('Content-Length', str(len(server.quicklook)))
+            self.end_headers()
+            self.wfile.write(server.quicklook)
+
+        def serve_download(self, product_id):
+            server.count('download')
+
+            if not self.headers.get('Authorization', '').startswith('Bearer '):
+                self.send_json(401, {'detail': 'Missing access token'})
+                return
+
+            if not self.before_response():
+                return
+
+            payload = server.payload
+            drop_at = server.random.randrange(len(payload)) if server.inject_drop() else None
+
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/zip')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+
+            block_size = 1 << 16
+            t_start = time.perf_counter()
+            for offset in range(0, len(payload), block_size):
+                if drop_at is not None and offset >= drop_at:
+                    server.count('drops')
+                    self.close_connection = True
+                    self.connection.shutdown(socket.SHUT_RDWR)
+                    return
+                self.wfile.write(payload[offset:offset+block_size])
+                if server.bandwidth:
+                    # sleep until the sent bytes match the bandwidth cap
+                    delay = (offset + block_size) / server.bandwidth - (time.perf_counter() - t_start)
+                    if delay > 0:
+                        time.sleep(delay)
+
+    return MockCDSEHandler
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+class MockS3Client:
+    """
+    In-memory stand-in for an S3 client (multipart upload subset of the boto3 interface),
+    for testing CDSE.sinks.S3MultipartSink without an object store.
+
+    Completed objects are in 'objects' ((bucket, key) -> bytes), uploads in progress in 'uploads'.
+    """
+
+    def __init__(self, fail_part=None):
+        self.objects = dict()
+        self.uploads = dict()
+        self.fail_part = fail_part
+        self._lock = threading.Lock()
+
+    def create_multipart_upload(self, Bucket, Key):
+        upload_id = uuid.uuid4().hex
+        with self._lock:
+            self.uploads[upload_id] = {'bucket': Bucket, 'key': Key, 'parts': dict()}
+        return {'UploadId': upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        if PartNumber == self.fail_part:
+            raise IOError(f"Injected upload error in part {PartNumber}")
+        etag = hashlib.md5(Body).hexdigest()
+        with self._lock:
+            self.uploads[UploadId]['parts'][PartNumber] = (etag, bytes(Body))
+        return {'ETag': etag}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        with self._lock:
+            upload = self.uploads.pop(UploadId)
+            data = b''
+            for part in MultipartUpload['Parts']:
+                etag, body = upload['parts'][part['PartNumber']]
+                if etag != part['ETag']:
+                    raise ValueError(f"ETag mismatch in part {part['PartNumber']}")
+                data += body
+            self.objects[(Bucket, Key)] = data
+        return {'Bucket': Bucket, 'Key': Key}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        with self._lock:
+            self.uploads.pop(UploadId, None)
+
+    def head_object(self, Bucket, Key):
+        with self._lock:
+            if (Bucket, Key) not in self.objects:
+                raise KeyError(f"{Bucket}/{Key}")
+            return {'ContentLength': len(self.objects[(Bucket, Key)])}
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+@contextlib.contextmanager
+def use_mock_endpoints(server):
+    """
+    Redirect the CDSE endpoints used by this library to a mock server
+
+    Parameters
+    ----------
+    server : running MockCDSEServer
+    """
+
+    saved = (CDSE_sd.catalogue_url, CDSE_sd.zipper_url, CDSE_sd.assets_url, CDSE_atc.token_url)
+
+    CDSE_sd.catalogue_url = f"{server.url}{catalogue_path}"
+    CDSE_sd.zipper_url = f"{server.url}{catalogue_path}"
+    CDSE_sd.assets_url = f"{server.url}{assets_path}"
+    CDSE_atc.token_url = f"{server.url}{token_path}"
+
+    try:
+        yield server
+    finally:
+        CDSE_sd.catalogue_url, CDSE_sd.zipper_url, CDSE_sd.assets_url, CDSE_atc.token_url = saved
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def main():
+
+    p = argparse.ArgumentParser(description='Run a local mock CDSE server.')
+    p.add_argument('--port', type=int, default=8080)
+    p.add_argument('--n-products', type=int, default=2500)
+    p.add_argument('--product-size', type=int, default=10 * 1024 * 1024)
+    p.add_argument('--latency', type=float, default=0)
+    p.add_argument('--bandwidth', type=float, default=None)
+    p.add_argument('--error-rate', type=float, default=0)
+    p.add_argument('--drop-rate', type=float, default=0)
+    args = p.parse_args()
+
+    server = MockCDSEServer(
+        n_products = args.n_products,
+        product_size = args.product_size,
+        latency = args.latency,
+        bandwidth = args.bandwidth,
+        error_rate = args.error_rate,
+        drop_rate = args.drop_rate,
+        port = args.port
+    )
+
+    logger.info(f"Mock CDSE server running at {server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.httpd.server_close()
+
+if __name__ == '__main__':
+    main()
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+# ---- End of <mock_server.py> ----
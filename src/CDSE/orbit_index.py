@@ -0,0 +1,355 @@
+# ---- This is <orbit_index.py> ----
+
+"""
+Index of Sentinel-1 relative orbit coverage, built from past search results.
+"""
+
+import os
+import json
+import pathlib
+import threading
+
+import numpy as np
+import geomet.wkt
+from loguru import logger
+
+import CDSE.product as CDSE_product
+import CDSE.aoi_cache as CDSE_aoi_cache
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+# default location of the index file
+default_index_path = pathlib.Path(
+    os.environ.get("CDSE_S1_ORBIT_INDEX", pathlib.Path.home() / '.cache' / 'CDSE' / 's1_orbit_index.json')
+)
+
+# coverage is recorded on a regular lat/lon grid with this cell size (degrees)
+default_cell_degrees = 0.25
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def _get_attribute(product, name):
+    # attribute value of a product dictionary or CDSE.product.Product (None if missing)
+    if isinstance(product, CDSE_product.Product):
+        return product.get_attribute(name)
+    for attribute in product.get('Attributes') or []:
+        if attribute.get('Name') == name:
+            return attribute.get('Value')
+    return None
+
+def _get_footprint(product):
+    # footprint of a product as geojson geometry (None if missing)
+    footprint = product.get('GeoFootprint')
+    if footprint:
+        return footprint
+    footprint = product.get('Footprint')
+    if footprint:
+        return geomet.wkt.loads(footprint.split(';')[-1].strip("'"))
+    return None
+
+def _polygons(geometry):
+    # outer rings of all polygons and coordinate sequences of all other geometries
+    geometry_type = geometry.get('type')
+    if geometry_type == 'GeometryCollection':
+        return [ring for g in geometry['geometries'] for ring in _polygons(g)]
+    coordinates = geometry['coordinates']
+    if geometry_type == 'Point':
+        return [('points', [coordinates])]
+    if geometry_type in ('LineString', 'MultiPoint'):
+        return [('points', coordinates)]
+    if geometry_type == 'MultiLineString':
+        return [('points', line) for line in coordinates]
+    if geometry_type == 'Polygon':
+        return [('polygon', coordinates[0])]
+    if geometry_type == 'MultiPolygon':
+        return [('polygon', polygon[0]) for polygon in coordinates]
+    raise ValueError(f"Unsupported geometry type: {geometry_type}")
+
+def geometry_to_cells(geometry, cell_degrees=default_cell_degrees):
+    """
+    Grid cells covered by a geojson geometry, feature or feature collection (lon/lat):
+    cells with their center inside a polygon, and cells touched by vertices or edges
+
+    Returns
+    -------
+    cells : numpy array of unique cell numbers
+    """
+
+    if "features" in geometry:
+        geometries = [feature["geometry"] for feature in geometry["features"]]
+    elif "geometry" in geometry:
+        geometries = [geometry["geometry"]]
+    else:
+        geometries = [geometry]
+
+    n_lon_cells = int(round(360 / cell_degrees))
+    cell_of = lambda lon, lat: (
+        np.clip(((lat + 90) // cell_degrees).astype(np.int64), 0, int(round(180 / cell_degrees)) - 1) * n_lon_cells
+        + ((lon + 180) // cell_degrees).astype(np.int64) % n_lon_cells
+    )
+
+    cells = []
+
+    for kind, points in [part for g in geometries for part in _polygons(g)]:
+        points = np.asarray(points, dtype=np.float64)[:, :2]
+
+        # vertices and edges (sampled at half the cell size)
+        samples = [points]
+        if len(points) > 1:
+            start, end = points[:-1], points[1:]
+            n_steps = np.maximum(np.ceil(np.abs(end - start).max(axis=1) / (cell_degrees / 2)).astype(int), 1)
+            for a, b, n in zip(start, end, n_steps):
+                samples.append(a + np.linspace(0, 1, n + 1)[:, None] * (b - a))
+        samples = np.concatenate(samples)
+        cells.append(cell_of(samples[:, 0], samples[:, 1]))
+
+        if kind != 'polygon' or len(points) < 4:
+            continue
+
+        # cell centers inside the polygon (even-odd rule)
+        lon_min, lat_min = points.min(axis=0)
+        lon_max, lat_max = points.max(axis=0)
+        lon_centers = (np.arange(np.floor(lon_min / cell_degrees), np.ceil(lon_max / cell_degrees)) + 0.5) * cell_degrees
+        lat_centers = (np.arange(np.floor(lat_min / cell_degrees), np.ceil(lat_max / cell_degrees)) + 0.5) * cell_degrees
+        lon, lat = (a.ravel() for a in np.meshgrid(lon_centers, lat_centers))
+        inside = np.zeros(lon.shape, dtype=bool)
+        for (x0, y0), (x1, y1) in zip(points[:-1], points[1:]):
+            if y0 == y1:
+                continue
+            crosses = (y0 > lat) != (y1 > lat)
+            x_cross = x0 + (lat - y0) * (x1 - x0) / (y1 - y0)
+            inside ^= crosses & (lon < x_cross)
+        cells.append(cell_of(lon[inside], lat[inside]))
+
+    if not cells:
+        return np.zeros(0, dtype=np.int64)
+
+    return np.unique(np.concatenate(cells))
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+class RelativeOrbitIndex:
+    """
+    Coverage of Sentinel-1 relative orbits and pass directions, recorded as
+    grid cells from the footprints of products found in past searches (with
+    expand_attributes=True). Orbits that never appeared in a search over an
+    area are not known for it. search_CDSE_catalogue therefore restricts a
+    search only if the known orbits cover the whole AOI (see get_coverage),
+    otherwise it searches all orbits and records the results
+    (see update_from_search).
+    """
+
+    def __init__(self, index_path=default_index_path, cell_degrees=default_cell_degrees):
+
+        self.index_path = pathlib.Path(index_path)
+        self.cell_degrees = cell_degrees
+        self._lock = threading.Lock()
+
+        # (relative orbit, orbit direction) -> set of cells / number of products
+        self._cells = dict()
+        self._n_products = dict()
+        # product Ids already in the index
+        self._product_ids = set()
+
+        if self.index_path.is_file():
+            self.load()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._cells)
+
+    # ------------------------ #
+
+    def load(self):
+        """
+        Read the index file
+        """
+
+        with open(self.index_path) as f:
+            index = json.load(f)
+
+        if index.get('cell_degrees') != self.cell_degrees:
+            logger.warning(f"Ignoring orbit index {self.index_path} with a different cell size")
+            return
+
+        with self._lock:
+            for orbit in index['orbits']:
+                key = (orbit['relative_orbit'], orbit['orbit_direction'])
+                self._cells[key] = set(orbit['cells'])
+                self._n_products[key] = orbit['n_products']
+            self._product_ids = set(index['product_ids'])
+
+    def save(self):
+        """
+        Write the index file (atomic rename)
+        """
+
+        with self._lock:
+            index = {
+                'cell_degrees': self.cell_degrees,
+                'orbits': [
+                    {
+                        'relative_orbit': key[0],
+                        'orbit_direction': key[1],
+                        'n_products': self._n_products[key],
+                        'cells': sorted(cells),
+                    }
+                    for key, cells in sorted(self._cells.items())
+                ],
+                'product_ids': sorted(self._product_ids),
+            }
+
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.index_path.with_name(f"{self.index_path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp_path, self.index_path)
+
+    # ------------------------ #
+
+    def add_products(self, product_list):
+        """
+        Record the footprints of S1 products (with relativeOrbitNumber and orbitDirection attributes)
+
+        Returns
+        -------
+        n_added : number of new products recorded
+        """
+
+        n_added = 0
+
+        for product in product_list:
+            if product['Id'] in self._product_ids or not product['Name'].startswith('S1'):
+                continue
+            relative_orbit = _get_attribute(product, 'relativeOrbitNumber')
+            orbit_direction = _get_attribute(product, 'orbitDirection')
+            footprint = _get_footprint(product)
+            if relative_orbit is None or orbit_direction is None or footprint is None:
+                logger.debug(f"Missing orbit attributes or footprint: {product['Name']}")
+                continue
+
+            cells = geometry_to_cells(footprint, self.cell_degrees).tolist()
+            key = (int(relative_orbit), orbit_direction)
+
+            with self._lock:
+                self._cells.setdefault(key, set()).update(cells)
+                self._n_products[key] = self._n_products.get(key, 0) + 1
+                self._product_ids.add(product['Id'])
+            n_added += 1
+
+        logger.debug(f"Added {n_added} products to the orbit index")
+
+        return n_added
+
+    def add_response_json(self, response_json, follow_next_links=False, loglevel='INFO'):
+        """
+        Record the products of a CDSE response
+
+        Parameters
+        ----------
+        response_json : CDSE response in json format (dict)
+        follow_next_links : also request and record the following result pages (default=False, given page only)
+        loglevel : loglevel setting (default='INFO')
+
+        Returns
+        -------
+        n_added : number of new products recorded
+        """
+
+        if not follow_next_links:
+            return self.add_products(response_json['value'])
+
+        import CDSE.search_and_download as CDSE_sd
+
+        n_added = 0
+        for page_json in CDSE_sd.iterate_CDSE_response_pages(response_json, loglevel=loglevel):
+            n_added += self.add_products(page_json['value'])
+
+        return n_added
+
+    def update_from_search(self, response_json, follow_next_links=True, loglevel='INFO'):
+        """
+        Record the products of all pages of a search and write the index file
+
+        Returns
+        -------
+        n_added : number of new products recorded
+        """
+
+        n_added = self.add_response_json(response_json, follow_next_links=follow_next_links, loglevel=loglevel)
+        if n_added:
+            self.save()
+
+        return n_added
+
+    def get_coverage(self, area):
+        """
+        Fraction of the AOI cells covered by any known orbit
+
+        Parameters
+        ----------
+        area : geojson file with search area or dict with 'lat'/'lon' keys
+
+        Returns
+        -------
+        coverage : fraction of AOI cells (0.0 for an empty AOI)
+        """
+
+        aoi_cells = set(geometry_to_cells(CDSE_aoi_cache.get_aoi_geometry(area), self.cell_degrees).tolist())
+        if not aoi_cells:
+            return 0.0
+
+        covered = set()
+        with self._lock:
+            for cells in self._cells.values():
+                covered |= aoi_cells & cells
+
+        return len(covered) / len(aoi_cells)
+
+    def find_orbits(self, area, min_coverage=0.0):
+        """
+        Relative orbits and pass directions covering an AOI
+
+        Parameters
+        ----------
+        area : geojson file with search area or dict with 'lat'/'lon' keys
+        min_coverage : minimum fraction of the AOI cells covered by an orbit (default=0.0, any overlap)
+
+        Returns
+        -------
+        orbits : list of dicts with relative_orbit, orbit_direction, coverage (fraction of AOI cells)
+                 and n_products (recorded products), sorted by decreasing coverage
+        """
+
+        aoi_cells = set(geometry_to_cells(CDSE_aoi_cache.get_aoi_geometry(area), self.cell_degrees).tolist())
+        if not aoi_cells:
+            return []
+
+        orbits = []
+        with self._lock:
+            for key, cells in self._cells.items():
+                coverage = len(aoi_cells & cells) / len(aoi_cells)
+                if coverage > 0 and coverage >= min_coverage:
+                    orbits.append({
+                        'relative_orbit': key[0],
+                        'orbit_direction': key[1],
+                        'coverage': coverage,
+                        'n_products': self._n_products[key],
+                    })
+
+        return sorted(orbits, key=lambda o: (-o['coverage'], o['relative_orbit'], o['orbit_direction']))
+
+    def find_relative_orbits(self, area, min_coverage=0.0):
+        """
+        Sorted list of relative orbit numbers covering an AOI (any pass direction)
+        """
+
+        return sorted(set(orbit['relative_orbit'] for orbit in self.find_orbits(area, min_coverage)))
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+# ---- End of <orbit_index.py> ----
@@ -0,0 +1,212 @@
+# ---- This is <parquet_utils.py> ----
+
+"""
+Columnar (GeoParquet) export of CDSE search results.
+Requires the optional 'pyarrow' package.
+"""
+
+import json
+import pathlib
+
+from loguru import logger
+
+import CDSE.product as CDSE_product
+import CDSE.search_and_download as CDSE_sd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+# product attributes exported as typed columns (attribute name, arrow type name)
+exported_attributes = [
+    ('platformShortName', 'string'),
+    ('platformSerialIdentifier', 'string'),
+    ('instrumentShortName', 'string'),
+    ('operationalMode', 'string'),
+    ('swathIdentifier', 'string'),
+    ('polarisationChannels', 'string'),
+    ('productType', 'string'),
+    ('processingLevel', 'string'),
+    ('timeliness', 'string'),
+    ('orbitDirection', 'string'),
+    ('orbitNumber', 'int64'),
+    ('relativeOrbitNumber', 'int64'),
+    ('tileId', 'string'),
+    ('cloudCover', 'float64'),
+]
+
+# core product fields exported as typed columns (field name, arrow type name)
+exported_fields = [
+    ('Id', 'string'),
+    ('Name', 'string'),
+    ('ContentType', 'string'),
+    ('ContentLength', 'int64'),
+    ('Online', 'bool_'),
+    ('S3Path', 'string'),
+    ('OriginDate', 'timestamp'),
+    ('PublicationDate', 'timestamp'),
+    ('ModificationDate', 'timestamp'),
+    ('ContentStart', 'timestamp'),
+    ('ContentEnd', 'timestamp'),
+]
+
+geometry_column = 'geometry'
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def _arrow_type(type_name):
+    if type_name == 'timestamp':
+        return pa.timestamp('ms', tz='UTC')
+    return getattr(pa, type_name)()
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def get_product_schema():
+    """
+    Get arrow schema (with GeoParquet metadata) for flattened products
+
+    Returns
+    -------
+    schema : pyarrow.Schema
+    """
+
+    fields = [pa.field(name, _arrow_type(type_name)) for name, type_name in exported_fields]
+    fields += [pa.field(name, _arrow_type(type_name)) for name, type_name in exported_attributes]
+    fields.append(pa.field(geometry_column, pa.binary()))
+
+    geo_metadata = {
+        'version': '1.0.0',
+        'primary_column': geometry_column,
+        'columns': {
+            geometry_column: {
+                'encoding': 'WKB',
+                'geometry_types': ['Polygon', 'MultiPolygon'],
+            }
+        },
+    }
+
+    return pa.schema(fields, metadata={'geo': json.dumps(geo_metadata)})
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def convert_products_2_table(product_list):
+    """
+    Flatten list of products into a columnar arrow table
+
+    Parameters
+    ----------
+    product_list : list of product dicts or CDSE.product.Product objects
+
+    Returns
+    -------
+    table : pyarrow.Table with one row per product
+    """
+
+    columns = {name: [] for name, type_name in exported_fields + exported_attributes}
+    columns[geometry_column] = []
+
+    for product in product_list:
+        if not isinstance(product, CDSE_product.Product):
+            product = CDSE_product.Product(product)
+
+        for name, type_name in exported_fields:
+            columns[name].append(getattr(product, name))
+
+        for name, type_name in exported_attributes:
+            columns[name].append(product.get_attribute(name))
+
+        footprint = product.footprint
+        columns[geometry_column].append(footprint.wkb if footprint is not None else None)
+
+    return pa.Table.from_pydict(columns, schema=get_product_schema())
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def write_response_pages_2_parquet(response_json, output_file, follow_next_links=True, loglevel='INFO'):
+    """
+    Write CDSE response to GeoParquet file, one row group per response page.
+    With 'follow_next_links', all pages of a paginated search are fetched and
+    written one after another, so only one page is held in memory at a time.
+
+    Parameters
+    ----------
+    response_json : CDSE response in json format (dict), first page
+    output_file : output parquet file
+    follow_next_links : follow '@odata.nextLink' and write all pages (default=True)
+    loglevel : loglevel setting (default='INFO')
+
+    Returns
+    -------
+    n_products : number of products written
+    """
+
+    n_products = 0
+
+    if pa is None:
+        logger.error("Parquet export requires the 'pyarrow' package")
+        return n_products
+
+    if type(response_json) is not dict:
+        logger.error(f"Expected input type 'dict' but received {type(response_json)}")
+        return n_products
+
+    if not str(output_file).endswith('parquet'):
+        logger.error("Output should be a parquet file")
+        return n_products
+
+    max_pages = None if follow_next_links else 1
+
+    with pq.ParquetWriter(pathlib.Path(output_file), get_product_schema(), compression='zstd') as writer:
+        for page_json in CDSE_sd.iterate_CDSE_response_pages(response_json, max_pages=max_pages, loglevel=loglevel):
+            table = convert_products_2_table(page_json['value'])
+            writer.write_table(table)
+            n_products += table.num_rows
+            logger.debug(f"Wrote {table.num_rows} products to {output_file}")
+
+    logger.info(f"Wrote {n_products} products to {output_file}")
+
+    return n_products
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def read_products_from_parquet(parquet_path, columns=None, filters=None):
+    """
+    Load (selected columns of) products from GeoParquet file
+
+    Parameters
+    ----------
+    parquet_path : path to parquet file
+    columns : list of columns to read (default=None, all columns)
+    filters : pyarrow filter expression or list of tuples, e.g. [('cloudCover', '<', 20)] (default=None)
+
+    Returns
+    -------
+    table : pyarrow.Table with selected products
+    """
+
+    if pa is None:
+        logger.error("Parquet import requires the 'pyarrow' package")
+        return None
+
+    parquet_path = pathlib.Path(parquet_path).resolve()
+
+    if not parquet_path.is_file():
+        logger.error(f'Cannot find parquet_path: {parquet_path}')
+        return None
+
+    return pq.read_table(parquet_path, columns=columns, filters=filters)
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+# ---- End of <parquet_utils.py> ----
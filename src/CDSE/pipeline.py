@@ -0,0 +1,194 @@
+# ---- This is <pipeline.py> ----
+
+"""
+Pipelined search-to-download: products are downloaded while the search is still running.
+"""
+
+import sys
+import queue
+import threading
+
+from loguru import logger
+
+import CDSE.json_stream as CDSE_stream
+import CDSE.search_and_download as CDSE_sd
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+# marks the end of the product stream in the download queue
+_end_of_stream = object()
+
+# default maximum number of products waiting for download
+default_queue_size = 20
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def iterate_search_products(search, follow_next_links=True, loglevel='INFO'):
+    """
+    Iterate over products of a search, page by page as they arrive
+
+    Parameters
+    ----------
+    search : query url (streamed with CDSE.json_stream) or CDSE response in json format (dict, first page)
+    follow_next_links : follow '@odata.nextLink' to the following pages (default=True)
+    loglevel : loglevel setting (default='INFO')
+
+    Yields
+    ------
+    product : product dictionary
+    """
+
+    if type(search) is str:
+        yield from CDSE_stream.stream_CDSE_products(search, follow_next_links=follow_next_links, loglevel=loglevel)
+    else:
+        max_pages = None if follow_next_links else 1
+        for page_json in CDSE_sd.iterate_CDSE_response_pages(search, max_pages=max_pages, loglevel=loglevel):
+            yield from page_json['value']
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def apply_stages(product, stages):
+    """
+    Pass product through filter/select stages
+
+    Parameters
+    ----------
+    product : product dictionary
+    stages : list of functions taking a product and returning a (possibly modified) product, or None to drop it
+
+    Returns
+    -------
+    product : product after all stages (None if dropped)
+    """
+
+    for stage in stages:
+        product = stage(product)
+        if product is None:
+            return None
+
+    return product
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def run_search_download_pipeline(
+    search,
+    download_dir,
+    username,
+    password,
+    stages = None,
+    queue_size = default_queue_size,
+    n_workers = 1,
+    follow_next_links = True,
+    loglevel = 'INFO',
+    **download_kwargs
+):
+    """
+    Search and download in a pipeline. Products are fed into a bounded download
+    queue as soon as they arrive from the (paginated) search, so the first
+    download starts before the search is finished. When the queue is full,
+    the search waits for the downloads (backpressure).
+
+    Parameters
+    ----------
+    search : query url (e.g. from CDSE.search_and_download.build_CDSE_query_url) or CDSE response in json format (dict)
+    download_dir : download directory
+    username : CDSE username
+    password : CDSE password
+    stages : list of filter/select functions applied to each product before download (default=None, no stages)
+             each function returns the (possibly modified) product, or None to drop it
+    queue_size : maximum number of products waiting for download (default=20)
+    n_workers : number of parallel download threads (default=1)
+    follow_next_links : follow '@odata.nextLink' to the following pages (default=True)
+    loglevel : loglevel setting (default='INFO')
+    download_kwargs : further arguments for CDSE.search_and_download.download_product_from_cdse
+
+    Returns
+    -------
+    results : dict with product name as key and True/False for succesful download as value
+    """
+
+    # remove default logger handler and add personal one
+    logger.remove()
+    logger.add(sys.stderr, level=loglevel)
+
+    if stages is None:
+        stages = []
+
+    download_queue = queue.Queue(maxsize=queue_size)
+    results = dict()
+    results_lock = threading.Lock()
+    stop = threading.Event()
+
+    # ------------------------ #
+
+    def produce():
+        n_found = 0
+        n_queued = 0
+        try:
+            for product in iterate_search_products(search, follow_next_links=follow_next_links, loglevel=loglevel):
+                n_found += 1
+                product = apply_stages(product, stages)
+                if product is None:
+                    continue
+                # blocks while the queue is full
+                while not stop.is_set():
+                    try:
+                        download_queue.put(product, timeout=1)
+                        n_queued += 1
+                        break
+                    except queue.Full:
+                        pass
+                if stop.is_set():
+                    break
+        except Exception as e:
+            logger.error(f"Search failed: {e}")
+        finally:
+            logger.info(f"Search finished: {n_queued} of {n_found} products queued for download")
+            for i in range(n_workers):
+                download_queue.put(_end_of_stream)
+
+    def consume():
+        while True:
+            product = download_queue.get()
+            if product is _end_of_stream:
+                break
+            try:
+                downloaded = CDSE_sd.download_product_from_cdse(product, download_dir, username, password, **download_kwargs)
+            except Exception as e:
+                logger.error(f"Download of {product['Name']} failed: {e}")
+                downloaded = False
+            with results_lock:
+                results[product['Name']] = bool(downloaded)
+
+    # ------------------------ #
+
+    producer = threading.Thread(target=produce, daemon=True)
+    consumers = [threading.Thread(target=consume, daemon=True) for i in range(n_workers)]
+
+    producer.start()
+    for consumer in consumers:
+        consumer.start()
+
+    try:
+        for consumer in consumers:
+            consumer.join()
+    except KeyboardInterrupt:
+        # daemon threads stop with the main thread
+        stop.set()
+        raise
+
+    producer.join()
+
+    n_downloaded = sum(results.values())
+    logger.info(f"Pipeline downloaded {n_downloaded} of {len(results)} products")
+
+    return results
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+# ---- End of <pipeline.py> ----
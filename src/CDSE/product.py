@@ -0,0 +1,316 @@
+# ---- This is <product.py> ----
+
+"""
+Compact product object model for CDSE search results.
+"""
+
+import sys
+import datetime
+
+from loguru import logger
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+# map attribute ValueType to OData type (used to rebuild 'Attributes' list)
+attribute_odata_types = {
+    'String': '#OData.CSC.StringAttribute',
+    'Integer': '#OData.CSC.IntegerAttribute',
+    'Double': '#OData.CSC.DoubleAttribute',
+    'DateTimeOffset': '#OData.CSC.DateTimeOffsetAttribute',
+    'Boolean': '#OData.CSC.BooleanAttribute',
+}
+
+# product keys that are stored directly (untyped) in Product slots
+plain_keys = [
+    'Id',
+    'Name',
+    'ContentType',
+    'ContentLength',
+    'Online',
+    'S3Path',
+    'Footprint',
+    'GeoFootprint',
+    'Checksum',
+    'Assets',
+]
+
+# product keys holding date strings
+date_keys = [
+    'OriginDate',
+    'PublicationDate',
+    'ModificationDate',
+    'EvictionDate',
+]
+
+# all product keys in to_dict order
+odata_keys = plain_keys + date_keys + ['ContentDate', 'Attributes']
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def parse_odata_datetime(date_string):
+    """
+    Parse OData datetime string (e.g. 2022-06-02T07:37:27.396Z) to datetime
+
+    Parameters
+    ----------
+    date_string : OData datetime string
+
+    Returns
+    -------
+    date : timezone aware datetime (or None)
+    """
+
+    if date_string is None or date_string == '':
+        return None
+
+    return datetime.datetime.fromisoformat(date_string.replace('Z', '+00:00'))
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def format_odata_datetime(date):
+    """
+    Format datetime as OData datetime string
+
+    Parameters
+    ----------
+    date : timezone aware datetime (or None)
+
+    Returns
+    -------
+    date_string : OData datetime string (or None)
+    """
+
+    if date is None:
+        return None
+
+    timespec = 'milliseconds' if date.microsecond % 1000 == 0 else 'microseconds'
+
+    return date.isoformat(timespec=timespec).replace('+00:00', 'Z')
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+class Product:
+    """
+    Single CDSE product with typed core fields and lazily decoded attributes.
+
+    Core fields are stored in slots (dates as datetime, ContentLength as int).
+    The 'Attributes' list is kept undecoded until the first attribute access,
+    when it is converted to a mapping from attribute name to value.
+    Products support read access by OData key (product['Name']), so they
+    can be used wherever a product dict is expected. Only keys present in
+    the source dict are listed (e.g. 'Assets' only for expanded assets).
+    """
+
+    __slots__ = [
+        'Id',
+        'Name',
+        'ContentType',
+        'ContentLength',
+        'Online',
+        'S3Path',
+        'Footprint',
+        'GeoFootprint',
+        'Checksum',
+        'Assets',
+        'OriginDate',
+        'PublicationDate',
+        'ModificationDate',
+        'EvictionDate',
+        'ContentStart',
+        'ContentEnd',
+        '_raw_attributes',
+        '_attributes',
+        '_attribute_types',
+        '_footprint_geometry',
+        '_present_keys',
+    ]
+
+    def __init__(self, product_dict):
+
+        for key in plain_keys:
+            setattr(self, key, product_dict.get(key))
+
+        if self.ContentLength is not None:
+            self.ContentLength = int(self.ContentLength)
+
+        for key in date_keys:
+            setattr(self, key, parse_odata_datetime(product_dict.get(key)))
+
+        content_date = product_dict.get('ContentDate') or {}
+        self.ContentStart = parse_odata_datetime(content_date.get('Start'))
+        self.ContentEnd = parse_odata_datetime(content_date.get('End'))
+
+        self._raw_attributes = product_dict.get('Attributes')
+        self._attributes = None
+        self._attribute_types = None
+        self._footprint_geometry = None
+
+        # bit mask of the keys in odata_keys that are present in product_dict,
+        # followed by the date keys given as empty string (e.g. 'EvictionDate': '')
+        self._present_keys = sum(1 << i for i, key in enumerate(odata_keys) if key in product_dict)
+        self._present_keys |= sum(1 << (len(odata_keys) + i) for i, key in enumerate(date_keys) if product_dict.get(key) == '')
+
+    # ------------------------ #
+
+    @property
+    def attributes(self):
+        """
+        Mapping from attribute name to value (decoded on first access)
+        """
+
+        if self._attributes is None:
+            self._decode_attributes()
+
+        return self._attributes
+
+    def _decode_attributes(self):
+        attributes = dict()
+        attribute_types = dict()
+
+        for attribute in self._raw_attributes or []:
+            name = sys.intern(attribute['Name'])
+            attributes[name] = attribute.get('Value')
+            attribute_types[name] = attribute.get('ValueType')
+
+        self._attributes = attributes
+        self._attribute_types = attribute_types
+
+        # drop the raw list, it can be rebuilt from the mapping
+        self._raw_attributes = None
+
+    def get_attribute(self, name, default=None):
+        """
+        Get single attribute value by name
+
+        Parameters
+        ----------
+        name : attribute name (e.g. 'cloudCover', 'relativeOrbitNumber')
+        default : value returned if attribute does not exist (default=None)
+
+        Returns
+        -------
+        value : attribute value
+        """
+
+        return self.attributes.get(name, default)
+
+    # ------------------------ #
+
+    @property
+    def footprint(self):
+        """
+        Product footprint as shapely geometry (parsed on first access)
+        """
+
+        if self._footprint_geometry is None and self.Footprint:
+            from shapely.wkt import loads
+            self._footprint_geometry = loads(self.Footprint.split(';')[1].strip("'"))
+
+        return self._footprint_geometry
+
+    # ------------------------ #
+
+    def _attribute_list(self):
+        if self._attributes is None:
+            return self._raw_attributes
+
+        return [
+            {
+                '@odata.type': attribute_odata_types.get(self._attribute_types[name]),
+                'Name': name,
+                'Value': value,
+                'ValueType': self._attribute_types[name],
+            }
+            for name, value in self._attributes.items()
+        ]
+
+    def _is_present(self, key):
+        return key in odata_keys and bool(self._present_keys >> odata_keys.index(key) & 1)
+
+    def __getitem__(self, key):
+        if not self._is_present(key):
+            raise KeyError(key)
+        if key in plain_keys:
+            return getattr(self, key)
+        if key in date_keys:
+            if self._present_keys >> (len(odata_keys) + date_keys.index(key)) & 1:
+                return ''
+            return format_odata_datetime(getattr(self, key))
+        if key == 'ContentDate':
+            return {
+                'Start': format_odata_datetime(self.ContentStart),
+                'End': format_odata_datetime(self.ContentEnd),
+            }
+        if key == 'Attributes':
+            return self._attribute_list()
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return self._is_present(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return [key for key in odata_keys if self._is_present(key)]
+
+    def to_dict(self):
+        """
+        Convert product back to OData product dictionary
+
+        Returns
+        -------
+        product_dict : product dictionary
+        """
+
+        return {key: self[key] for key in self.keys()}
+
+    def __repr__(self):
+        return f"Product(Name='{self.Name}', Id='{self.Id}')"
+
+    def __eq__(self, other):
+        return isinstance(other, Product) and other.Id == self.Id
+
+    def __hash__(self):
+        return hash(self.Id)
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def get_products_from_response_json(response_json):
+    """
+    Convert products in CDSE response in json format (dict) to Product objects
+
+    Parameters
+    ----------
+    response_json : CDSE response in json format (dict)
+
+    Returns
+    -------
+    products : list of Product objects
+    """
+
+    # initalize empty list
+    products = []
+
+    if type(response_json) is not dict or 'value' not in response_json.keys():
+        logger.error(f"Expected CDSE response dict with 'value' key")
+        return products
+
+    products = [Product(product) for product in response_json['value']]
+
+    logger.debug(f"Converted {len(products)} products")
+
+    return products
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+# ---- End of <product.py> ----
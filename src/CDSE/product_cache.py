@@ -0,0 +1,360 @@
+# ---- This is <product_cache.py> ----
+
+"""
+Shared, content-addressed product cache with hardlink/reflink materialization
+and size-budget LRU eviction.
+"""
+
+import os
+import time
+import errno
+import fcntl
+import shutil
+import sqlite3
+import pathlib
+
+from loguru import logger
+
+import CDSE.download_lock as CDSE_lock
+import CDSE.search_and_download as CDSE_sd
+import CDSE.sinks as CDSE_sinks
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+# ways of materializing cached products in a download directory
+valid_link_modes = ['hardlink', 'reflink', 'copy']
+
+# Linux FICLONE ioctl (reflink on btrfs, xfs, ...)
+FICLONE = 0x40049409
+
+# pins of products in use expire after this many seconds (e.g. after a crash)
+default_pin_seconds = 3600
+
+_schema = """
+CREATE TABLE IF NOT EXISTS objects (
+    key TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pins (
+    key TEXT NOT NULL,
+    owner TEXT NOT NULL,
+    expires REAL NOT NULL,
+    PRIMARY KEY (key, owner)
+);
+"""
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def get_product_md5(product):
+    """
+    MD5 checksum of a product zip from its 'Checksum' list (None if not available)
+    """
+
+    for checksum in product.get('Checksum') or []:
+        if checksum.get('Algorithm') == 'MD5' and checksum.get('Value'):
+            return checksum['Value']
+
+    return None
+
+def get_product_cache_key(product):
+    """
+    Cache key of a product: product Id and (if available) MD5 checksum
+
+    Parameters
+    ----------
+    product : product dictionary or CDSE.product.Product
+
+    Returns
+    -------
+    key : cache key
+    """
+
+    md5 = get_product_md5(product)
+    if md5 is not None:
+        return f"{product['Id']}_{md5}"
+
+    return product['Id']
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def link_or_copy(source_path, target_path, link_mode='hardlink'):
+    """
+    Materialize file at target_path by hardlink, reflink or copy.
+    Falls back to a copy if linking is not possible (e.g. across file systems).
+
+    Returns
+    -------
+    method : method that was used ('hardlink', 'reflink' or 'copy')
+    """
+
+    if link_mode == 'hardlink':
+        try:
+            os.link(source_path, target_path)
+            return 'hardlink'
+        except OSError as e:
+            if e.errno not in [errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP]:
+                raise
+
+    if link_mode == 'reflink':
+        with open(source_path, 'rb') as src, open(target_path, 'wb') as dst:
+            try:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+                return 'reflink'
+            except OSError:
+                pass
+        os.unlink(target_path)
+
+    shutil.copyfile(source_path, target_path)
+
+    return 'copy'
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+class ProductCache:
+    """
+    Product zips shared between several download directories on one file system.
+
+    Each product is stored once under its cache key (Id and checksum) and
+    linked into requesting download directories. When the products held only
+    by the cache exceed its size budget, least recently used products are
+    evicted. Products still hardlinked into a download directory share their
+    disk space with it and are not counted (nor evicted) until all of those
+    copies are deleted. Pinned products (being downloaded or materialized)
+    are protected from eviction. Downloads are verified against
+    the MD5 checksum of the key. Product files without database entry
+    (e.g. after a crash before the entry was written) are registered when
+    the cache is opened, so they can be evicted.
+    """
+
+    def __init__(self, cache_dir, max_size, link_mode='hardlink'):
+
+        if link_mode not in valid_link_modes:
+            raise ValueError(f"'link_mode' must be one of {valid_link_modes}")
+
+        self.cache_dir = pathlib.Path(cache_dir).resolve()
+        self.objects_dir = self.cache_dir / 'objects'
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        self.db_path = self.cache_dir / 'cache.db'
+        self.max_size = max_size
+        self.link_mode = link_mode
+        self.owner = f"{os.uname().nodename}:{os.getpid()}"
+
+        con = self._connect()
+        try:
+            con.execute("PRAGMA journal_mode=WAL")
+            con.executescript(_schema)
+        finally:
+            con.close()
+
+        self._register_orphans()
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=60, isolation_level=None)
+
+    def object_path(self, key):
+        return self.objects_dir / f"{key}.zip"
+
+    def _register_orphans(self):
+        # product files without database entry, added with their mtime as last access
+        con = self._connect()
+        try:
+            keys = set(row[0] for row in con.execute("SELECT key FROM objects"))
+            rows = []
+            for object_path in self.objects_dir.glob('*.zip'):
+                key = object_path.name[:-len('.zip')]
+                if key in keys:
+                    continue
+                try:
+                    stat = object_path.stat()
+                except FileNotFoundError:
+                    continue
+                rows.append((key, key, stat.st_size, stat.st_mtime, stat.st_mtime))
+            if rows:
+                con.executemany(
+                    "INSERT OR IGNORE INTO objects (key, name, size, created, last_access) VALUES (?, ?, ?, ?, ?)",
+                    rows
+                )
+                logger.warning(f"Registered {len(rows)} cached products without database entry")
+        finally:
+            con.close()
+
+    # ------------------------ #
+
+    def pin(self, key, seconds=default_pin_seconds):
+        """
+        Protect cached product from eviction (pin expires after 'seconds')
+        """
+
+        con = self._connect()
+        try:
+            con.execute("INSERT OR REPLACE INTO pins (key, owner, expires) VALUES (?, ?, ?)", (key, self.owner, time.time() + seconds))
+        finally:
+            con.close()
+
+    def unpin(self, key):
+        """
+        Remove pin of this process from cached product
+        """
+
+        con = self._connect()
+        try:
+            con.execute("DELETE FROM pins WHERE key = ? AND owner = ?", (key, self.owner))
+        finally:
+            con.close()
+
+    def _touch(self, key, name, size=None):
+        now = time.time()
+        con = self._connect()
+        try:
+            if size is None:
+                con.execute("UPDATE objects SET last_access = ? WHERE key = ?", (now, key))
+            else:
+                con.execute(
+                    "INSERT OR REPLACE INTO objects (key, name, size, created, last_access) VALUES (?, ?, ?, ?, ?)",
+                    (key, name, size, now, now)
+                )
+        finally:
+            con.close()
+
+    def __contains__(self, product):
+        return self.object_path(get_product_cache_key(product)).is_file()
+
+    # ------------------------ #
+
+    def fetch(self, product, download_zip_path, username, password, chunk_size=None, event_callback=None, fsync_policy='none'):
+        """
+        Materialize product zip at download_zip_path, downloading it into the cache on a miss
+
+        Parameters
+        ----------
+        product : product dictionary or CDSE.product.Product
+        download_zip_path : target path of the product zip
+        username : CDSE username
+        password : CDSE password
+        chunk_size : download buffer size in bytes (default=None, auto-tuned)
+        event_callback : function called with a dict for download events (default=None)
+        fsync_policy : when to fsync the downloaded file, 'none', 'end' or 'interval' (default='none')
+
+        Returns
+        -------
+        downloaded : True/False for succesful download
+        """
+
+        key = get_product_cache_key(product)
+        object_path = self.object_path(key)
+        download_zip_path = pathlib.Path(download_zip_path)
+
+        self.pin(key)
+        try:
+            if object_path.is_file():
+                logger.info(f"Product found in cache: {product['Name']}")
+                self._touch(key, product['Name'])
+            else:
+                # only one requester downloads a missing product into the cache
+                with CDSE_lock.ProductDownloadLock(self.objects_dir, key):
+                    if not object_path.is_file():
+                        logger.info(f"Product not in cache, downloading: {product['Name']}")
+                        # the checksum of the key is verified before the file is renamed into the cache
+                        sink = CDSE_sinks.FileSink(object_path, fsync_policy=fsync_policy, expected_md5=get_product_md5(product))
+                        if not CDSE_sd.download_product_to_sink(product, sink, username, password, overwrite=True, chunk_size=chunk_size, event_callback=event_callback):
+                            return False
+                        self._touch(key, product['Name'], object_path.stat().st_size)
+
+            download_zip_path.unlink(missing_ok=True)
+            method = link_or_copy(object_path, download_zip_path, self.link_mode)
+            logger.debug(f"Materialized {download_zip_path} from cache ({method})")
+        finally:
+            self.unpin(key)
+
+        self.evict()
+
+        return True
+
+    # ------------------------ #
+
+    def get_size(self):
+        """
+        Total size of cached products in bytes (including products linked into
+        download directories, see evict)
+        """
+
+        con = self._connect()
+        try:
+            return con.execute("SELECT COALESCE(SUM(size), 0) FROM objects").fetchone()[0]
+        finally:
+            con.close()
+
+    def evict(self, max_size=None):
+        """
+        Evict least recently used products until the products held only by the
+        cache fit into max_size. Products still linked into a download directory
+        (hardlink mode) are not counted, removing them from the cache would free no
+        space; they count again once all download directory copies are deleted.
+        Pinned products are kept.
+
+        Parameters
+        ----------
+        max_size : size budget in bytes (default=None, cache budget)
+
+        Returns
+        -------
+        freed : number of freed bytes
+        """
+
+        max_size = self.max_size if max_size is None else max_size
+        freed = 0
+
+        con = self._connect()
+        try:
+            con.execute("BEGIN IMMEDIATE")
+            con.execute("DELETE FROM pins WHERE expires < ?", (time.time(),))
+            pinned = set(row[0] for row in con.execute("SELECT key FROM pins"))
+
+            # products held only by the cache, least recently used first
+            candidates = []
+            for key, size in con.execute("SELECT key, size FROM objects ORDER BY last_access").fetchall():
+                try:
+                    n_links = self.object_path(key).stat().st_nlink
+                except FileNotFoundError:
+                    con.execute("DELETE FROM objects WHERE key = ?", (key,))
+                    continue
+                if n_links == 1:
+                    candidates.append((key, size))
+            total_size = sum(size for key, size in candidates)
+
+            for key, size in candidates:
+                if total_size <= max_size:
+                    break
+                if key in pinned:
+                    continue
+                self.object_path(key).unlink(missing_ok=True)
+                con.execute("DELETE FROM objects WHERE key = ?", (key,))
+                total_size -= size
+                freed += size
+                logger.debug(f"Evicted {key} from cache")
+
+            if total_size > max_size:
+                logger.warning(f"Cache size {total_size} exceeds budget {max_size}, remaining products are pinned")
+
+            con.execute("COMMIT")
+        finally:
+            if con.in_transaction:
+                con.execute("ROLLBACK")
+            con.close()
+
+        if freed:
+            logger.info(f"Evicted {freed} bytes from product cache")
+
+        return freed
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+# ---- End of <product_cache.py> ----
@@ -0,0 +1,317 @@
+# ---- This is <product_store.py> ----
+
+"""
+Append-only JSON-lines product store with sidecar offset index.
+"""
+
+import os
+import mmap
+import json
+import fcntl
+import pathlib
+import contextlib
+
+from loguru import logger
+
+import CDSE.json_utils as CDSE_json
+import CDSE.product as CDSE_product
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+# suffixes of the sidecar files next to the JSON-lines file
+index_suffix = '.idx'
+lock_suffix = '.lock'
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+class ProductStore:
+    """
+    Append-only store of product records in a JSON-lines file.
+
+    Each product is written as one line. A sidecar index file holds one
+    tab-separated line per product (Id, Name, byte offset, length), so
+    single products can be read from the memory-mapped data file by Id or
+    Name without parsing the rest. Appends are serialized with an exclusive
+    file lock, so several processes can write to the same store.
+    """
+
+    def __init__(self, store_path):
+
+        self.store_path = pathlib.Path(store_path).resolve()
+        self.index_path = self.store_path.with_name(self.store_path.name + index_suffix)
+        self.lock_path = self.store_path.with_name(self.store_path.name + lock_suffix)
+
+        if not self.store_path.parent.is_dir():
+            raise FileNotFoundError(f"Could not find store directory {self.store_path.parent}")
+
+        self.store_path.touch(exist_ok=True)
+        self.index_path.touch(exist_ok=True)
+
+        # Id -> (offset, length), Name -> Id
+        self._offsets = dict()
+        self._names = dict()
+        self._index_position = 0
+        self._indexed_end = 0
+
+        self._mmap = None
+        self._mmap_size = 0
+
+        with self._locked():
+            self._read_index()
+            self._repair_index()
+
+    # ------------------------ #
+
+    @contextlib.contextmanager
+    def _locked(self):
+        with open(self.lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _add_index_entry(self, product_id, product_name, offset, length):
+        self._offsets[product_id] = (offset, length)
+        self._names[product_name] = product_id
+        self._indexed_end = max(self._indexed_end, offset + length)
+
+    def _read_index(self):
+        # read index lines appended since the last call
+        with open(self.index_path, 'rb') as f:
+            f.seek(self._index_position)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                product_id, product_name, offset, length = line.decode().rstrip('\n').split('\t')
+                self._add_index_entry(product_id, product_name, int(offset), int(length))
+                self._index_position += len(line)
+
+    def _repair_index(self):
+        # index records written to the data file but missing from the index (e.g. after a crash)
+        data_size = self.store_path.stat().st_size
+        if data_size <= self._indexed_end:
+            return
+
+        logger.warning(f"Indexing {data_size - self._indexed_end} bytes missing from {self.index_path}")
+
+        index_lines = []
+        with open(self.store_path, 'rb') as f:
+            f.seek(self._indexed_end)
+            offset = self._indexed_end
+            for line in f:
+                if not line.endswith(b'\n'):
+                    # truncated last record, drop it
+                    os.truncate(self.store_path, offset)
+                    break
+                product = json.loads(line)
+                index_lines.append(f"{product['Id']}\t{product['Name']}\t{offset}\t{len(line)}\n")
+                offset += len(line)
+
+        self._append_index_lines(index_lines)
+
+    def _append_index_lines(self, index_lines):
+        # called under the lock, after _read_index: a torn last line (e.g. after a crash)
+        # is cut off, so the new lines do not merge with it
+        if self.index_path.stat().st_size > self._index_position:
+            logger.warning(f"Dropping incomplete last line of {self.index_path}")
+            os.truncate(self.index_path, self._index_position)
+        with open(self.index_path, 'a') as f:
+            f.writelines(index_lines)
+        self._read_index()
+
+    # ------------------------ #
+
+    def append(self, product):
+        """
+        Append single product to the store (skipped if the Id already exists)
+
+        Parameters
+        ----------
+        product : product dictionary or CDSE.product.Product
+
+        Returns
+        -------
+        appended : True/False
+        """
+
+        return self.append_products([product]) == 1
+
+    def append_products(self, product_list, fsync=False):
+        """
+        Append list of products to the store (products with existing Id are skipped)
+
+        Parameters
+        ----------
+        product_list : list of product dictionaries or CDSE.product.Product objects
+        fsync : flush data to disk before updating the index (default=False)
+
+        Returns
+        -------
+        n_appended : number of appended products
+        """
+
+        with self._locked():
+            # pick up records appended by other writers (and left unindexed by crashed writers)
+            self._read_index()
+            self._repair_index()
+
+            records = []
+            new_ids = set()
+            for product in product_list:
+                if isinstance(product, CDSE_product.Product):
+                    product = product.to_dict()
+                if product['Id'] in self._offsets or product['Id'] in new_ids:
+                    continue
+                new_ids.add(product['Id'])
+                line = (json.dumps(product, separators=(',', ':')) + '\n').encode()
+                records.append((product['Id'], product['Name'], line))
+
+            if not records:
+                return 0
+
+            index_lines = []
+            with open(self.store_path, 'ab') as f:
+                offset = f.seek(0, os.SEEK_END)
+                for product_id, product_name, line in records:
+                    f.write(line)
+                    index_lines.append(f"{product_id}\t{product_name}\t{offset}\t{len(line)}\n")
+                    offset += len(line)
+                f.flush()
+                if fsync:
+                    os.fsync(f.fileno())
+
+            self._append_index_lines(index_lines)
+
+        logger.debug(f"Appended {len(records)} products to {self.store_path}")
+
+        return len(records)
+
+    # ------------------------ #
+
+    def refresh(self):
+        """
+        Load index entries appended by other processes
+        """
+
+        self._read_index()
+
+    def _read_record(self, offset, length):
+        if self._mmap is None or offset + length > self._mmap_size:
+            if self._mmap is not None:
+                self._mmap.close()
+            with open(self.store_path, 'rb') as f:
+                self._mmap_size = os.fstat(f.fileno()).st_size
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return json.loads(self._mmap[offset:offset+length])
+
+    def get(self, key, as_product=False):
+        """
+        Get single product by Id or Name
+
+        Parameters
+        ----------
+        key : product Id or Name
+        as_product : return CDSE.product.Product instead of dict (default=False)
+
+        Returns
+        -------
+        product : product dictionary or Product (None if not found)
+        """
+
+        product_id = key if key in self._offsets else self._names.get(key)
+        if product_id is None:
+            self.refresh()
+            product_id = key if key in self._offsets else self._names.get(key)
+            if product_id is None:
+                return None
+
+        product = self._read_record(*self._offsets[product_id])
+
+        return CDSE_product.Product(product) if as_product else product
+
+    def __contains__(self, key):
+        return key in self._offsets or key in self._names
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def ids(self):
+        """
+        List of all product Ids in the store
+        """
+
+        return list(self._offsets.keys())
+
+    def names(self):
+        """
+        List of all product Names in the store
+        """
+
+        return list(self._names.keys())
+
+    def iterate_products(self, as_product=False):
+        """
+        Iterate over all products in the store (in order of appending)
+
+        Parameters
+        ----------
+        as_product : yield CDSE.product.Product instead of dict (default=False)
+
+        Yields
+        ------
+        product : product dictionary or Product
+        """
+
+        for offset, length in sorted(self._offsets.values()):
+            product = self._read_record(offset, length)
+            yield CDSE_product.Product(product) if as_product else product
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def add_response_json_files_to_store(json_path_list, store_path):
+    """
+    Import products from saved CDSE response json files into a product store
+
+    Parameters
+    ----------
+    json_path_list : list of paths to json files (written with CDSE.json_utils.write_response_dict_2_json)
+    store_path : path to JSON-lines product store
+
+    Returns
+    -------
+    n_appended : number of new products added to the store
+    """
+
+    n_appended = 0
+
+    with ProductStore(store_path) as store:
+        for json_path in json_path_list:
+            response_json = CDSE_json.read_response_dict_from_json(json_path)
+            if type(response_json) is not dict or 'value' not in response_json.keys():
+                logger.warning(f"Skipping {json_path}, no CDSE response found")
+                continue
+            n_appended += store.append_products(response_json['value'])
+
+    logger.info(f"Added {n_appended} new products to {store_path}")
+
+    return n_appended
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+# ---- End of <product_store.py> ----
@@ -0,0 +1,239 @@
+# ---- This is <quicklook.py> ----
+
+"""
+Concurrent quicklook fetching with an on-disk cache, for screening products before download.
+"""
+
+import os
+import sys
+import pathlib
+import threading
+import concurrent.futures
+
+from loguru import logger
+
+import requests
+
+import CDSE.access_token_credentials as CDSE_atc
+import CDSE.search_and_download as CDSE_sd
+import CDSE.tracing as CDSE_tracing
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+# default location of the quicklook cache
+default_cache_dir = pathlib.Path(
+    os.environ.get("CDSE_QUICKLOOK_DIR", pathlib.Path.home() / '.cache' / 'CDSE' / 'quicklooks')
+)
+
+# default number of parallel requests
+default_n_threads = 8
+
+# asset type of quicklooks in the OData 'Assets' list
+quicklook_asset_type = 'QUICKLOOK'
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def get_quicklook_asset(product):
+    """
+    Quicklook asset of a product found with expand_assets=True
+
+    Parameters
+    ----------
+    product : product dictionary or CDSE.product.Product
+
+    Returns
+    -------
+    asset : asset dictionary (None if the product has no quicklook or its assets are not listed)
+    """
+
+    for asset in product.get('Assets') or []:
+        if asset.get('Type') == quicklook_asset_type:
+            return asset
+
+    return None
+
+def get_quicklook_url(asset):
+    """
+    Download url of a quicklook asset
+    """
+
+    return asset.get('DownloadLink') or f"{CDSE_sd.assets_url}({asset['Id']})/$value"
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+class QuicklookCache:
+    """
+    Quicklook images on disk, one file per product Id (in subdirectories of
+    the first two Id characters). Files are written under a temporary name
+    and renamed when complete, so concurrent fetchers never see partial files.
+    """
+
+    def __init__(self, cache_dir=default_cache_dir):
+        self.cache_dir = pathlib.Path(cache_dir)
+
+    def get_path(self, product_id):
+        """
+        Path of the cached quicklook of a product (may not exist)
+        """
+
+        return self.cache_dir / product_id[:2] / f"{product_id}.jpg"
+
+    def get(self, product_id):
+        """
+        Path of the cached quicklook of a product (None if not cached)
+        """
+
+        path = self.get_path(product_id)
+
+        return path if path.is_file() else None
+
+    def put(self, product_id, data):
+        """
+        Store a quicklook image
+
+        Returns
+        -------
+        path : path of the cached quicklook
+        """
+
+        path = self.get_path(product_id)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        return path
+
+    def __contains__(self, product_id):
+        return self.get_path(product_id).is_file()
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def _get_assets(product, session):
+    # assets of a product searched without expand_assets
+    url = f"{CDSE_sd.catalogue_url}({product['Id']})?$expand=Assets"
+    response = CDSE_tracing.request('GET', url, session=session)
+    response.raise_for_status()
+    with CDSE_tracing.span('json_decode'):
+        return response.json().get('Assets') or []
+
+def _fetch_quicklook(product, cache, session, username, password):
+    # fetch one quicklook into the cache, returns its path (None if not available)
+    asset = get_quicklook_asset(product)
+    if asset is None and product.get('Assets') is None:
+        for candidate in _get_assets(product, session):
+            if candidate.get('Type') == quicklook_asset_type:
+                asset = candidate
+                break
+
+    if asset is None:
+        logger.debug(f"No quicklook: {product['Name']}")
+        return None
+
+    headers = dict()
+    if username is not None:
+        headers['Authorization'] = f"Bearer {CDSE_atc.get_cached_access_token(username, password)}"
+
+    response = CDSE_tracing.request('GET', get_quicklook_url(asset), session=session, headers=headers)
+
+    if response.status_code != 200:
+        logger.error(f"Quicklook request failed with status {response.status_code}: {product['Name']}")
+        if response.status_code == 401 and username is not None:
+            CDSE_atc.invalidate_cached_access_token(username)
+        return None
+
+    return cache.put(product['Id'], response.content)
+
+def fetch_quicklooks(
+    product_list,
+    username = None,
+    password = None,
+    cache_dir = default_cache_dir,
+    n_threads = default_n_threads,
+    overwrite = False,
+    session = None,
+    loglevel = 'INFO'
+):
+    """
+    Fetch the quicklooks of a product list concurrently over a shared HTTP session.
+    Quicklooks are cached on disk by product Id, cached quicklooks are not fetched again.
+    Products searched with expand_assets=True need one request per quicklook,
+    other products an additional request for their asset list.
+
+    Parameters
+    ----------
+    product_list : list of product dictionaries or CDSE.product.Product
+    username : CDSE username (default=None, no access token is sent)
+    password : CDSE password (default=None)
+    cache_dir : quicklook cache directory (default=~/.cache/CDSE/quicklooks or CDSE_QUICKLOOK_DIR)
+    n_threads : number of parallel requests (default=8)
+    overwrite : fetch quicklooks that are already cached (default=False)
+    session : requests.Session to use (default=None, a session is created for this call)
+    loglevel : loglevel setting (default='INFO')
+
+    Returns
+    -------
+    results : list of (product, quicklook path) tuples in the order of product_list,
+              the path is None for products without quicklook or failed requests
+    """
+
+    # remove default logger handler and add personal one
+    logger.remove()
+    logger.add(sys.stderr, level=loglevel)
+
+    cache = QuicklookCache(cache_dir)
+
+    paths = [None if overwrite else cache.get(product['Id']) for product in product_list]
+    missing = [i for i, path in enumerate(paths) if path is None]
+
+    logger.info(f"{len(product_list) - len(missing)} of {len(product_list)} quicklooks are cached")
+
+    if not missing:
+        return list(zip(product_list, paths))
+
+    # a rejected token request fails all requests, check it once before fetching
+    if username is not None:
+        try:
+            CDSE_atc.get_cached_access_token(username, password)
+        except (CDSE_atc.TokenRequestError, requests.exceptions.RequestException) as e:
+            logger.error(f"Could not get access token, no quicklooks fetched: {e}")
+            return list(zip(product_list, paths))
+
+    own_session = session is None
+    if own_session:
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=n_threads)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+
+    def fetch(i):
+        try:
+            return _fetch_quicklook(product_list[i], cache, session, username, password)
+        except (CDSE_atc.TokenRequestError, requests.exceptions.RequestException, ValueError, OSError) as e:
+            logger.error(f"Could not fetch quicklook of {product_list[i]['Name']}: {e}")
+            return None
+
+    try:
+        with CDSE_tracing.span('fetch_quicklooks') as span:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=n_threads) as executor:
+                for i, path in zip(missing, executor.map(fetch, missing)):
+                    paths[i] = path
+            span.set(n_fetched=len(missing))
+    finally:
+        if own_session:
+            session.close()
+
+    n_failed = sum(paths[i] is None for i in missing)
+    logger.info(f"Fetched {len(missing) - n_failed} quicklooks, {n_failed} not available")
+
+    return list(zip(product_list, paths))
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+# ---- End of <quicklook.py> ----
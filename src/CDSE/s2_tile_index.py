@@ -0,0 +1,496 @@
+# ---- This is <s2_tile_index.py> ----
+
+"""
+Offline index of the Sentinel-2 MGRS tile grid: AOI to S2 tile IDs.
+"""
+
+import os
+import math
+import shutil
+import pathlib
+import argparse
+import tempfile
+import threading
+
+import numpy as np
+from loguru import logger
+
+import CDSE.aoi_cache as CDSE_aoi_cache
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+# index directory (the index is built on first use, takes a few seconds)
+index_version = 1
+default_index_dir = pathlib.Path(
+    os.environ.get("CDSE_S2_TILE_INDEX", pathlib.Path.home() / '.cache' / 'CDSE' / f"s2_tile_index_v{index_version}")
+)
+
+# S2 tiles are 109.8 km squares, aligned with the upper left corner of a 100 km MGRS square
+tile_size = 109800
+square_size = 100000
+
+# MGRS latitude bands (8 degrees, X is 12 degrees) and 100 km square letters
+latitude_bands = 'CDEFGHJKLMNPQRSTUVWX'
+column_letters = ['ABCDEFGH', 'JKLMNPQR', 'STUVWXYZ']
+row_letters = 'ABCDEFGHJKLMNPQRSTUV'
+
+# cell size of the lookup grid in degrees
+cell_degrees = 1
+
+# WGS84 and UTM constants (Krueger series, order n^3)
+_a = 6378137.0
+_f = 1 / 298.257223563
+_k0 = 0.9996
+_n = _f / (2 - _f)
+_A = _a / (1 + _n) * (1 + _n**2 / 4 + _n**4 / 64)
+_alpha = (_n / 2 - 2 * _n**2 / 3 + 5 * _n**3 / 16, 13 * _n**2 / 48 - 3 * _n**3 / 5, 61 * _n**3 / 240)
+_beta = (_n / 2 - 2 * _n**2 / 3 + 37 * _n**3 / 96, _n**2 / 48 + _n**3 / 15, 17 * _n**3 / 480)
+_delta = (2 * _n - 2 * _n**2 / 3 - 2 * _n**3, 7 * _n**2 / 3 - 8 * _n**3 / 5, 56 * _n**3 / 15)
+_c = 2 * math.sqrt(_n) / (1 + _n)
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def utm_forward(lon, lat, zone, south=False):
+    """
+    Project lon/lat (degrees, arrays) to UTM easting/northing of a zone
+    """
+
+    lam = np.radians(lon) - math.radians(zone * 6 - 183)
+    sin_phi = np.sin(np.radians(lat))
+    t = np.sinh(np.arctanh(sin_phi) - _c * np.arctanh(_c * sin_phi))
+    xi = np.arctan2(t, np.cos(lam))
+    eta = np.arctanh(np.sin(lam) / np.sqrt(1 + t * t))
+
+    easting = eta.copy()
+    northing = xi.copy()
+    for j, alpha in enumerate(_alpha, start=1):
+        easting += alpha * np.cos(2 * j * xi) * np.sinh(2 * j * eta)
+        northing += alpha * np.sin(2 * j * xi) * np.cosh(2 * j * eta)
+
+    return 500000 + _k0 * _A * easting, (10000000 if south else 0) + _k0 * _A * northing
+
+def utm_inverse(easting, northing, zone, south=False):
+    """
+    Unproject UTM easting/northing (arrays) of a zone to lon/lat (degrees)
+    """
+
+    xi = (northing - (10000000 if south else 0)) / (_k0 * _A)
+    eta = (easting - 500000) / (_k0 * _A)
+
+    xi_prime = xi.copy()
+    eta_prime = eta.copy()
+    for j, beta in enumerate(_beta, start=1):
+        xi_prime -= beta * np.sin(2 * j * xi) * np.cosh(2 * j * eta)
+        eta_prime -= beta * np.cos(2 * j * xi) * np.sinh(2 * j * eta)
+
+    chi = np.arcsin(np.sin(xi_prime) / np.cosh(eta_prime))
+    phi = chi.copy()
+    for j, delta in enumerate(_delta, start=1):
+        phi += delta * np.sin(2 * j * chi)
+
+    lon = zone * 6 - 183 + np.degrees(np.arctan2(np.sinh(eta_prime), np.cos(xi_prime)))
+
+    return lon, np.degrees(phi)
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def get_grid_zone_extent(zone, band):
+    """
+    Lon/lat extent of an MGRS grid zone (with the Norway and Svalbard exceptions)
+
+    Returns
+    -------
+    extent : (lon_min, lon_max, lat_min, lat_max), None if the grid zone does not exist
+    """
+
+    band_index = latitude_bands.index(band)
+    lat_min = -80 + 8 * band_index
+    lat_max = 84 if band == 'X' else lat_min + 8
+    lon_min = zone * 6 - 186
+    lon_max = lon_min + 6
+
+    if band == 'V' and zone == 31:
+        lon_max = 3
+    elif band == 'V' and zone == 32:
+        lon_min = 3
+    elif band == 'X' and zone in (32, 34, 36):
+        return None
+    elif band == 'X' and zone in (31, 33, 35, 37):
+        lon_min = {31: 0, 33: 9, 35: 21, 37: 33}[zone]
+        lon_max = {31: 9, 33: 21, 35: 33, 37: 42}[zone]
+
+    return lon_min, lon_max, lat_min, lat_max
+
+def _grid_zone_samples(extent, edge_step=0.01, interior_step=0.25):
+    # dense samples along the edges and coarse samples inside of a grid zone
+    lon_min, lon_max, lat_min, lat_max = extent
+    lons = np.linspace(lon_min, lon_max, int(round((lon_max - lon_min) / edge_step)) + 1)
+    lats = np.linspace(lat_min, lat_max, int(round((lat_max - lat_min) / edge_step)) + 1)
+    interior_lon, interior_lat = np.meshgrid(
+        np.arange(lon_min, lon_max, interior_step),
+        np.arange(lat_min, lat_max, interior_step)
+    )
+    lon = np.concatenate([lons, lons, np.full_like(lats, lon_min), np.full_like(lats, lon_max), interior_lon.ravel()])
+    lat = np.concatenate([np.full_like(lons, lat_min), np.full_like(lons, lat_max), lats, lats, interior_lat.ravel()])
+    return lon, lat
+
+def _tile_outlines(columns, rows, n_per_edge=8):
+    # easting/northing samples (n_tiles, 4 * (n_per_edge + 1)) along the outlines of the tiles of 100 km squares,
+    # clockwise from the upper left corner
+    x0 = columns[:, None] * square_size
+    y1 = (rows[:, None] + 1) * square_size
+    s = np.linspace(0, tile_size, n_per_edge + 1)[None, :]
+    ones = np.ones_like(s)
+    easting = np.concatenate([x0 + s, (x0 + tile_size) * ones, x0 + tile_size - s, x0 * ones], axis=1)
+    northing = np.concatenate([y1 * ones, y1 - s, (y1 - tile_size) * ones, y1 - tile_size + s], axis=1)
+    return easting, northing
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def build_s2_tile_index(index_dir=default_index_dir):
+    """
+    Build the tile index: every 100 km MGRS square of every grid zone (80S to 84N)
+    as S2 tile with its 109.8 km footprint, plus a 1 degree lookup grid.
+    Squares crossing a latitude band boundary are listed in both bands.
+
+    Parameters
+    ----------
+    index_dir : output directory (default=~/.cache/CDSE/s2_tile_index_v1 or CDSE_S2_TILE_INDEX)
+
+    Returns
+    -------
+    index_dir : pathlib.Path of the index directory
+    """
+
+    index_dir = pathlib.Path(index_dir)
+
+    tile_ids = []
+    corners = []
+    bounds = []
+
+    for zone in range(1, 61):
+        for band in latitude_bands:
+            extent = get_grid_zone_extent(zone, band)
+            if extent is None:
+                continue
+            south = band < 'N'
+
+            lon, lat = _grid_zone_samples(extent)
+            easting, northing = utm_forward(lon, lat, zone, south)
+            # unique (column, row) pairs of the 100 km squares containing the samples
+            keys = np.unique((easting // square_size).astype(int) * 1000 + (northing // square_size).astype(int))
+            columns, rows = keys // 1000, keys % 1000
+            in_zone = (columns >= 1) & (columns <= 8)
+            columns, rows = columns[in_zone], rows[in_zone]
+            tile_ids.extend(
+                f"{zone:02d}{band}"
+                f"{column_letters[(zone - 1) % 3][column - 1]}"
+                f"{row_letters[(row + (5 if zone % 2 == 0 else 0)) % 20]}"
+                for column, row in zip(columns.tolist(), rows.tolist())
+            )
+            outline_lon, outline_lat = utm_inverse(*_tile_outlines(columns, rows), zone, south)
+            # corners are every 9th outline sample
+            corners.append(np.stack([outline_lon[:, ::9], outline_lat[:, ::9]], axis=2))
+            bounds.append(np.stack([outline_lon.min(axis=1), outline_lat.min(axis=1), outline_lon.max(axis=1), outline_lat.max(axis=1)], axis=1))
+
+    tile_ids = np.array(tile_ids, dtype='S5')
+    corners = np.concatenate(corners).astype(np.float32)
+    bounds = np.concatenate(bounds).astype(np.float32)
+
+    # lookup grid: tiles per cell (compressed sparse rows, longitudes wrapped into [-180, 180))
+    n_lon_cells = 360 // cell_degrees
+    n_lat_cells = 180 // cell_degrees
+    cell_lists = [[] for i in range(n_lon_cells * n_lat_cells)]
+    for tile, (lon_min, lat_min, lon_max, lat_max) in enumerate(bounds.astype(np.float64)):
+        lat_cells = range(int((lat_min + 90) // cell_degrees), min(int((lat_max + 90) // cell_degrees), n_lat_cells - 1) + 1)
+        for lon_cell in range(int((lon_min + 180) // cell_degrees), int((lon_max + 180) // cell_degrees) + 1):
+            for lat_cell in lat_cells:
+                cell_lists[lat_cell * n_lon_cells + lon_cell % n_lon_cells].append(tile)
+
+    cell_offsets = np.zeros(len(cell_lists) + 1, dtype=np.int64)
+    cell_offsets[1:] = np.cumsum([len(c) for c in cell_lists])
+    cell_tiles = np.array([tile for c in cell_lists for tile in c], dtype=np.int32)
+
+    # write to a temporary directory and rename (concurrent builders do not see partial indexes)
+    index_dir.parent.mkdir(parents=True, exist_ok=True)
+    tmp_dir = pathlib.Path(tempfile.mkdtemp(dir=index_dir.parent, prefix=f".{index_dir.name}."))
+    for name, array in [('tile_ids', tile_ids), ('corners', corners), ('bounds', bounds), ('cell_offsets', cell_offsets), ('cell_tiles', cell_tiles)]:
+        np.save(tmp_dir / f"{name}.npy", array)
+
+    try:
+        tmp_dir.rename(index_dir)
+    except OSError:
+        # built by another process in the meantime
+        shutil.rmtree(tmp_dir)
+
+    logger.info(f"Built S2 tile index with {len(tile_ids)} tiles in {index_dir}")
+
+    return index_dir
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+class S2TileIndex:
+    """
+    Memory-mapped S2 tile index (built on first use if index_dir does not exist).
+
+    Tiles are found by their lon/lat bounds in a 1 degree lookup grid. With
+    shapely installed, candidates are checked against the AOI geometry and the
+    footprint polygon of each tile; without it, the result contains all tiles
+    whose bounds overlap the AOI bounds.
+    """
+
+    def __init__(self, index_dir=default_index_dir):
+
+        self.index_dir = pathlib.Path(index_dir)
+
+        if not (self.index_dir / 'cell_tiles.npy').is_file():
+            logger.info(f"S2 tile index not found, building it in {self.index_dir}")
+            build_s2_tile_index(self.index_dir)
+
+        load = lambda name: np.load(self.index_dir / f"{name}.npy", mmap_mode='r')
+        self.tile_ids = load('tile_ids')
+        self.corners = load('corners')
+        self.bounds = load('bounds')
+        self.cell_offsets = load('cell_offsets')
+        self.cell_tiles = load('cell_tiles')
+
+        self.n_lon_cells = 360 // cell_degrees
+        self.n_lat_cells = 180 // cell_degrees
+
+    def __len__(self):
+        return len(self.tile_ids)
+
+    # ------------------------ #
+
+    def _candidates(self, lon_min, lat_min, lon_max, lat_max):
+        # indices of tiles with bounds overlapping the given bounds, and the longitude shift of each match
+        lat_cells = range(
+            max(int((lat_min + 90) // cell_degrees), 0),
+            min(int((lat_max + 90) // cell_degrees), self.n_lat_cells - 1) + 1
+        )
+        lon_cells = range(int((lon_min + 180) // cell_degrees), int((lon_max + 180) // cell_degrees) + 1)
+        cells = [lat_cell * self.n_lon_cells + lon_cell % self.n_lon_cells for lat_cell in lat_cells for lon_cell in lon_cells]
+
+        tiles = np.unique(np.concatenate(
+            [self.cell_tiles[self.cell_offsets[cell]:self.cell_offsets[cell + 1]] for cell in cells]
+        )) if cells else np.zeros(0, dtype=np.int32)
+
+        bounds = self.bounds[tiles]
+        lat_overlap = (bounds[:, 1] <= lat_max) & (bounds[:, 3] >= lat_min)
+
+        # tile bounds are not wrapped at the antimeridian
+        matches = []
+        for shift in (0, -360, 360):
+            overlap = lat_overlap & (bounds[:, 0] + shift <= lon_max) & (bounds[:, 2] + shift >= lon_min)
+            matches.append((tiles[overlap], shift))
+
+        return matches
+
+    def lookup_bounds(self, lon_min, lat_min, lon_max, lat_max):
+        """
+        Tile IDs of all tiles whose lon/lat bounds overlap the given bounds
+
+        Returns
+        -------
+        tile_ids : sorted list of tile ID strings (e.g. '33XVG')
+        """
+
+        tiles = np.concatenate([tiles for tiles, shift in self._candidates(lon_min, lat_min, lon_max, lat_max)])
+
+        return sorted(set(self.tile_ids[tiles].astype(str).tolist()))
+
+    def lookup_geometry(self, geometry):
+        """
+        Tile IDs of all tiles whose footprint intersects a geojson geometry,
+        feature or feature collection (lon/lat)
+
+        Every polygon (line, point) is looked up by its own bounds, so an AOI
+        split at the antimeridian (e.g. a MultiPolygon with parts at 179 and -179)
+        does not cover the whole latitude band. A part spanning more than 180
+        degrees of longitude is taken as crossing the antimeridian.
+
+        Returns
+        -------
+        tile_ids : sorted list of tile ID strings (e.g. '33XVG')
+        """
+
+        try:
+            import shapely
+            import shapely.geometry
+        except ImportError:
+            shapely = None
+
+        tile_ids = set()
+
+        for part in _parts(geometry):
+            coordinates = _geojson_coordinates(part)
+            if coordinates.size == 0:
+                continue
+
+            # crossing the antimeridian: western longitudes are continued beyond 180
+            crosses_antimeridian = coordinates[:, 0].max() - coordinates[:, 0].min() > 180
+            if crosses_antimeridian:
+                coordinates = _unwrap_longitudes(coordinates)
+
+            lon_min, lat_min = coordinates.min(axis=0)
+            lon_max, lat_max = coordinates.max(axis=0)
+            matches = self._candidates(lon_min, lat_min, lon_max, lat_max)
+
+            if shapely is None:
+                tiles = np.concatenate([tiles for tiles, shift in matches])
+                tile_ids.update(self.tile_ids[tiles].astype(str).tolist())
+                continue
+
+            aoi = shapely.geometry.shape(part)
+            if crosses_antimeridian:
+                aoi = shapely.transform(aoi, _unwrap_longitudes)
+            shapely.prepare(aoi)
+
+            for tiles, shift in matches:
+                if len(tiles) == 0:
+                    continue
+                corners = np.array(self.corners[tiles], dtype=np.float64)
+                corners[:, :, 0] += shift
+                footprints = shapely.polygons(corners)
+                tile_ids.update(self.tile_ids[tiles[shapely.intersects(aoi, footprints)]].astype(str).tolist())
+
+        return sorted(tile_ids)
+
+    def get_footprint(self, tile_id):
+        """
+        Corner coordinates (lon/lat, upper left first, clockwise) of the footprint of a tile
+
+        Returns
+        -------
+        corners : list of [lon, lat] (None if the tile ID is not in the index)
+        """
+
+        matches = np.flatnonzero(self.tile_ids == tile_id.encode())
+        if len(matches) == 0:
+            return None
+
+        return self.corners[matches[0]].tolist()
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def _geometries(geojson_obj):
+    # geometries of a geojson geometry, feature or feature collection
+    if "coordinates" in geojson_obj or "geometries" in geojson_obj:
+        return [geojson_obj]
+    if "geometry" in geojson_obj:
+        return [geojson_obj["geometry"]]
+    return [feature["geometry"] for feature in geojson_obj["features"]]
+
+def _parts(geojson_obj):
+    # single geometries (Point, LineString, Polygon) of a geojson geometry, feature or feature collection
+    parts = []
+    for geometry in _geometries(geojson_obj):
+        if "geometries" in geometry:
+            for g in geometry["geometries"]:
+                parts.extend(_parts(g))
+        elif geometry["type"].startswith("Multi"):
+            parts.extend({"type": geometry["type"][5:], "coordinates": c} for c in geometry["coordinates"])
+        else:
+            parts.append(geometry)
+    return parts
+
+def _geojson_coordinates(geojson_obj):
+    # (n, 2) array of all lon/lat coordinates
+    arrays = []
+
+    def collect(coordinates):
+        if len(coordinates) and isinstance(coordinates[0], (int, float)):
+            arrays.append(np.asarray([coordinates[:2]], dtype=np.float64))
+        elif len(coordinates) and isinstance(coordinates[0][0], (int, float)):
+            arrays.append(np.asarray([c[:2] for c in coordinates], dtype=np.float64))
+        else:
+            for c in coordinates:
+                collect(c)
+
+    for geometry in _geometries(geojson_obj):
+        if "geometries" in geometry:
+            arrays.append(_geojson_coordinates({"type": "FeatureCollection", "features": [{"geometry": g} for g in geometry["geometries"]]}))
+        else:
+            collect(geometry["coordinates"])
+
+    return np.concatenate(arrays) if arrays else np.zeros((0, 2))
+
+def _unwrap_longitudes(coordinates):
+    # (n, 2) lon/lat array with negative longitudes continued beyond 180
+    coordinates = np.array(coordinates, dtype=np.float64)
+    coordinates[:, 0] = np.where(coordinates[:, 0] < 0, coordinates[:, 0] + 360, coordinates[:, 0])
+    return coordinates
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+# per-process index, loaded on first use
+_tile_index = None
+_tile_index_lock = threading.Lock()
+
+def get_s2_tile_index(index_dir=None):
+    """
+    Per-process S2TileIndex (loaded or built on first use)
+    """
+
+    global _tile_index
+
+    with _tile_index_lock:
+        if _tile_index is None or (index_dir is not None and _tile_index.index_dir != pathlib.Path(index_dir)):
+            _tile_index = S2TileIndex(index_dir or default_index_dir)
+
+    return _tile_index
+
+def get_s2_tile_ids(area):
+    """
+    S2 tile IDs covering an AOI
+
+    Parameters
+    ----------
+    area : geojson file with search area or dict with 'lat'/'lon' keys
+
+    Returns
+    -------
+    tile_ids : sorted list of tile ID strings (e.g. '33XVG')
+    """
+
+    # memoized with the cached AOI (dropped when the AOI file changes)
+    entry = CDSE_aoi_cache.get_aoi_entry(area)
+    tile_ids = entry.derived.get('s2_tile_ids')
+    if tile_ids is None:
+        tile_ids = entry.derived['s2_tile_ids'] = get_s2_tile_index().lookup_geometry(entry.geometry)
+
+    return list(tile_ids)
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def main():
+
+    p = argparse.ArgumentParser(description='Build the offline S2 tile index or look up the tiles of an AOI.')
+    p.add_argument('area', nargs='?', default=None, help='geojson file with search area')
+    p.add_argument('--index-dir', default=str(default_index_dir), help='index directory')
+    p.add_argument('--rebuild', action='store_true', help='rebuild the index')
+    args = p.parse_args()
+
+    if args.rebuild and pathlib.Path(args.index_dir).exists():
+        shutil.rmtree(args.index_dir)
+
+    index = get_s2_tile_index(args.index_dir)
+
+    if args.area is not None:
+        print(' '.join(index.lookup_geometry(CDSE_aoi_cache.get_aoi_geometry(args.area))))
+
+if __name__ == '__main__':
+    main()
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+# ---- End of <s2_tile_index.py> ----
@@ -0,0 +1,370 @@
+# ---- This is <scheduler.py> ----
+
+"""
+Priority, deadline and fair-share scheduling of batch downloads.
+"""
+
+import sys
+import time
+import heapq
+import datetime
+import threading
+import itertools
+
+from loguru import logger
+
+import CDSE.product as CDSE_product
+import CDSE.search_and_download as CDSE_sd
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+# priority classes (lower values are downloaded first, any integer can be used)
+URGENT = -1
+NORMAL = 0
+BACKFILL = 1
+
+# ordering of products within a priority class
+valid_policies = ['newest', 'oldest', 'smallest', 'deadline', 'list']
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def get_content_start(product):
+    """
+    Acquisition start of a product as timezone aware datetime (None if unknown)
+    """
+
+    if isinstance(product, CDSE_product.Product):
+        return product.ContentStart
+
+    return CDSE_product.parse_odata_datetime((product.get('ContentDate') or {}).get('Start'))
+
+def _to_timestamp(date):
+    if date is None:
+        return None
+    if isinstance(date, datetime.datetime):
+        return date.timestamp()
+    return float(date)
+
+def get_policy_key(policy, product, deadline=None):
+    """
+    Sort key of a product within its priority class (smaller keys first)
+
+    Parameters
+    ----------
+    policy : 'newest' (ContentDate), 'oldest', 'smallest' (ContentLength), 'deadline' (earliest first) or 'list' (insertion order)
+    product : product dictionary or CDSE.product.Product
+    deadline : deadline of the product as datetime or epoch seconds (default=None)
+
+    Returns
+    -------
+    key : tuple
+    """
+
+    if policy == 'list':
+        return ()
+
+    if policy == 'smallest':
+        return (product.get('ContentLength') or float('inf'),)
+
+    start = _to_timestamp(get_content_start(product))
+
+    if policy == 'deadline':
+        deadline = _to_timestamp(deadline)
+        # products without deadline last, newest first among equal deadlines
+        return (float('inf') if deadline is None else deadline, -(start or 0))
+
+    if policy == 'oldest':
+        return (float('inf') if start is None else start,)
+
+    return (float('inf') if start is None else -start,)
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+class DownloadScheduler:
+    """
+    Queue of products for batch downloads, ordered by priority class and an
+    ordering policy within each class.
+
+    With a 'group_function' (e.g. returning the AOI of a product), products
+    of different groups get a fair share: the next product comes from the
+    group with the fewest (weighted) dispatched products among the groups
+    with the most urgent priority class.
+
+    Products can be added and re-prioritized while workers are running, so
+    urgent products overtake a running backfill.
+    """
+
+    def __init__(self, policy='newest', group_function=None, group_weights=None):
+
+        if policy not in valid_policies:
+            raise ValueError(f"'policy' must be one of {valid_policies}")
+
+        self.policy = policy
+        self.group_function = group_function
+        self.group_weights = group_weights or dict()
+
+        # group -> heap of entries [priority, policy key, sequence number, product id]
+        self._heaps = dict()
+        # product id -> (entry, product, group, deadline) of queued products
+        self._queued = dict()
+        # group -> number of dispatched products
+        self._dispatched = dict()
+
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._closed = False
+
+    def __len__(self):
+        with self._condition:
+            return len(self._queued)
+
+    # ------------------------ #
+
+    def add(self, product, priority=NORMAL, deadline=None, group=None):
+        """
+        Add product (a product that is already queued is re-prioritized)
+
+        Parameters
+        ----------
+        product : product dictionary or CDSE.product.Product
+        priority : priority class, lower values first (default=NORMAL)
+        deadline : deadline as datetime or epoch seconds (default=None)
+        group : fair share group (default=None, from group_function)
+        """
+
+        if group is None and self.group_function is not None:
+            group = self.group_function(product)
+
+        with self._condition:
+            if product['Id'] in self._queued:
+                self._remove(product['Id'])
+
+            entry = [priority, get_policy_key(self.policy, product, deadline), next(self._sequence), product['Id']]
+            heapq.heappush(self._heaps.setdefault(group, []), entry)
+            self._queued[product['Id']] = (entry, product, group, deadline)
+            self._condition.notify()
+
+    def add_products(self, product_list, priority=NORMAL, deadline=None):
+        """
+        Add list of products with the same priority class and deadline
+        """
+
+        for product in product_list:
+            self.add(product, priority=priority, deadline=deadline)
+
+    def _remove(self, product_id):
+        # lazy deletion: the heap entry is marked and skipped in pop
+        entry, product, group, deadline = self._queued.pop(product_id)
+        entry[-1] = None
+        return product, group, deadline
+
+    def reprioritize(self, product_id, priority=None, deadline=None):
+        """
+        Change priority class and/or deadline of a queued product
+
+        Returns
+        -------
+        changed : True/False (False if the product is not queued anymore)
+        """
+
+        with self._condition:
+            if product_id not in self._queued:
+                return False
+            entry, product, group, old_deadline = self._queued[product_id]
+            priority = entry[0] if priority is None else priority
+            deadline = old_deadline if deadline is None else deadline
+
+        self.add(product, priority=priority, deadline=deadline, group=group)
+
+        return True
+
+    def remove(self, product_id):
+        """
+        Remove queued product
+
+        Returns
+        -------
+        removed : True/False
+        """
+
+        with self._condition:
+            if product_id not in self._queued:
+                return False
+            self._remove(product_id)
+            return True
+
+    # ------------------------ #
+
+    def _top(self, heap):
+        # drop deleted entries from the top of the heap
+        while heap and heap[0][-1] is None:
+            heapq.heappop(heap)
+        return heap[0] if heap else None
+
+    def _next_heap(self):
+        tops = [(group, self._top(heap)) for group, heap in self._heaps.items()]
+        tops = [(group, top) for group, top in tops if top is not None]
+        if not tops:
+            return None
+        best_priority = min(top[0] for group, top in tops)
+        candidates = [(group, top) for group, top in tops if top[0] == best_priority]
+        if len(candidates) > 1:
+            candidates.sort(key=lambda c: (self._dispatched.get(c[0], 0) / self.group_weights.get(c[0], 1), c[1]))
+        return self._heaps[candidates[0][0]]
+
+    def pop(self, timeout=None):
+        """
+        Take the next product
+
+        Parameters
+        ----------
+        timeout : maximum waiting time for a product in seconds (default=None, wait until closed)
+
+        Returns
+        -------
+        product : product dictionary or CDSE.product.Product (None if closed and empty, or on timeout)
+        """
+
+        t_end = None if timeout is None else time.time() + timeout
+
+        with self._condition:
+            while True:
+                heap = self._next_heap()
+                if heap is not None:
+                    entry = heapq.heappop(heap)
+                    product, group, deadline = self._remove(entry[-1])
+                    self._dispatched[group] = self._dispatched.get(group, 0) + 1
+                    deadline = _to_timestamp(deadline)
+                    if deadline is not None and deadline < time.time():
+                        logger.warning(f"Deadline of {product['Name']} has passed")
+                    return product
+
+                if self._closed:
+                    return None
+                if t_end is not None and time.time() >= t_end:
+                    return None
+                self._condition.wait(None if t_end is None else t_end - time.time())
+
+    def close(self):
+        """
+        No more products are expected: pop returns None once the queue is empty
+        """
+
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def run_scheduled_downloads(
+    scheduler,
+    download_dir,
+    username,
+    password,
+    n_workers = 1,
+    close_when_empty = True,
+    loglevel = 'INFO',
+    **download_kwargs
+):
+    """
+    Download products in scheduler order. Products added to (or re-prioritized in)
+    the scheduler while the downloads are running are taken into account.
+
+    Parameters
+    ----------
+    scheduler : DownloadScheduler
+    download_dir : download directory
+    username : CDSE username
+    password : CDSE password
+    n_workers : number of parallel download threads (default=1)
+    close_when_empty : stop when the queue is empty (default=True), otherwise wait until scheduler.close()
+    loglevel : loglevel setting (default='INFO')
+    download_kwargs : further arguments for CDSE.search_and_download.download_product_from_cdse
+
+    Returns
+    -------
+    results : dict with product name as key and True/False for succesful download as value
+    """
+
+    # remove default logger handler and add personal one
+    logger.remove()
+    logger.add(sys.stderr, level=loglevel)
+
+    if close_when_empty:
+        scheduler.close()
+
+    results = dict()
+    results_lock = threading.Lock()
+
+    def work():
+        while True:
+            product = scheduler.pop()
+            if product is None:
+                return
+            try:
+                downloaded = CDSE_sd.download_product_from_cdse(product, download_dir, username, password, **download_kwargs)
+            except Exception as e:
+                logger.error(f"Download of {product['Name']} failed: {e}")
+                downloaded = False
+            with results_lock:
+                results[product['Name']] = bool(downloaded)
+
+    workers = [threading.Thread(target=work, daemon=True) for i in range(n_workers)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    n_downloaded = sum(results.values())
+    logger.info(f"Downloaded {n_downloaded} of {len(results)} scheduled products")
+
+    return results
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def download_product_list_by_priority(
+    product_list,
+    download_dir,
+    username,
+    password,
+    policy = 'newest',
+    group_function = None,
+    n_workers = 1,
+    loglevel = 'INFO',
+    **download_kwargs
+):
+    """
+    Download list of products in the order of a scheduling policy
+    (instead of list order as in CDSE.search_and_download.download_product_list_from_cdse)
+
+    Parameters
+    ----------
+    product_list : list of product dictionaries or CDSE.product.Product objects
+    download_dir : download directory
+    username : CDSE username
+    password : CDSE password
+    policy : 'newest', 'oldest', 'smallest', 'deadline' or 'list' (default='newest')
+    group_function : function returning the fair share group (e.g. AOI) of a product (default=None)
+    n_workers : number of parallel download threads (default=1)
+    loglevel : loglevel setting (default='INFO')
+    download_kwargs : further arguments for CDSE.search_and_download.download_product_from_cdse
+
+    Returns
+    -------
+    results : dict with product name as key and True/False for succesful download as value
+    """
+
+    scheduler = DownloadScheduler(policy=policy, group_function=group_function)
+    scheduler.add_products(product_list)
+
+    return run_scheduled_downloads(scheduler, download_dir, username, password, n_workers=n_workers, loglevel=loglevel, **download_kwargs)
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+# ---- End of <scheduler.py> ----
@@ -5,18 +5,33 @@ Ssearch and download products from CDSE.
 """
 
 import sys
+import time
 import pathlib
+import concurrent.futures
 
 from loguru import logger
 
 import requests
 
 import CDSE.json_utils as CDSE_json
+import CDSE.aoi_cache as CDSE_aoi_cache
 import CDSE.access_token_credentials as CDSE_atc
+import CDSE.product as CDSE_product
+import CDSE.download_lock as CDSE_lock
+import CDSE.inventory as CDSE_inventory
+import CDSE.sinks as CDSE_sinks
+import CDSE.telemetry as CDSE_telemetry
+import CDSE.tracing as CDSE_tracing
+import CDSE.transfer as CDSE_transfer
 
 # -------------------------------------------------------------------------- #
 # -------------------------------------------------------------------------- #
 
+# CDSE endpoints (can be redirected, e.g. to CDSE.mock_server)
+catalogue_url = "https://catalogue.dataspace.copernicus.eu/odata/v1/Products"
+zipper_url = "https://zipper.dataspace.copernicus.eu/odata/v1/Products"
+assets_url = "https://catalogue.dataspace.copernicus.eu/odata/v1/Assets"
+
 # define valid parameter choices for CDSE query
 # as they are expected in the main search function below
 
@@ -46,9 +61,24 @@ valid_S2_product_types = ['1C','2A']
 # implemented S2 processing levels are 
 valid_S2_levels = ['1C','2A']
 
+# download coordination with other workers
+valid_lock_policies = [None, 'wait', 'skip']
+
+# suffix of incomplete downloads
+part_suffix = CDSE_sinks.part_suffix
+
+# S2 tile name queries (see search_CDSE_catalogue, 'use_tile_index')
+default_tiles_per_query = 20
+default_n_query_threads = 4
+
+# catalogue queries: retries of failed result pages (status 429 and 5xx) and first wait in seconds
+default_query_retries = 3
+default_query_retry_wait = 1
+
 # -------------------------------------------------------------------------- #
 # -------------------------------------------------------------------------- #
 
+@CDSE_tracing.traced('search_by_name')
 def search_CDSE_catalogue_by_name(product_name, loglevel='INFO'):
     """
     Search the CDSE data catalogue for specific data product by its exact name.
@@ -79,14 +109,16 @@ def search_CDSE_catalogue_by_name(product_name, loglevel='INFO'):
     logger.debug(f"'product_name': {product_name}")
 
     # build query string
-    querySTR = f"https://catalogue.dataspace.copernicus.eu/odata/v1/Products?$filter=Name eq '{product_name}'&$expand=Attributes"
+    querySTR = f"{catalogue_url}?$filter=Name eq '{product_name}'&$expand=Attributes"
     logger.debug(f"querySTR: {querySTR}")
 
     # search the data collection
-    response_json = requests.get(querySTR).json()
-
-    # extract list of products 
-    product_list = response_json['value']
+    try:
+        response_json = _get_query_page(querySTR)
+        product_list = response_json['value']
+    except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+        logger.error(f"Query failed: {e}")
+        return []
 
     if len(product_list)==1:
         logger.info(f"Query found exactly 1 product: {product_list[0]['Name']}")
@@ -100,6 +132,33 @@ def search_CDSE_catalogue_by_name(product_name, loglevel='INFO'):
 # -------------------------------------------------------------------------- #
 # -------------------------------------------------------------------------- #
 
+def _get_checked_aoi_entry(area):
+    """
+    Validate search area through the AOI cache (one path lookup per call)
+
+    Returns
+    -------
+    entry : CDSE.aoi_cache.AOIEntry (None for an invalid area, the error is logged)
+    """
+
+    if type(area) is dict:
+        if not 'lat' in area.keys() or not 'lon' in area.keys():
+            logger.error(f"Area given as a dictionary must contain 'lat' and 'lon' keys")
+            return None
+    elif not pathlib.Path(area).suffix.endswith('json'):
+        logger.error(f"Input 'area' must be a json file, but file ending is '{pathlib.Path(area).suffix}'")
+        return None
+
+    try:
+        return CDSE_aoi_cache.get_aoi_entry(area, decimals=4)
+    except FileNotFoundError:
+        logger.error(f"Cannot find search area file: '{area}'")
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        logger.error(f"Cannot read search area '{area}': {e}")
+
+    return None
+
+@CDSE_tracing.traced('check_parameters')
 def check_CDSE_request_parameters(
     sensor,
     area,
@@ -113,6 +172,7 @@ def check_CDSE_request_parameters(
     max_cloud_cover,
     max_results,
     expand_attributes,
+    check_area = True,
     loglevel = 'INFO'
 ):
     """
@@ -132,6 +192,7 @@ def check_CDSE_request_parameters(
     max_cloud_cover : maximum cloud cover
     max_results : maximum number of items returned from a query
     expand_attributes : see the full metadata of each returned result
+    check_area : validate the area (read through the AOI cache) (default=True, False if already validated)
     loglevel : loglevel setting
 
     Returns
@@ -157,19 +218,10 @@ def check_CDSE_request_parameters(
         logger.error(f"Sensor '{sensor}' is not a valid sensor")
         return valid_parameters
 
-    # area
-    logger.debug(f"Checking input 'area': {area}")
-    if type(area) is dict:
-        if not 'lat' in area.keys() or not 'lon' in area.keys():
-            logger.error(f"Area given as a dictionary must contain 'lat' and 'lon' keys")
-            return valid_parameters
-    else:
-        geojson_path  = pathlib.Path(area).resolve()
-        if not geojson_path.exists():
-            logger.error(f"Cannot find search area file: '{geojson_path}'")
-            return valid_parameters
-        if not geojson_path.suffix.endswith('json'):
-            logger.error(f"Input 'area' must be a json file, but file ending is '{geojson_path.suffix}'")
+    # area (the cache entry is reused by the query)
+    if check_area:
+        logger.debug(f"Checking input 'area': {area}")
+        if _get_checked_aoi_entry(area) is None:
             return valid_parameters
 
     # start_date and end_date
@@ -285,7 +337,8 @@ def check_CDSE_request_parameters(
 # -------------------------------------------------------------------------- #
 # -------------------------------------------------------------------------- #
 
-def search_CDSE_catalogue(
+@CDSE_tracing.traced('build_query_url')
+def build_CDSE_query_url(
     sensor,
     area,
     start_date,
@@ -299,10 +352,12 @@ def search_CDSE_catalogue(
     max_cloud_cover = 100,
     max_results = 1000,
     expand_attributes = True,
+    expand_assets = False,
+    tile_ids = None,
     loglevel = 'INFO'
 ):
     """
-    Search the CDSE data catalogue for satelite products.
+    Check search parameters and build the CDSE catalogue query url.
 
     Parameters
     ----------
@@ -315,29 +370,39 @@ def search_CDSE_catalogue(
     sensor_mode : sensor mode (default=None)
     product_type : product type (default=None)
     processing_level : data processing level (default=None)
-    relative_orbit : relative orbit number (for repeat passes) (default=None)
+    relative_orbit : relative orbit number or list of numbers (for repeat passes) (default=None)
     max_cloud_cover : maximum cloud cover (default=100)
     max_results : maximum number of items returned from a query
     expand_attributes : see the full metadata of each returned result (default=True)
+    expand_assets : list the assets (e.g. quicklook) of each returned result (default=False)
+    tile_ids : S2 tile IDs to match in product names instead of the area filter (default=None)
     loglevel : loglevel setting (default='INFO')
 
     Returns
     -------
-    response_json : CDSE response in json format (dict)
+    querySTR : full query url (None for invalid search parameters)
     """
 
     # remove default logger handler and add personal one
     logger.remove()
     logger.add(sys.stderr, level=loglevel)
 
-    # initialize empty response_json
-    response_json = []
+    # initialize empty querySTR
+    querySTR = None
 
     # allow for non-capitalized spelling
     sensor = sensor.upper()
 
     # ------------------------ #
 
+    # area filter: validated and converted with a single AOI cache lookup
+    aoi_entry = None
+    if tile_ids is None:
+        aoi_entry = _get_checked_aoi_entry(area)
+        if aoi_entry is None:
+            logger.error(f"Invalid search parameters")
+            return querySTR
+
     # check input parameters
     valid_input = check_CDSE_request_parameters(
         sensor = sensor,
@@ -352,20 +417,21 @@ def search_CDSE_catalogue(
         max_cloud_cover = max_cloud_cover,
         max_results = max_results,
         expand_attributes = expand_attributes,
+        check_area = aoi_entry is None,
         loglevel = loglevel
     )
 
     if not valid_input:
         logger.error(f"Invalid search parameters")
-        return response_json
+        return querySTR
 
 # -------------------------------------------------------------------------- #
 
     # read aoi string
-    if type(area) is dict:
-        aoi = CDSE_json.get_aoi_string_from_lat_lon_dict(area, decimals=4)
-    else:
-        aoi = CDSE_json.get_aoi_string_from_geojson(area, decimals=4)
+    if tile_ids is None:
+        with CDSE_tracing.span('aoi_conversion') as span:
+            aoi = aoi_entry.aoi_string
+            span.set(wkt_length=len(aoi))
 
 # -------------------------------------------------------------------------- #
 
@@ -374,11 +440,14 @@ def search_CDSE_catalogue(
     # general query parameters
 
     # sensor
-    querySTR_sensor = f"https://catalogue.dataspace.copernicus.eu/odata/v1/Products?$filter=Collection/Name eq '{sensor}'"
+    querySTR_sensor = f"{catalogue_url}?$filter=Collection/Name eq '{sensor}'"
     logger.debug(f"querySTR_sensor: {querySTR_sensor}")
 
-    # area
-    querySTR_area =  " and " + f"OData.CSC.Intersects(area=geography'SRID=4326;{aoi}')"
+    # area (or S2 tile names)
+    if tile_ids is None:
+        querySTR_area =  " and " + f"OData.CSC.Intersects(area=geography'SRID=4326;{aoi}')"
+    else:
+        querySTR_area = " and (" + " or ".join(f"contains(Name,'_T{tile_id}_')" for tile_id in tile_ids) + ")"
     logger.debug(f"querySTR_area: {querySTR_area}")
 
     # date and time
@@ -403,7 +472,10 @@ def search_CDSE_catalogue(
             querySTR_product_type = ""
 
         # S1 relative orbit number
-        if relative_orbit is not None:
+        if isinstance(relative_orbit, (list, tuple)):
+            orbit_conditions = " or ".join(f"att/OData.CSC.IntegerAttribute/Value eq {orbit}" for orbit in relative_orbit)
+            querySTR_rel_orbit = " and " + f"Attributes/OData.CSC.IntegerAttribute/any(att:att/Name eq 'relativeOrbitNumber' and ({orbit_conditions}))"
+        elif relative_orbit is not None:
             querySTR_rel_orbit = " and " + f"Attributes/OData.CSC.IntegerAttribute/any(att:att/Name eq 'relativeOrbitNumber' and att/OData.CSC.IntegerAttribute/Value eq {relative_orbit})"
         else:
             querySTR_rel_orbit = ""
@@ -461,6 +533,8 @@ def search_CDSE_catalogue(
         querySTR_expand_attributes = "&$expand=Attributes"
     else:
         querySTR_expand_attributes = ""
+    if expand_assets:
+        querySTR_expand_attributes += "&$expand=Assets"
     logger.debug(f"querySTR_expand_attributes: {querySTR_expand_attributes}")
 
 
@@ -475,13 +549,146 @@ def search_CDSE_catalogue(
 
     logger.info(f"Full query url: {querySTR}")
 
+    return querySTR
+
+# -------------------------------------------------------------------------- #
 # -------------------------------------------------------------------------- #
 
-    # search the data collection
-    response_json = requests.get(querySTR).json()
+@CDSE_tracing.traced('search')
+def search_CDSE_catalogue(
+    sensor,
+    area,
+    start_date,
+    end_date,
+    start_time = "00:00:00",
+    end_time = "00:00:00",
+    sensor_mode = None,
+    product_type = None,
+    processing_level = None,
+    relative_orbit = None,
+    max_cloud_cover = 100,
+    max_results = 1000,
+    expand_attributes = True,
+    expand_assets = False,
+    use_tile_index = False,
+    tiles_per_query = default_tiles_per_query,
+    orbit_index = None,
+    split_by_orbit = False,
+    n_query_threads = default_n_query_threads,
+    loglevel = 'INFO'
+):
+    """
+    Search the CDSE data catalogue for satelite products.
 
-    # extract list of products 
-    product_list = response_json['value']
+    Parameters
+    ----------
+    sensor : sensor collection to search (SENTINEL-1, SENTINEL-2)
+    area : geojson file with search area or dict with 'lat'/'lon' keys
+    start_date : start date, format YYYY-MM-DD
+    end_date : end date, format YYYY-MM-DD
+    start_time : start time, format hh:mm:ss (default="00:00:00")
+    end_time : end time, format hh:mm:ss (default="00:00:00")
+    sensor_mode : sensor mode (default=None)
+    product_type : product type (default=None)
+    processing_level : data processing level (default=None)
+    relative_orbit : relative orbit number or list of numbers (for repeat passes) (default=None)
+    max_cloud_cover : maximum cloud cover (default=100)
+    max_results : maximum number of items returned from a query
+    expand_attributes : see the full metadata of each returned result (default=True)
+    expand_assets : list the assets (e.g. quicklook) of each returned result (default=False), see CDSE.quicklook
+    use_tile_index : SENTINEL-2 only, query the S2 tiles covering the area by name instead of the area filter (default=False)
+                     tiles come from the offline index in CDSE.s2_tile_index, chunks of tiles are queried in parallel
+                     and all result pages are merged into one response (without '@odata.nextLink')
+    tiles_per_query : number of tile names per query (default=20)
+    orbit_index : SENTINEL-1 only, CDSE.orbit_index.RelativeOrbitIndex to restrict the search to the
+                  relative orbits covering the area (default=None)
+                  if the known orbits do not cover the whole area, all orbits are searched and the products
+                  of all result pages are added to the index, products of restricted searches are added too
+    split_by_orbit : query each relative orbit separately and in parallel, all result pages are merged
+                     into one response (without '@odata.nextLink') (default=False)
+    n_query_threads : number of parallel tile or orbit queries (default=4)
+    loglevel : loglevel setting (default='INFO')
+
+    Returns
+    -------
+    response_json : CDSE response in json format (dict)
+    """
+
+    # remove default logger handler and add personal one
+    with CDSE_tracing.span('logger_setup'):
+        logger.remove()
+        logger.add(sys.stderr, level=loglevel)
+
+    # initialize empty response_json
+    response_json = []
+
+    query_parameters = dict(
+        sensor = sensor,
+        area = area,
+        start_date = start_date,
+        end_date = end_date,
+        start_time = start_time,
+        end_time = end_time,
+        sensor_mode = sensor_mode,
+        product_type = product_type,
+        processing_level = processing_level,
+        relative_orbit = relative_orbit,
+        max_cloud_cover = max_cloud_cover,
+        max_results = max_results,
+        expand_attributes = expand_attributes,
+        expand_assets = expand_assets,
+        loglevel = loglevel
+    )
+
+    if use_tile_index:
+        if sensor.upper() == 'SENTINEL-2':
+            return _search_CDSE_catalogue_by_tiles(query_parameters, tiles_per_query, n_query_threads)
+        logger.warning(f"Tile index is only available for SENTINEL-2, using the area filter")
+
+    # 'all_pages': unrestricted search, all result pages are recorded in the orbit index
+    update_orbit_index = None
+    if orbit_index is not None and relative_orbit is None and sensor.upper() == 'SENTINEL-1':
+        try:
+            relative_orbits = orbit_index.find_relative_orbits(area)
+            coverage = orbit_index.get_coverage(area)
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"Could not look up relative orbits of search area: {e}")
+            return response_json
+
+        if not expand_attributes:
+            logger.warning(f"Orbit index needs expand_attributes=True, searching all orbits")
+        elif coverage < 1:
+            # orbits learned from neighbouring areas may miss orbits of this area
+            logger.warning(f"Known relative orbits cover {100 * coverage:.0f}% of the search area, searching all orbits")
+            update_orbit_index = 'all_pages'
+        elif split_by_orbit:
+            logger.info(f"Searching relative orbits {relative_orbits} in separate queries")
+            query_urls = [build_CDSE_query_url(**dict(query_parameters, relative_orbit=orbit)) for orbit in relative_orbits]
+            if None in query_urls:
+                return response_json
+            response_json = _search_CDSE_catalogue_parallel(query_urls, n_query_threads)
+            orbit_index.update_from_search(response_json, follow_next_links=False)
+            return response_json
+        else:
+            logger.info(f"Restricting search to relative orbits {relative_orbits}")
+            query_parameters['relative_orbit'] = relative_orbits
+            update_orbit_index = 'first_page'
+
+    # check input parameters and build the query url
+    querySTR = build_CDSE_query_url(**query_parameters)
+
+    if querySTR is None:
+        return response_json
+
+# -------------------------------------------------------------------------- #
+
+    # search the data collection
+    try:
+        response_json = _get_query_page(querySTR)
+        product_list = response_json['value']
+    except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+        logger.error(f"Query failed: {e}")
+        return []
 
     logger.info(f"Query found {len(product_list)} products")
 
@@ -489,8 +696,164 @@ def search_CDSE_catalogue(
         logger.warning(f"Number of products exceeds maximum number")
         logger.warning(f"Access next query url at 'response_json['@odata.nextLink']")
 
+    # restricted searches add the given page only (the caller may follow the next links)
+    if update_orbit_index is not None:
+        orbit_index.update_from_search(response_json, follow_next_links=update_orbit_index == 'all_pages', loglevel=loglevel)
+
     return response_json
 
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def _get_query_page(querySTR, session=None, max_retries=default_query_retries, retry_wait=default_query_retry_wait):
+    # one result page, answers with status 429 or 5xx are retried with doubling waits,
+    # raises requests.exceptions.HTTPError if the page fails
+    for attempt in range(max_retries + 1):
+        response = CDSE_tracing.request('GET', querySTR, session=session)
+        if response.status_code == 200 or not (response.status_code == 429 or response.status_code >= 500) or attempt == max_retries:
+            break
+        logger.warning(f"Query page failed with status {response.status_code}, retrying ({attempt + 1}/{max_retries})")
+        time.sleep(retry_wait * 2 ** attempt)
+    if response.status_code != 200:
+        logger.error(f"Query page failed with status {response.status_code}: {response.text[:200]}")
+        response.raise_for_status()
+        raise requests.exceptions.HTTPError(f"Unexpected status {response.status_code}", response=response)
+    with CDSE_tracing.span('json_decode'):
+        return response.json()
+
+def _fetch_all_pages(querySTR, session=None, max_retries=default_query_retries, retry_wait=default_query_retry_wait):
+    # products of all pages of one query, raises requests.exceptions.HTTPError if a page fails
+    product_list = []
+    while querySTR is not None:
+        page_json = _get_query_page(querySTR, session=session, max_retries=max_retries, retry_wait=retry_wait)
+        product_list.extend(page_json['value'])
+        querySTR = page_json.get('@odata.nextLink')
+    return product_list
+
+def _search_CDSE_catalogue_by_tiles(query_parameters, tiles_per_query, n_query_threads):
+    """
+    Search S2 products by tile names (see search_CDSE_catalogue, 'use_tile_index')
+
+    Returns
+    -------
+    response_json : CDSE response in json format (dict), all pages merged
+    """
+
+    # numpy based tile index, imported on first use
+    import CDSE.s2_tile_index as CDSE_tiles
+
+    try:
+        with CDSE_tracing.span('tile_lookup') as span:
+            tile_ids = CDSE_tiles.get_s2_tile_ids(query_parameters['area'])
+            span.set(n_tiles=len(tile_ids))
+    except (OSError, ValueError, KeyError) as e:
+        logger.error(f"Could not look up S2 tiles of search area: {e}")
+        return []
+
+    if not tile_ids:
+        logger.warning(f"Search area is not covered by S2 tiles")
+        return {'@odata.context': '$metadata#Products', 'value': []}
+
+    logger.info(f"Search area is covered by {len(tile_ids)} S2 tiles")
+
+    query_urls = []
+    for i in range(0, len(tile_ids), tiles_per_query):
+        querySTR = build_CDSE_query_url(**query_parameters, tile_ids=tile_ids[i:i+tiles_per_query])
+        if querySTR is None:
+            return []
+        query_urls.append(querySTR)
+
+    return _search_CDSE_catalogue_parallel(query_urls, n_query_threads)
+
+def _search_CDSE_catalogue_parallel(query_urls, n_query_threads, session=None):
+    """
+    Run queries in parallel (over a shared requests.Session if given), following all result pages.
+    Failed queries are logged and left out, the result is then incomplete.
+
+    Returns
+    -------
+    response_json : CDSE response in json format (dict), all pages of all successful queries merged
+    """
+
+    def fetch(querySTR):
+        try:
+            return _fetch_all_pages(querySTR, session=session)
+        except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+            logger.error(f"Query failed, search result is incomplete: {e}")
+            return None
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=n_query_threads) as executor:
+        results = list(executor.map(fetch, query_urls))
+
+    n_failed = results.count(None)
+    if n_failed:
+        logger.error(f"{n_failed} of {len(query_urls)} queries failed")
+    results = [products for products in results if products is not None]
+
+    # queries can overlap (e.g. neighbouring tiles), a product is listed once
+    product_ids = set()
+    product_list = []
+    for products in results:
+        for product in products:
+            if product['Id'] not in product_ids:
+                product_ids.add(product['Id'])
+                product_list.append(product)
+
+    logger.info(f"{len(query_urls)} queries found {len(product_list)} products")
+
+    return {'@odata.context': '$metadata#Products', 'value': product_list}
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def iterate_CDSE_response_pages(response_json, max_pages=None, loglevel='INFO'):
+    """
+    Iterate over all pages of a (paginated) CDSE response.
+    Starts with the given response and follows '@odata.nextLink' until the last page.
+
+    Parameters
+    ----------
+    response_json : CDSE response in json format (dict), first page
+    max_pages : maximum number of pages to yield (default=None, all pages)
+    loglevel : loglevel setting (default='INFO')
+
+    Yields
+    ------
+    page_json : CDSE response page in json format (dict)
+    """
+
+    # remove default logger handler and add personal one
+    logger.remove()
+    logger.add(sys.stderr, level=loglevel)
+
+    if type(response_json) is not dict:
+        logger.error(f"Expected response_json type 'dict' but received {type(response_json)}")
+        return
+
+    page_json = response_json
+    n_pages = 0
+
+    while True:
+        n_pages += 1
+        logger.debug(f"Page {n_pages} contains {len(page_json['value'])} products")
+        yield page_json
+
+        next_link = page_json.get('@odata.nextLink')
+        if next_link is None:
+            break
+        if max_pages is not None and n_pages >= max_pages:
+            logger.warning(f"Stopping after {max_pages} pages, more results are available")
+            break
+
+        logger.debug(f"Requesting next page: {next_link}")
+        try:
+            page_json = _get_query_page(next_link)
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.error(f"Stopping after {n_pages} pages, next page failed: {e}")
+            return
+
+    logger.info(f"Iterated over {n_pages} response pages")
+
 # -------------------------------------------------------------------------- #
 # -------------------------------------------------------------------------- #
 # -------------------------------------------------------------------------- #
@@ -501,18 +864,145 @@ def search_CDSE_catalogue(
 # -------------------------------------------------------------------------- #
 # -------------------------------------------------------------------------- #
 
-def download_product_from_cdse(product, download_dir, username, password, overwrite=False, chunk_size=8192):
+def _download_product_zip(product, download_zip_path, username, password, chunk_size=None, event_callback=None, fsync_policy='none', preallocate=False, session=None):
+    """
+    Stream product zip from CDSE to a temporary '.part' file, renamed when complete
+
+    Returns
+    -------
+    downloaded : True/False for succesful download
+    """
+
+    sink = CDSE_sinks.FileSink(
+        download_zip_path,
+        fsync_policy = fsync_policy,
+        preallocate_size = product.get('ContentLength') if preallocate else None
+    )
+
+    return _stream_product_to_sink(product, sink, username, password, chunk_size=chunk_size, event_callback=event_callback, session=session)
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def _stream_product_to_sink(product, sink, username, password, chunk_size=None, event_callback=None, session=None):
+    """
+    Stream product zip from CDSE into a sink (completed on success, aborted on failure),
+    over a shared requests.Session if given (kept open) or a new one (closed afterwards)
+
+    Returns
+    -------
+    downloaded : True/False for succesful download
+    """
+
+    # build download url for current product
+    url = f"{zipper_url}({product['Id']})/$value"
+
+    # generate access token (reused while valid)
+    access_token = CDSE_atc.get_cached_access_token(username, password)
+
+    headers = {"Authorization": f"Bearer {access_token}"}
+
+    shared_session = session is not None
+    if not shared_session:
+        session = requests.Session()
+        session.headers.update(headers)
+    response = CDSE_tracing.request('GET', url, session=session, headers=headers, stream=True)
+
+    total = product.get('ContentLength') or int(response.headers.get('Content-Length', 0)) or None
+    progress = CDSE_telemetry.TransferProgress(product['Name'], total, event_callback)
+
+    if response.status_code != 200:
+        logger.error(f"Download request failed with status {response.status_code}: {response.text[:200]}")
+        if response.status_code == 401:
+            CDSE_atc.invalidate_cached_access_token(username)
+        progress.http_error(response.status_code)
+        if not shared_session:
+            session.close()
+        response.close()
+        return False
+
+    logger.info("Downloading ...")
+    try:
+        progress.start()
+        sink.open(product)
+        CDSE_transfer.copy_response_to_sink(response, sink, chunk_size=chunk_size, progress=progress)
+        sink.close()
+    except requests.exceptions.RequestException as e:
+        logger.error(f"Download interrupted: {e}")
+        sink.abort()
+        progress.fail(e)
+        return False
+    except Exception as e:
+        logger.error(f"Writing to {sink} failed: {e}")
+        sink.abort()
+        progress.fail(e)
+        return False
+    finally:
+        if not shared_session:
+            session.close()
+        response.close()
+
+    progress.complete()
+
+    return True
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def download_product_to_sink(product, sink, username, password, overwrite=False, chunk_size=None, event_callback=None):
+    """
+    Download zipped product from CDSE and stream it directly into a storage sink
+    (e.g. CDSE.sinks.S3MultipartSink), without writing it to local disk
+
+    Parameters
+    ----------
+    product : product dictionary (returned from request) or CDSE.product.Product
+    sink : CDSE.sinks.Sink (FileSink, S3MultipartSink, CallbackSink)
+    username : CDSE username
+    password : CDSE password
+    overwrite : overwrite product that already exists in the sink (default=False)
+    chunk_size : download buffer size in bytes, rounded up to a multiple of 64 KiB (default=None, auto-tuned)
+    event_callback : function called with a dict for download events (default=None)
+
+    Returns
+    -------
+    downloaded : True/False for succesful download
+    """
+
+    logger.info(f"Current product: {product['Name']}")
+
+    if sink.exists() and not overwrite:
+        logger.info(f"Product already exists in {sink}")
+        return True
+
+    return _stream_product_to_sink(product, sink, username, password, chunk_size=chunk_size, event_callback=event_callback)
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+@CDSE_tracing.traced('download_product')
+def download_product_from_cdse(product, download_dir, username, password, overwrite=False, chunk_size=None, lock_policy=None, cache=None, event_callback=None, fsync_policy='none', preallocate=False, session=None):
     """
     Download zipped product directly from CDSE 
 
     Parameters
     ----------
-    product : product dictionary (returned from request)
+    product : product dictionary (returned from request) or CDSE.product.Product
     download_dir : download directory
     username : CDSE username
     password : CDSE password
     overwrite : overwrite existing files (default=False)
-    chunk_size : download in chunks (default=8192)
+    chunk_size : download buffer size in bytes, rounded up to a multiple of 64 KiB (default=None, auto-tuned)
+    lock_policy : coordinate with other workers using lock files in download_dir (default=None)
+                  'wait': wait for a product downloaded by another worker
+                  'skip': skip a product downloaded by another worker
+    cache : shared CDSE.product_cache.ProductCache to fetch the product through (default=None)
+    event_callback : function called with a dict for download events (default=None)
+                     'start', 'progress', 'complete', 'failed' (see CDSE.telemetry.TransferProgress) and 'http_error'
+                     a CDSE.telemetry.DownloadTelemetry collects them into aggregate counters
+    fsync_policy : when to fsync the downloaded file, 'none', 'end' or 'interval' (see CDSE.sinks.FileSink) (default='none')
+    preallocate : preallocate the file with the product's ContentLength (default=False)
+    session : requests.Session shared by several downloads to reuse connections (default=None, new session per download)
 
     Returns
     -------
@@ -520,9 +1010,13 @@ def download_product_from_cdse(product, download_dir, username, password, overwr
     """
 
     # check product for download
-    if type(product) is not dict:
-        logger.error(f"Expected product type 'dict' but received {type(product)}")
-        return
+    if type(product) is not dict and not isinstance(product, CDSE_product.Product):
+        logger.error(f"Expected product type 'dict' or 'Product' but received {type(product)}")
+        return False
+
+    if lock_policy not in valid_lock_policies:
+        logger.error(f"'lock_policy' must be one of {valid_lock_policies}")
+        return False
 
     logger.info(f"Product to download: {product['Name']}")
 
@@ -530,7 +1024,7 @@ def download_product_from_cdse(product, download_dir, username, password, overwr
     download_dir = pathlib.Path(download_dir)
     if not download_dir.is_dir():
         logger.error(f"Could not find download directory {download_dir}")
-        return
+        return False
 
     # build full download path
     download_zip_path  = download_dir / f"{product['Name'].split('.SAFE')[0]}.zip"
@@ -540,47 +1034,65 @@ def download_product_from_cdse(product, download_dir, username, password, overwr
     logger.debug(f"download_safe_path: {download_safe_path}")
 
     # check for existing products
-    if download_zip_path.is_file() or download_safe_path.is_dir() and not overwrite:
+    if (download_zip_path.is_file() or download_safe_path.is_dir()) and not overwrite:
         logger.info("Product already exists")
-        return
-
-
-    # build download url for current product
-    url = f"https://zipper.dataspace.copernicus.eu/odata/v1/Products({product['Id']})/$value"
-
-    # generate access token
-    access_token = CDSE_atc.get_access_token(username, password)
-
-    headers = {"Authorization": f"Bearer {access_token}"}
-
-    session = requests.Session()
-    session.headers.update(headers)
-    response = session.get(url, headers=headers, stream=True)
-
-    logger.info("Downloading ...")
-    with open(download_zip_path, "wb") as file:
-        for chunk in response.iter_content(chunk_size=8192):
-            if chunk:
-                file.write(chunk)
-
-    session.close()
-    response.close()
+        return True
+
+    def transfer():
+        if cache is not None:
+            return cache.fetch(product, download_zip_path, username, password, chunk_size=chunk_size, event_callback=event_callback, fsync_policy=fsync_policy)
+        return _download_product_zip(product, download_zip_path, username, password, chunk_size=chunk_size, event_callback=event_callback, fsync_policy=fsync_policy, preallocate=preallocate, session=session)
+
+    if lock_policy is None:
+        return transfer()
+
+    # coordinate with other workers sharing download_dir
+    lock = CDSE_lock.ProductDownloadLock(download_dir, product['Name'])
+
+    if not lock.try_acquire():
+        logger.info(f"Product is being downloaded by another worker: {lock.read_owner()}")
+        if lock_policy == 'skip':
+            return False
+        lock.wait_for_release()
+        if download_zip_path.is_file():
+            logger.info("Product was downloaded by another worker")
+            return True
+        if not lock.acquire():
+            return False
+
+    try:
+        # the product may have been completed while acquiring the lock
+        if download_zip_path.is_file() and not overwrite:
+            logger.info("Product already exists")
+            return True
+        return transfer()
+    finally:
+        lock.release()
 
 # -------------------------------------------------------------------------- #
 # -------------------------------------------------------------------------- #
 
-def download_product_list_from_cdse(product_list, download_dir, username, password, overwrite=False, chunk_size=8192):
+def download_product_list_from_cdse(product_list, download_dir, username, password, overwrite=False, chunk_size=None, lock_policy=None, use_inventory=False, cache=None, event_callback=None, fsync_policy='none', space_manager=None):
     """
     Download list of zipped product directly from CDSE 
 
     Parameters
     ----------
-    product_list : product lsit with dictionaries for individual products (returned from request)
+    product_list : product list with dictionaries or Product objects for individual products (returned from request)
     download_dir : download directory
     username : CDSE username
     password : CDSE password
     overwrite : overwrite existing files (default=False)
-    chunk_size : download in chunks (default=8192)
+    chunk_size : download buffer size in bytes, rounded up to a multiple of 64 KiB (default=None, auto-tuned)
+    lock_policy : coordinate with other workers using lock files (None, 'wait', 'skip') (default=None)
+    use_inventory : scan download_dir once and skip complete products, re-download corrupt ones (default=False)
+    cache : shared CDSE.product_cache.ProductCache to fetch products through (default=None)
+    event_callback : function called with a dict for download events (default=None)
+    fsync_policy : when to fsync downloaded files, 'none', 'end' or 'interval' (default='none')
+    space_manager : CDSE.disk_space.DiskSpaceManager, admits products only if they fit into the free space,
+                    places them into one of its download directories (instead of download_dir)
+                    and preallocates the files (default=None)
+                    with a cache, the space is reserved on the volume of cache.cache_dir
 
     Returns
     -------
@@ -592,6 +1104,20 @@ def download_product_list_from_cdse(product_list, download_dir, username, passwo
         logger.error(f"Expected product_list type 'list' but received {type(product_list)}")
         return
 
+    # products with corrupt zips (or wrong size) still in product_list are overwritten
+    corrupt_names = set()
+
+    download_dirs = [download_dir] if space_manager is None else space_manager.download_dirs
+
+    if use_inventory and not overwrite:
+        inventory = dict()
+        for inventory_dir in download_dirs:
+            inventory.update(CDSE_inventory.scan_download_dir(inventory_dir))
+        product_list = CDSE_inventory.filter_product_list_by_inventory(product_list, inventory)
+        corrupt_names = set(
+            name for name, entry in inventory.items() if entry['state'] in [CDSE_inventory.CORRUPT, CDSE_inventory.COMPLETE]
+        )
+
     # get number of entries
     n_products =len(product_list)
 
@@ -600,13 +1126,38 @@ def download_product_list_from_cdse(product_list, download_dir, username, passwo
     for i,product in enumerate(product_list):
         logger.info(f"Downloading product {i+1} of {n_products}")
 
-        download_product_from_cdse(
-            product,
-            download_dir,
-            username,
-            password,
-            overwrite=overwrite,
-            chunk_size=chunk_size)
+        overwrite_product = overwrite or product['Name'].split('.SAFE')[0] in corrupt_names
+
+        reservation = None
+        product_dir = download_dir
+        if space_manager is not None:
+            # products fetched through a cache are written to the cache directory and linked
+            reservation = space_manager.admit(
+                product,
+                overwrite = overwrite_product,
+                reserve_dir = None if cache is None else cache.cache_dir
+            )
+            if reservation is None:
+                logger.error(f"Skipping product: {product['Name']}")
+                continue
+            product_dir = reservation.download_dir
+
+        try:
+            download_product_from_cdse(
+                product,
+                product_dir,
+                username,
+                password,
+                overwrite=overwrite_product,
+                chunk_size=chunk_size,
+                lock_policy=lock_policy,
+                cache=cache,
+                event_callback=event_callback,
+                fsync_policy=fsync_policy,
+                preallocate=space_manager is not None)
+        finally:
+            if reservation is not None:
+                space_manager.release(reservation)
 
     return
 
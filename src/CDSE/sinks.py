@@ -0,0 +1,334 @@
+# ---- This is <sinks.py> ----
+
+"""
+Storage sinks for streaming product downloads (local file, S3 multipart upload, callback).
+S3 uploads require the optional 'boto3' package (or any client with the same interface).
+"""
+
+import os
+import errno
+import hashlib
+import threading
+import pathlib
+from concurrent.futures import ThreadPoolExecutor
+
+from loguru import logger
+
+try:
+    import boto3
+except ImportError:
+    boto3 = None
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+# suffix of incomplete local downloads
+part_suffix = '.part'
+
+# fsync policies of local files:
+# 'none' (leave flushing to the OS), 'end' (fsync before the rename),
+# 'interval' (fsync every 'fsync_interval' bytes and at the end, limits dirty pages)
+valid_fsync_policies = ['none', 'end', 'interval']
+default_fsync_interval = 64 * 1024 * 1024
+
+# default size of S3 multipart upload parts (S3 requires at least 5 MiB, except for the last part)
+default_part_size = 8 * 1024 * 1024
+min_part_size = 5 * 1024 * 1024
+
+# default number of parts uploaded while the download continues
+default_max_pending_parts = 2
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+class Sink:
+    """
+    Destination of a streamed product download.
+
+    A download calls open() once, write() for every chunk and finally close()
+    on success or abort() on failure. Only a completed sink makes the product
+    visible at its destination. Chunks may be memoryviews of a reused buffer,
+    so sinks must copy data they keep after write() returns.
+    """
+
+    def open(self, product):
+        pass
+
+    def write(self, chunk):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def abort(self):
+        pass
+
+    def exists(self):
+        """
+        Check if the product is already at the destination
+        """
+
+        return False
+
+    def __str__(self):
+        return self.__class__.__name__
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+class FileSink(Sink):
+    """
+    Local file, written to '<path>.part' and renamed when complete.
+    The file is opened unbuffered, as chunks arrive in large blocks.
+
+    Parameters
+    ----------
+    path : path of the complete file
+    fsync_policy : 'none', 'end' or 'interval' (default='none')
+    fsync_interval : bytes between fsyncs for the 'interval' policy (default=64 MiB)
+    preallocate_size : preallocate the file with this many bytes (e.g. ContentLength), so it is
+                       not fragmented and a full disk is detected before the transfer (default=None)
+    expected_md5 : MD5 hex digest the data must have, checked before the rename (default=None, not checked)
+    """
+
+    def __init__(self, path, fsync_policy='none', fsync_interval=default_fsync_interval, preallocate_size=None, expected_md5=None):
+
+        if fsync_policy not in valid_fsync_policies:
+            raise ValueError(f"'fsync_policy' must be one of {valid_fsync_policies}")
+
+        self.path = pathlib.Path(path)
+        self.part_path = self.path.with_name(f"{self.path.name}{part_suffix}")
+        self.fsync_policy = fsync_policy
+        self.fsync_interval = fsync_interval
+        self.preallocate_size = preallocate_size
+        self.expected_md5 = expected_md5
+        self._md5 = None
+        self._file = None
+        self._unsynced = 0
+        self._written = 0
+
+    def open(self, product):
+        self._file = open(self.part_path, 'wb', buffering=0)
+        self._unsynced = 0
+        self._written = 0
+        self._md5 = None if self.expected_md5 is None else hashlib.md5()
+        if self.preallocate_size:
+            self._preallocate(self.preallocate_size)
+
+    def _preallocate(self, size):
+        if not hasattr(os, 'posix_fallocate'):
+            return
+        try:
+            os.posix_fallocate(self._file.fileno(), 0, size)
+        except OSError as e:
+            if e.errno == errno.ENOSPC:
+                raise
+            # not supported by the file system
+            logger.debug(f"Could not preallocate {self.part_path}: {e}")
+
+    def write(self, chunk):
+        # unbuffered writes may be partial
+        view = memoryview(chunk)
+        while view:
+            n = self._file.write(view)
+            view = view[n:]
+        if self._md5 is not None:
+            self._md5.update(chunk)
+        self._written += len(chunk)
+        if self.fsync_policy == 'interval':
+            self._unsynced += len(chunk)
+            if self._unsynced >= self.fsync_interval:
+                os.fsync(self._file.fileno())
+                self._unsynced = 0
+
+    def close(self):
+        if self._md5 is not None and self._md5.hexdigest().lower() != self.expected_md5.lower():
+            # abort() removes the part file
+            raise ValueError(f"MD5 checksum mismatch: expected {self.expected_md5}, received {self._md5.hexdigest()}")
+        if self.preallocate_size and self._written != self.preallocate_size:
+            # remove preallocated space beyond the received data
+            self._file.truncate(self._written)
+        if self.fsync_policy != 'none':
+            os.fsync(self._file.fileno())
+        self._file.close()
+        self.part_path.replace(self.path)
+
+    def abort(self):
+        if self._file is not None:
+            self._file.close()
+        self.part_path.unlink(missing_ok=True)
+
+    def exists(self):
+        return self.path.is_file()
+
+    def __str__(self):
+        return str(self.path)
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+class CallbackSink(Sink):
+    """
+    User callbacks receiving every chunk (e.g. for hashing or custom uploads).
+
+    Parameters
+    ----------
+    write_callback : function called with every chunk (bytes)
+    close_callback : function called with the product when the download is complete (default=None)
+    abort_callback : function called with the product when the download failed (default=None)
+    """
+
+    def __init__(self, write_callback, close_callback=None, abort_callback=None):
+        self.write_callback = write_callback
+        self.close_callback = close_callback
+        self.abort_callback = abort_callback
+        self.product = None
+
+    def open(self, product):
+        self.product = product
+
+    def write(self, chunk):
+        # callbacks receive bytes, which they may keep
+        self.write_callback(bytes(chunk))
+
+    def close(self):
+        if self.close_callback is not None:
+            self.close_callback(self.product)
+
+    def abort(self):
+        if self.abort_callback is not None:
+            self.abort_callback(self.product)
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+class S3MultipartSink(Sink):
+    """
+    Object in an S3-compatible object store, written with a multipart upload.
+
+    Chunks are collected into parts of 'part_size' bytes. Full parts are
+    uploaded in a background thread while the download continues; at most
+    'max_pending_parts' parts are held in memory, the download waits if the
+    upload falls behind. The object only appears when the upload is completed,
+    a failed download aborts the upload.
+
+    Parameters
+    ----------
+    bucket : bucket name
+    key : object key
+    client : S3 client (default=None, boto3 client created with client_kwargs)
+    part_size : size of upload parts in bytes (default=8 MiB, at least 5 MiB)
+    max_pending_parts : maximum number of parts waiting for upload (default=2)
+    client_kwargs : arguments for boto3.client('s3', ...), e.g. endpoint_url for MinIO
+    """
+
+    def __init__(
+        self,
+        bucket,
+        key,
+        client = None,
+        part_size = default_part_size,
+        max_pending_parts = default_max_pending_parts,
+        **client_kwargs
+    ):
+
+        if part_size < min_part_size:
+            raise ValueError(f"'part_size' must be at least {min_part_size} bytes")
+
+        if client is None:
+            if boto3 is None:
+                raise ImportError("S3MultipartSink requires the 'boto3' package (or an S3 'client')")
+            client = boto3.client('s3', **client_kwargs)
+
+        self.bucket = bucket
+        self.key = key
+        self.client = client
+        self.part_size = part_size
+        self.max_pending_parts = max_pending_parts
+
+        self._buffer = bytearray()
+        self._slots = None
+        self._executor = None
+        self._futures = []
+        self._upload_id = None
+
+    def open(self, product):
+        response = self.client.create_multipart_upload(Bucket=self.bucket, Key=self.key)
+        self._upload_id = response['UploadId']
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._slots = threading.BoundedSemaphore(self.max_pending_parts)
+        self._buffer = bytearray()
+        self._futures = []
+        logger.debug(f"Started multipart upload to s3://{self.bucket}/{self.key}")
+
+    def _upload_part(self, part_number, data):
+        try:
+            response = self.client.upload_part(
+                Bucket = self.bucket,
+                Key = self.key,
+                UploadId = self._upload_id,
+                PartNumber = part_number,
+                Body = data
+            )
+            return {'ETag': response['ETag'], 'PartNumber': part_number}
+        finally:
+            self._slots.release()
+
+    def _submit_part(self):
+        # stop the download early if an upload failed
+        for future in self._futures:
+            if future.done() and future.exception() is not None:
+                raise future.exception()
+        # blocks while max_pending_parts parts are waiting (bounded buffering)
+        self._slots.acquire()
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        part_number = len(self._futures) + 1
+        self._futures.append(self._executor.submit(self._upload_part, part_number, data))
+
+    def write(self, chunk):
+        self._buffer += chunk
+        if len(self._buffer) >= self.part_size:
+            self._submit_part()
+
+    def close(self):
+        if self._buffer or not self._futures:
+            self._submit_part()
+        try:
+            parts = [future.result() for future in self._futures]
+        finally:
+            self._executor.shutdown()
+        self.client.complete_multipart_upload(
+            Bucket = self.bucket,
+            Key = self.key,
+            UploadId = self._upload_id,
+            MultipartUpload = {'Parts': parts}
+        )
+        logger.debug(f"Completed multipart upload of {len(parts)} parts to s3://{self.bucket}/{self.key}")
+
+    def abort(self):
+        if self._upload_id is None:
+            return
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+        self._buffer.clear()
+        try:
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self._upload_id)
+        except Exception as e:
+            logger.warning(f"Could not abort multipart upload to s3://{self.bucket}/{self.key}: {e}")
+        self._upload_id = None
+
+    def exists(self):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.key)
+        except Exception:
+            return False
+        return True
+
+    def __str__(self):
+        return f"s3://{self.bucket}/{self.key}"
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+# ---- End of <sinks.py> ----
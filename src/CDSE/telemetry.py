@@ -0,0 +1,290 @@
+# ---- This is <telemetry.py> ----
+
+"""
+Download telemetry: progress events of single transfers and aggregate counters
+with Prometheus textfile export.
+"""
+
+import os
+import time
+import pathlib
+import threading
+
+from loguru import logger
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+# minimum interval between progress events of one transfer in seconds
+default_progress_interval = 1.0
+
+MB = 1e6
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+class TransferProgress:
+    """
+    Progress of a single product transfer, reported to an event callback.
+
+    Events are dicts with an 'event' key:
+      'start'      : product, total
+      'progress'   : product, bytes, total, elapsed, mb_per_s (since last event), avg_mb_per_s, eta (seconds or None)
+      'complete'   : product, bytes, elapsed, avg_mb_per_s
+      'failed'     : product, bytes, elapsed, error
+      'http_error' : product, status
+    All events have 'retries', the number of earlier attempts of the product
+    (0 unless given by the caller, forwarding layers that retry may update it).
+    Progress events are sent at most every 'interval' seconds.
+    """
+
+    def __init__(self, product_name, total=None, event_callback=None, interval=default_progress_interval, retries=0):
+        self.product_name = product_name
+        self.total = total
+        self.event_callback = event_callback
+        self.interval = interval
+        self.retries = retries
+        self.bytes = 0
+        self.t_start = None
+        self._t_last = None
+        self._bytes_last = 0
+
+    def _send(self, event):
+        if self.event_callback is not None:
+            event['product'] = self.product_name
+            event['retries'] = self.retries
+            self.event_callback(event)
+
+    def start(self):
+        self.t_start = self._t_last = time.monotonic()
+        self._send({'event': 'start', 'total': self.total})
+
+    def update(self, n_bytes):
+        self.bytes += n_bytes
+
+        now = time.monotonic()
+        if now - self._t_last < self.interval:
+            return
+
+        elapsed = now - self.t_start
+        mb_per_s = (self.bytes - self._bytes_last) / MB / (now - self._t_last)
+        avg_mb_per_s = self.bytes / MB / elapsed
+        eta = None
+        if self.total and avg_mb_per_s > 0:
+            eta = max(self.total - self.bytes, 0) / MB / avg_mb_per_s
+
+        self._t_last = now
+        self._bytes_last = self.bytes
+
+        self._send({
+            'event': 'progress',
+            'bytes': self.bytes,
+            'total': self.total,
+            'elapsed': elapsed,
+            'mb_per_s': mb_per_s,
+            'avg_mb_per_s': avg_mb_per_s,
+            'eta': eta,
+        })
+
+    def complete(self):
+        elapsed = time.monotonic() - self.t_start
+        self._send({
+            'event': 'complete',
+            'bytes': self.bytes,
+            'elapsed': elapsed,
+            'avg_mb_per_s': self.bytes / MB / elapsed if elapsed > 0 else 0.0,
+        })
+
+    def http_error(self, status):
+        self._send({'event': 'http_error', 'status': status})
+
+    def fail(self, error):
+        self._send({
+            'event': 'failed',
+            'bytes': self.bytes,
+            'elapsed': time.monotonic() - self.t_start if self.t_start is not None else 0.0,
+            'error': str(error),
+        })
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+class DownloadTelemetry:
+    """
+    Aggregate counters of all transfers of a list, pool or pipeline download.
+
+    Pass an instance as 'event_callback' to the download functions. Events
+    are counted and forwarded to an optional user callback, with 'retries'
+    raised to the retries of the product counted here. Counters can be written as a Prometheus textfile
+    (e.g. for the node exporter textfile collector).
+    """
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self._lock = threading.Lock()
+
+        self.bytes_total = 0
+        self.n_started = 0
+        self.n_completed = 0
+        self.n_failed = 0
+        self.n_retries = 0
+        self.http_errors = dict()
+        # bytes and time of finished transfers (for the average throughput)
+        self.transfer_bytes_total = 0
+        self.transfer_seconds_total = 0.0
+
+        # product name -> number of attempts
+        self._attempts = dict()
+        # product name -> [bytes, time of last progress] of active transfers
+        self._active = dict()
+
+    def __call__(self, event):
+        name = event.get('product')
+        now = time.monotonic()
+
+        with self._lock:
+            kind = event['event']
+            if kind in ['start', 'http_error']:
+                # every attempt either starts a transfer or fails with an http error
+                attempts = self._attempts.get(name, 0) + 1
+                self._attempts[name] = attempts
+                if attempts > 1:
+                    self.n_retries += 1
+            if kind == 'start':
+                self.n_started += 1
+                self._active[name] = [0, now]
+            elif kind == 'progress':
+                active = self._active.get(name)
+                if active is not None:
+                    self.bytes_total += event['bytes'] - active[0]
+                    active[0] = event['bytes']
+                    active[1] = now
+            elif kind in ['complete', 'failed']:
+                active = self._active.pop(name, [0, now])
+                self.bytes_total += event['bytes'] - active[0]
+                self.transfer_bytes_total += event['bytes']
+                self.transfer_seconds_total += event['elapsed']
+                if kind == 'complete':
+                    self.n_completed += 1
+                else:
+                    self.n_failed += 1
+            elif kind == 'http_error':
+                status = str(event.get('status'))
+                self.http_errors[status] = self.http_errors.get(status, 0) + 1
+
+            event['retries'] = max(self._attempts.get(name, 1) - 1, event.get('retries', 0))
+
+        if self.callback is not None:
+            self.callback(event)
+
+    # ------------------------ #
+
+    def get_counters(self):
+        """
+        Current aggregate counters
+
+        Returns
+        -------
+        counters : dict
+        """
+
+        now = time.monotonic()
+
+        with self._lock:
+            return {
+                'bytes_total': self.bytes_total,
+                'started': self.n_started,
+                'completed': self.n_completed,
+                'failed': self.n_failed,
+                'retries': self.n_retries,
+                'http_errors': dict(self.http_errors),
+                'active': len(self._active),
+                'max_stall_seconds': max([now - t for b, t in self._active.values()], default=0.0),
+                'avg_mb_per_s': self.transfer_bytes_total / MB / self.transfer_seconds_total if self.transfer_seconds_total > 0 else 0.0,
+            }
+
+    def to_prometheus(self, prefix='cdse_download'):
+        """
+        Counters in Prometheus text exposition format
+
+        Returns
+        -------
+        text : metrics text
+        """
+
+        c = self.get_counters()
+
+        lines = [
+            f"# HELP {prefix}_bytes_total Bytes downloaded.",
+            f"# TYPE {prefix}_bytes_total counter",
+            f"{prefix}_bytes_total {c['bytes_total']}",
+            f"# HELP {prefix}_products_total Finished product transfers by result.",
+            f"# TYPE {prefix}_products_total counter",
+            f'{prefix}_products_total{{result="completed"}} {c["completed"]}',
+            f'{prefix}_products_total{{result="failed"}} {c["failed"]}',
+            f"# HELP {prefix}_retries_total Repeated transfer attempts.",
+            f"# TYPE {prefix}_retries_total counter",
+            f"{prefix}_retries_total {c['retries']}",
+            f"# HELP {prefix}_http_errors_total Failed download requests by http status.",
+            f"# TYPE {prefix}_http_errors_total counter",
+        ]
+        for status, count in sorted(c['http_errors'].items()):
+            lines.append(f'{prefix}_http_errors_total{{status="{status}"}} {count}')
+        lines += [
+            f"# HELP {prefix}_active_transfers Transfers in progress.",
+            f"# TYPE {prefix}_active_transfers gauge",
+            f"{prefix}_active_transfers {c['active']}",
+            f"# HELP {prefix}_stall_seconds Longest time since the last progress of an active transfer.",
+            f"# TYPE {prefix}_stall_seconds gauge",
+            f"{prefix}_stall_seconds {c['max_stall_seconds']:.3f}",
+            f"# HELP {prefix}_throughput_mb_per_second Average throughput of finished transfers.",
+            f"# TYPE {prefix}_throughput_mb_per_second gauge",
+            f"{prefix}_throughput_mb_per_second {c['avg_mb_per_s']:.3f}",
+            f"# HELP {prefix}_last_update_timestamp_seconds Time of this export.",
+            f"# TYPE {prefix}_last_update_timestamp_seconds gauge",
+            f"{prefix}_last_update_timestamp_seconds {time.time():.3f}",
+        ]
+
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus_textfile(self, path, prefix='cdse_download'):
+        """
+        Write counters to a Prometheus textfile (atomically, as required by the node exporter)
+
+        Parameters
+        ----------
+        path : output path (should end with '.prom')
+        prefix : metric name prefix (default='cdse_download')
+        """
+
+        path = pathlib.Path(path)
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        tmp_path.write_text(self.to_prometheus(prefix))
+        tmp_path.replace(path)
+        logger.debug(f"Wrote download metrics to {path}")
+
+    def start_textfile_export(self, path, interval=15, prefix='cdse_download'):
+        """
+        Write the Prometheus textfile every 'interval' seconds in a background thread
+        (so stalled transfers show up while a download is running)
+
+        Returns
+        -------
+        stop : threading.Event, set it to stop the export (the file is written a last time)
+        """
+
+        stop = threading.Event()
+
+        def export():
+            while not stop.wait(interval):
+                self.write_prometheus_textfile(path, prefix)
+            self.write_prometheus_textfile(path, prefix)
+
+        threading.Thread(target=export, daemon=True).start()
+
+        return stop
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+# ---- End of <telemetry.py> ----
@@ -0,0 +1,147 @@
+# ---- This is <token_store.py> ----
+
+"""
+Access token store shared by all processes of a user on one host.
+"""
+
+import os
+import json
+import stat
+import time
+import fcntl
+import pathlib
+
+from loguru import logger
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+# default location of the shared token store
+default_token_store_path = pathlib.Path.home() / '.cache' / 'CDSE' / 'tokens.json'
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+class SharedTokenStore:
+    """
+    JSON file with the current token of each account, readable only by its owner (mode 0600).
+
+    Processes read valid tokens under a shared lock. A process that finds the
+    token close to expiry takes the exclusive lock and checks again, so only
+    the first one refreshes the token while the others wait and then reuse it.
+    """
+
+    def __init__(self, store_path=default_token_store_path):
+
+        self.store_path = pathlib.Path(store_path).expanduser().resolve()
+        self.lock_path = self.store_path.with_name(f"{self.store_path.name}.lock")
+
+        self.store_path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+
+        fd = os.open(self.lock_path, os.O_CREAT | os.O_RDWR, 0o600)
+        os.close(fd)
+
+        self._check_permissions()
+
+    def _check_permissions(self):
+        for path in [self.store_path, self.lock_path]:
+            try:
+                mode = path.stat().st_mode
+            except FileNotFoundError:
+                continue
+            if mode & (stat.S_IRWXG | stat.S_IRWXO):
+                logger.warning(f"Restricting permissions of {path} to its owner")
+                os.chmod(path, 0o600)
+
+    # ------------------------ #
+
+    def _read(self):
+        try:
+            with open(self.store_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return dict()
+        except json.JSONDecodeError:
+            logger.warning(f"Ignoring corrupt token store {self.store_path}")
+            return dict()
+
+    def _write(self, tokens):
+        # write to a temporary file and rename, so readers never see a partial file
+        tmp_path = self.store_path.with_name(f"{self.store_path.name}.{os.getpid()}.tmp")
+        fd = os.open(tmp_path, os.O_CREAT | os.O_WRONLY | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(tokens, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.store_path)
+
+    def _locked(self, operation):
+        f = open(self.lock_path, 'r+')
+        fcntl.flock(f, operation)
+        return f
+
+    # ------------------------ #
+
+    def get(self, username, min_validity, request_function):
+        """
+        Get token of an account, refreshing it (once for all processes) when it expires
+
+        Parameters
+        ----------
+        username : CDSE username
+        min_validity : minimum remaining validity of the access token in seconds
+        request_function : function taking the current token dict (or None) and returning a new token dict
+                           with 'access_token' and 'expires_at'
+
+        Returns
+        -------
+        token : token dict
+        """
+
+        with self._locked(fcntl.LOCK_SH):
+            token = self._read().get(username)
+
+        if token is not None and token['expires_at'] - time.time() > min_validity:
+            return token
+
+        with self._locked(fcntl.LOCK_EX):
+            tokens = self._read()
+            token = tokens.get(username)
+
+            # another process may have refreshed the token while we were waiting
+            if token is not None and token['expires_at'] - time.time() > min_validity:
+                logger.debug(f"Reusing token refreshed by another process for {username}")
+                return token
+
+            logger.debug(f"Refreshing shared token for {username}")
+            token = request_function(token)
+            tokens[username] = token
+            self._write(tokens)
+
+        return token
+
+    def invalidate(self, username, access_token=None):
+        """
+        Remove token of an account from the store
+
+        Parameters
+        ----------
+        username : CDSE username
+        access_token : only remove the token if it is this (rejected) access token (default=None, always remove)
+        """
+
+        with self._locked(fcntl.LOCK_EX):
+            tokens = self._read()
+            token = tokens.get(username)
+            if token is None:
+                return
+            if access_token is not None and token['access_token'] != access_token:
+                # already replaced by another process
+                return
+            del tokens[username]
+            self._write(tokens)
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+# ---- End of <token_store.py> ----
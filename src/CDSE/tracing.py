@@ -0,0 +1,264 @@
+# ---- This is <tracing.py> ----
+
+"""
+Lightweight request tracing: timed spans around search stages and http calls.
+Tracing is off by default; disabled spans cost a single check.
+"""
+
+import os
+import json
+import time
+import pathlib
+import threading
+import functools
+import itertools
+import urllib.parse
+
+import requests
+from loguru import logger
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+# active tracer (None: tracing disabled)
+_tracer = None
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+class Tracer:
+    """
+    Collects finished spans and passes them to an optional callback.
+
+    Spans are dicts with name, id, parent (id of the enclosing span in the
+    same thread), start (epoch seconds), duration (seconds), thread and
+    attributes (e.g. url_length, status, response_size for http calls).
+    """
+
+    def __init__(self, trace_path=None, callback=None):
+        self.trace_path = trace_path
+        self.callback = callback
+        self.spans = []
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._local = threading.local()
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def record(self, span):
+        with self._lock:
+            self.spans.append(span)
+        if self.callback is not None:
+            self.callback(span)
+
+    def write(self, trace_path=None):
+        """
+        Write spans as JSON trace file (Chrome trace event format, viewable in Perfetto or chrome://tracing)
+
+        Parameters
+        ----------
+        trace_path : output path (default=None, path given to the tracer)
+        """
+
+        trace_path = pathlib.Path(trace_path or self.trace_path)
+
+        with self._lock:
+            spans = list(self.spans)
+
+        pid = os.getpid()
+        trace_events = [
+            {
+                'name': span['name'],
+                'ph': 'X',
+                'ts': span['start'] * 1e6,
+                'dur': span['duration'] * 1e6,
+                'pid': pid,
+                'tid': span['thread'],
+                'args': {'id': span['id'], 'parent': span['parent'], **span['attributes']},
+            }
+            for span in spans
+        ]
+
+        with open(trace_path, 'w') as f:
+            json.dump({'traceEvents': trace_events, 'displayTimeUnit': 'ms'}, f)
+
+        logger.debug(f"Wrote {len(trace_events)} spans to {trace_path}")
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+class Span:
+    """
+    Timed section of code, used as context manager (see span())
+    """
+
+    __slots__ = ['tracer', 'name', 'attributes', 'id', 'parent', '_t_start', '_t_perf']
+
+    def __init__(self, tracer, name, attributes):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+
+    def set(self, **attributes):
+        """
+        Add attributes to the span
+        """
+
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        stack = self.tracer._stack()
+        self.id = next(self.tracer._ids)
+        self.parent = stack[-1] if stack else None
+        stack.append(self.id)
+        self._t_start = time.time()
+        self._t_perf = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        duration = time.perf_counter() - self._t_perf
+        self.tracer._stack().pop()
+        if exc_type is not None:
+            self.attributes['error'] = repr(exc_value)
+        self.tracer.record({
+            'name': self.name,
+            'id': self.id,
+            'parent': self.parent,
+            'start': self._t_start,
+            'duration': duration,
+            'thread': threading.get_ident(),
+            'attributes': self.attributes,
+        })
+
+class _NoSpan:
+    # returned while tracing is disabled
+
+    __slots__ = []
+
+    def set(self, **attributes):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+_no_span = _NoSpan()
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def enable_tracing(trace_path=None, callback=None):
+    """
+    Start recording spans
+
+    Parameters
+    ----------
+    trace_path : JSON trace file written by disable_tracing (default=None, no file)
+    callback : function called with every finished span dict (default=None)
+
+    Returns
+    -------
+    tracer : active Tracer
+    """
+
+    global _tracer
+
+    _tracer = Tracer(trace_path, callback)
+
+    return _tracer
+
+def disable_tracing():
+    """
+    Stop recording spans (and write the trace file if a path was given)
+
+    Returns
+    -------
+    spans : list of recorded span dicts
+    """
+
+    global _tracer
+
+    tracer, _tracer = _tracer, None
+
+    if tracer is None:
+        return []
+
+    if tracer.trace_path is not None:
+        tracer.write()
+
+    return tracer.spans
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def span(name, **attributes):
+    """
+    Context manager timing a section of code (no-op while tracing is disabled)
+
+    Example
+    -------
+    with CDSE_tracing.span('aoi_conversion', source='geojson') as s:
+        ...
+        s.set(n_points=n)
+    """
+
+    if _tracer is None:
+        return _no_span
+
+    return Span(_tracer, name, attributes)
+
+def traced(name):
+    """
+    Decorator recording a span for every call of a function
+    """
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _tracer is None:
+                return function(*args, **kwargs)
+            with Span(_tracer, name, {}):
+                return function(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def request(method, url, session=None, **kwargs):
+    """
+    http request (requests.request or session.request), recorded as 'http' span
+    with method, endpoint, url_length, status and response_size
+
+    Returns
+    -------
+    response : requests.Response
+    """
+
+    sender = requests if session is None else session
+
+    if _tracer is None:
+        return sender.request(method, url, **kwargs)
+
+    with Span(_tracer, 'http', {'method': method, 'endpoint': urllib.parse.urlsplit(url).path, 'url_length': len(url)}) as s:
+        response = sender.request(method, url, **kwargs)
+        if kwargs.get('stream'):
+            # body is not read yet
+            response_size = int(response.headers.get('Content-Length', -1))
+        else:
+            response_size = len(response.content)
+        s.set(status=response.status_code, response_size=response_size)
+
+    return response
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+# ---- End of <tracing.py> ----
@@ -0,0 +1,164 @@
+# ---- This is <transfer.py> ----
+
+"""
+High-throughput copy of http response bodies into storage sinks.
+"""
+
+import time
+import http.client
+
+import requests
+import urllib3
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+# block alignment of buffer sizes (writes are multiples of this size, except the last one)
+block_size = 64 * 1024
+
+# range and start value of auto-tuned buffer sizes
+min_chunk_size = 256 * 1024
+max_chunk_size = 16 * 1024 * 1024
+initial_chunk_size = 1024 * 1024
+
+# auto-tuning aims for buffer fill times in this range (seconds):
+# long enough to amortize per-call overhead, short enough for responsive progress
+min_fill_seconds = 0.05
+max_fill_seconds = 0.5
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def align_chunk_size(chunk_size):
+    """
+    Round chunk size up to a multiple of the block size
+    """
+
+    return max(block_size, -(-int(chunk_size) // block_size) * block_size)
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+class ChunkSizeTuner:
+    """
+    Adapts the buffer size to the measured throughput: the buffer doubles while
+    it fills faster than 'min_fill_seconds' and halves when filling takes
+    longer than 'max_fill_seconds'.
+    """
+
+    def __init__(self, chunk_size=initial_chunk_size):
+        self.chunk_size = chunk_size
+
+    def update(self, n_bytes, seconds):
+        if n_bytes < self.chunk_size:
+            # short read at the end of the body
+            return self.chunk_size
+        if seconds < min_fill_seconds and self.chunk_size < max_chunk_size:
+            self.chunk_size *= 2
+        elif seconds > max_fill_seconds and self.chunk_size > min_chunk_size:
+            self.chunk_size //= 2
+        return self.chunk_size
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def _get_readinto(response):
+    # readinto of the urllib3 response (urllib3 >= 1.26), None if not available
+    return getattr(response.raw, 'readinto', None)
+
+def _fill(readinto, view):
+    # read until the buffer is full or the body ends (single reads may return less)
+    n_filled = 0
+    n_total = len(view)
+    while n_filled < n_total:
+        try:
+            n = readinto(view[n_filled:])
+        except (urllib3.exceptions.HTTPError, http.client.HTTPException, OSError) as e:
+            # same exception type as requests' iter_content
+            raise requests.exceptions.ConnectionError(e)
+        if not n:
+            break
+        n_filled += n
+    return n_filled
+
+def copy_response_to_sink(response, sink, chunk_size=None, progress=None):
+    """
+    Copy a streamed http response body into a sink.
+
+    The body is read with the urllib3 readinto into one reusable buffer and
+    written to the sink in large block-aligned writes. urllib3 implements
+    readinto with read(), so every fill still allocates and copies one bytes
+    object; the gain over iter_content comes from fewer, larger reads and writes.
+    Responses with a content encoding (or raw responses without readinto)
+    are read with iter_content instead.
+
+    Parameters
+    ----------
+    response : streamed requests.Response
+    sink : CDSE.sinks.Sink (receives memoryviews of the reused buffer)
+    chunk_size : buffer size in bytes (default=None, auto-tuned from the measured throughput)
+    progress : CDSE.telemetry.TransferProgress (default=None)
+
+    Returns
+    -------
+    n_bytes : number of copied bytes
+    """
+
+    n_bytes = 0
+
+    readinto = _get_readinto(response)
+
+    if readinto is None or response.headers.get('Content-Encoding', 'identity') != 'identity':
+        for chunk in response.iter_content(chunk_size=chunk_size or initial_chunk_size):
+            if chunk:
+                sink.write(chunk)
+                n_bytes += len(chunk)
+                if progress is not None:
+                    progress.update(len(chunk))
+        return n_bytes
+
+    tuner = None
+    if chunk_size is None:
+        tuner = ChunkSizeTuner()
+        chunk_size = tuner.chunk_size
+    else:
+        chunk_size = align_chunk_size(chunk_size)
+
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+
+    while True:
+        t_start = time.perf_counter()
+        n = _fill(readinto, view)
+        if n == 0:
+            break
+
+        sink.write(view[:n])
+        n_bytes += n
+        if progress is not None:
+            progress.update(n)
+
+        if n < len(view):
+            # end of body
+            break
+
+        if tuner is not None:
+            new_chunk_size = tuner.update(n, time.perf_counter() - t_start)
+            if new_chunk_size != len(buffer):
+                view.release()
+                buffer = bytearray(new_chunk_size)
+                view = memoryview(buffer)
+
+    view.release()
+
+    # a dropped connection ends the body early without an error from http.client
+    content_length = response.headers.get('Content-Length')
+    if content_length is not None and n_bytes != int(content_length):
+        raise requests.exceptions.ConnectionError(f"Incomplete read: received {n_bytes} of {content_length} bytes")
+
+    return n_bytes
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+# ---- End of <transfer.py> ----
@@ -8,14 +8,12 @@ import sys
 import pathlib
 import os
 
-from dotenv import load_dotenv
-
 from loguru import logger
 
-from shapely.wkt import loads
-from shapely.geometry import Polygon, MultiPolygon
 import json
 
+# dotenv and shapely are imported on first use (fast import of the package)
+
 # -------------------------------------------------------------------------- #
 # -------------------------------------------------------------------------- #
 
@@ -72,6 +70,7 @@ def get_user_and_passwd(dotenv_path='.env'):
         logger.error(f"Could not find 'dotenv_path': {dotenv_path}")
         return CDSE_user, CDSE_passwd
 
+    from dotenv import load_dotenv
     load_dotenv(dotenv_path)
 
     try:
@@ -91,6 +90,55 @@ def get_user_and_passwd(dotenv_path='.env'):
 # -------------------------------------------------------------------------- #
 # -------------------------------------------------------------------------- #
 
+def get_user_and_passwd_list(dotenv_path='.env'):
+    """
+    Read several CDSE accounts from hidden .env file.
+    Accounts are given as CDSE_USER/CDSE_PASSWORD and numbered
+    CDSE_USER_1/CDSE_PASSWORD_1, CDSE_USER_2/CDSE_PASSWORD_2, ...
+
+    Parameters
+    ----------
+    dotenv_path : path to hidden .env file
+
+    Returns
+    -------
+    credentials : list of (CDSE user name, CDSE password) tuples
+    """
+
+    logger.debug('Loading environment variables from .env file')
+
+    credentials = []
+
+    dotenv_path = pathlib.Path(dotenv_path).resolve()
+
+    if not dotenv_path.is_file():
+        logger.error(f"Could not find 'dotenv_path': {dotenv_path}")
+        return credentials
+
+    from dotenv import load_dotenv
+    load_dotenv(dotenv_path)
+
+    if "CDSE_USER" in os.environ and "CDSE_PASSWORD" in os.environ:
+        credentials.append((os.environ["CDSE_USER"], os.environ["CDSE_PASSWORD"]))
+
+    i = 1
+    while f"CDSE_USER_{i}" in os.environ:
+        if f"CDSE_PASSWORD_{i}" not in os.environ:
+            logger.error(f"The environment variable 'CDSE_PASSWORD_{i}' is not set.")
+        else:
+            credentials.append((os.environ[f"CDSE_USER_{i}"], os.environ[f"CDSE_PASSWORD_{i}"]))
+        i += 1
+
+    if not credentials:
+        logger.error("No CDSE accounts found in environment variables.")
+
+    logger.debug(f"Found {len(credentials)} CDSE accounts")
+
+    return credentials
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
 def get_product_footprint_and_center(p):
     """
     Extract footprint and center from input product dict
@@ -121,6 +169,9 @@ def get_product_footprint_and_center(p):
     # Get footprint of example product
     footprint = p["Footprint"].split(";")[1].strip("'")
 
+    from shapely.wkt import loads
+    from shapely.geometry import Polygon, MultiPolygon
+
     # Load the polygon using shapely
     polygon = loads(footprint)
 
@@ -163,6 +214,8 @@ def write_polygon_2_geojson(polygon, geojson_path):
     geojson : True/False
     """
 
+    from shapely.geometry import Polygon, MultiPolygon
+
     logger.debug("Exporting shapely.geometry.polygon.Polygon as geojson file")
 
     if not isinstance(polygon, Polygon):
@@ -0,0 +1,769 @@
+# ---- This is <watcher.py> ----
+
+"""
+Long-running watcher of AOI and filter subscriptions with coalesced catalogue polling.
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import pathlib
+import datetime
+import threading
+import concurrent.futures
+
+from loguru import logger
+
+import requests
+
+import CDSE.aoi_cache as CDSE_aoi_cache
+import CDSE.access_token_credentials as CDSE_atc
+import CDSE.product as CDSE_product
+import CDSE.search_and_download as CDSE_sd
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+# default time between two poll cycles (seconds)
+default_poll_interval = 600
+
+# default search window: products with a sensing start in the last days
+default_lookback_days = 3
+
+# maximum length of the merged AOI (WKT) of one query, longer urls are rejected by the catalogue
+default_max_aoi_length = 4000
+
+# default number of parallel catalogue queries and downloads
+default_n_query_threads = 4
+default_n_download_threads = 2
+
+# failed downloads are retried in the following cycles, then dropped
+default_max_attempts = 3
+
+# version of the state file layout
+state_version = 1
+
+# product keys kept for pending downloads
+pending_product_keys = ['Id', 'Name', 'ContentLength', 'ContentDate', 'Online']
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+class Subscription:
+    """
+    AOI and filter subscription of the watcher.
+
+    Subscriptions with the same sensor, sensor_mode, product_type and
+    processing_level share catalogue queries (see AOIWatcher). Their AOIs
+    are merged, relative orbits are joined and the highest max_cloud_cover
+    is used, so every product of the merged query is checked against the
+    AOI and filters of each subscription.
+    """
+
+    def __init__(
+        self,
+        name,
+        sensor,
+        area,
+        sensor_mode = None,
+        product_type = None,
+        processing_level = None,
+        relative_orbit = None,
+        max_cloud_cover = 100,
+        lookback_days = default_lookback_days,
+        download_dir = None
+    ):
+
+        if sensor not in CDSE_sd.valid_sensors:
+            raise ValueError(f"Subscription '{name}': 'sensor' must be one of {CDSE_sd.valid_sensors}")
+
+        if type(area) is dict:
+            if 'lat' not in area or 'lon' not in area:
+                raise ValueError(f"Subscription '{name}': 'area' dict must have 'lat' and 'lon' keys")
+        elif not pathlib.Path(area).is_file():
+            raise ValueError(f"Subscription '{name}': cannot find search area file '{area}'")
+
+        self.name = name
+        self.sensor = sensor.upper()
+        self.area = area
+        self.sensor_mode = sensor_mode
+        self.product_type = product_type
+        self.processing_level = processing_level
+        self.relative_orbit = relative_orbit
+        self.max_cloud_cover = max_cloud_cover
+        self.lookback_days = lookback_days
+        self.download_dir = None if download_dir is None else pathlib.Path(download_dir)
+
+    def __repr__(self):
+        return f"Subscription({self.name!r}, {self.sensor}, {self.area!r})"
+
+    # ------------------------ #
+
+    @property
+    def query_key(self):
+        """
+        Filters that must be equal for subscriptions sharing a query
+        """
+
+        return (self.sensor, self.sensor_mode, self.product_type, self.processing_level)
+
+    @property
+    def area_key(self):
+        """
+        Identity of the AOI (resolved geojson path or lat/lon)
+        """
+
+        if type(self.area) is dict:
+            return ('lat_lon', self.area['lat'], self.area['lon'])
+        return ('geojson', str(pathlib.Path(self.area).resolve()))
+
+    @property
+    def relative_orbits(self):
+        """
+        Relative orbits as list (None for all orbits)
+        """
+
+        if self.relative_orbit is None:
+            return None
+        if isinstance(self.relative_orbit, (list, tuple)):
+            return [int(orbit) for orbit in self.relative_orbit]
+        return [int(self.relative_orbit)]
+
+    def get_aoi_shape(self):
+        """
+        AOI as shapely geometry (cached with the AOI, see CDSE.aoi_cache)
+        """
+
+        entry = CDSE_aoi_cache.get_aoi_entry(self.area)
+
+        if 'shapely_geometry' not in entry.derived:
+            from shapely.geometry import shape
+            from shapely.ops import unary_union
+            entry.derived['shapely_geometry'] = unary_union([shape(g) for g in _geometries(entry.geometry)])
+
+        return entry.derived['shapely_geometry']
+
+    def matches(self, product):
+        """
+        Check a product of a (merged) query against the AOI and filters of the subscription
+
+        Parameters
+        ----------
+        product : CDSE.product.Product
+
+        Returns
+        -------
+        match : True/False
+        """
+
+        if self.relative_orbits is not None:
+            if product.get_attribute('relativeOrbitNumber') not in self.relative_orbits:
+                return False
+
+        if self.sensor == 'SENTINEL-2' and self.max_cloud_cover < 100:
+            cloud_cover = product.get_attribute('cloudCover')
+            if cloud_cover is not None and cloud_cover > self.max_cloud_cover:
+                return False
+
+        footprint = product.footprint
+        if footprint is None:
+            logger.debug(f"No footprint, assigning product to subscription '{self.name}': {product.Name}")
+            return True
+
+        return footprint.intersects(self.get_aoi_shape())
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def _geometries(geojson_obj):
+    # list of geometries of a geojson geometry, feature or feature collection
+    if "features" in geojson_obj:
+        return [feature["geometry"] for feature in geojson_obj["features"]]
+    if "geometry" in geojson_obj:
+        return [geojson_obj["geometry"]]
+    return [geojson_obj]
+
+def load_subscriptions(config_path):
+    """
+    Read subscriptions from a json file
+
+    The file holds a list of subscriptions (or a dict with a 'subscriptions' list).
+    Every subscription is a dict with the arguments of Subscription, e.g.
+    {"name": "svalbard_ew", "sensor": "SENTINEL-1", "area": "svalbard.geojson",
+     "sensor_mode": "EW", "product_type": "GRD", "download_dir": "downloads/svalbard"}
+    Relative AOI and download paths are relative to the json file.
+    Invalid subscriptions (e.g. missing AOI file) are logged and left out.
+
+    Parameters
+    ----------
+    config_path : path to json file
+
+    Returns
+    -------
+    subscriptions : list of Subscription
+    """
+
+    config_path = pathlib.Path(config_path)
+
+    with open(config_path) as f:
+        config = json.load(f)
+
+    if type(config) is dict:
+        config = config['subscriptions']
+
+    subscriptions = []
+    for kwargs in config:
+        kwargs = dict(kwargs)
+        if type(kwargs['area']) is not dict:
+            kwargs['area'] = config_path.parent / kwargs['area']
+        if kwargs.get('download_dir') is not None:
+            kwargs['download_dir'] = config_path.parent / kwargs['download_dir']
+        try:
+            subscriptions.append(Subscription(**kwargs))
+        except (TypeError, ValueError) as e:
+            logger.error(f"Skipping invalid subscription {kwargs.get('name')}: {e}")
+
+    names = [subscription.name for subscription in subscriptions]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Subscription names must be unique: {names}")
+
+    return subscriptions
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+class AOIWatcher:
+    """
+    Polls the catalogue for new products of many subscriptions.
+
+    Every poll cycle merges the subscriptions into as few catalogue queries
+    as possible (one per set of query filters, split only if the merged AOI
+    gets too long), routes each new product to every subscription it
+    matches and downloads it once per download directory. The HTTP session
+    and access token are kept between cycles. Products already routed and
+    pending downloads are stored per subscription in a json state file, so
+    a restarted watcher continues where it stopped.
+    """
+
+    def __init__(
+        self,
+        subscriptions,
+        state_path,
+        username = None,
+        password = None,
+        max_aoi_length = default_max_aoi_length,
+        n_query_threads = default_n_query_threads,
+        n_download_threads = default_n_download_threads,
+        max_attempts = default_max_attempts,
+        lock_policy = None,
+        on_match = None,
+        event_callback = None,
+        loglevel = 'INFO'
+    ):
+
+        self.subscriptions = list(subscriptions)
+        self.state_path = pathlib.Path(state_path)
+        self.username = username
+        self.password = password
+        self.max_aoi_length = max_aoi_length
+        self.n_query_threads = n_query_threads
+        self.n_download_threads = n_download_threads
+        self.max_attempts = max_attempts
+        self.lock_policy = lock_policy
+        self.on_match = on_match
+        self.event_callback = event_callback
+        self.loglevel = loglevel
+
+        # merged query areas are written next to the state file
+        self.query_dir = self.state_path.parent / f"{self.state_path.stem}_queries"
+
+        # connections are kept alive between cycles
+        self._session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=max(n_query_threads, n_download_threads))
+        self._session.mount('https://', adapter)
+        self._session.mount('http://', adapter)
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+        self._state = {'version': state_version, 'subscriptions': dict()}
+        if self.state_path.is_file():
+            self.load_state()
+        for subscription in self.subscriptions:
+            self._get_subscription_state(subscription.name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """
+        Close the HTTP session
+        """
+
+        self._session.close()
+
+    # ------------------------ #
+
+    def _get_subscription_state(self, name):
+        return self._state['subscriptions'].setdefault(name, {
+            'seen': dict(),
+            'pending': dict(),
+            'last_poll': None,
+            'n_matched': 0,
+            'n_downloaded': 0,
+            'n_dropped': 0,
+        })
+
+    def load_state(self):
+        """
+        Read the state file
+        """
+
+        with open(self.state_path) as f:
+            state = json.load(f)
+
+        if state.get('version') != state_version:
+            logger.warning(f"Ignoring watcher state {self.state_path} with a different version")
+            return
+
+        self._state = state
+
+    def save_state(self):
+        """
+        Write the state file (atomic rename)
+        """
+
+        with self._lock:
+            state_string = json.dumps(self._state)
+
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.state_path.with_name(f"{self.state_path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, 'w') as f:
+            f.write(state_string)
+        os.replace(tmp_path, self.state_path)
+
+    def get_status(self):
+        """
+        Status of all subscriptions
+
+        Returns
+        -------
+        status : dict from subscription name to dict with last_poll, n_seen, n_pending,
+                 n_matched, n_downloaded and n_dropped
+        """
+
+        with self._lock:
+            return {
+                subscription.name: {
+                    'last_poll': state['last_poll'],
+                    'n_seen': len(state['seen']),
+                    'n_pending': len(state['pending']),
+                    'n_matched': state['n_matched'],
+                    'n_downloaded': state['n_downloaded'],
+                    'n_dropped': state['n_dropped'],
+                }
+                for subscription in self.subscriptions
+                for state in [self._state['subscriptions'][subscription.name]]
+            }
+
+    # ------------------------ #
+
+    def plan_queries(self, now=None):
+        """
+        Merge the subscriptions into catalogue queries
+
+        Parameters
+        ----------
+        now : end of the search windows (default=None, current time)
+
+        Returns
+        -------
+        queries : list of dicts with query_key, subscriptions (sharing the query) and querySTR
+        """
+
+        now = now or datetime.datetime.now(datetime.timezone.utc)
+
+        # AOIs are read (or checked for changes) here, a missing or invalid AOI only skips its subscription
+        aoi_lengths = dict()
+        aoi_bounds = dict()
+        groups = dict()
+        for subscription in self.subscriptions:
+            try:
+                if subscription.area_key not in aoi_lengths:
+                    aoi_lengths[subscription.area_key] = len(CDSE_aoi_cache.get_aoi_string(subscription.area, decimals=4))
+                    aoi_bounds[subscription.area_key] = _get_bounds(subscription.area)
+            except (OSError, ValueError, KeyError, TypeError, IndexError) as e:
+                logger.error(f"Skipping subscription '{subscription.name}' in this cycle, cannot read its AOI: {e}")
+                continue
+            groups.setdefault(subscription.query_key, []).append(subscription)
+
+        queries = []
+
+        for query_key, subscriptions in groups.items():
+
+            # pack distinct AOIs into merged areas (neighbouring AOIs together)
+            areas = dict()
+            for subscription in subscriptions:
+                areas.setdefault(subscription.area_key, subscription.area)
+            area_list = sorted(areas.items(), key=lambda item: aoi_bounds[item[0]])
+
+            batches = [[]]
+            batch_length = 0
+            for area_key, area in area_list:
+                aoi_length = aoi_lengths[area_key]
+                if batches[-1] and batch_length + aoi_length > self.max_aoi_length:
+                    batches.append([])
+                    batch_length = 0
+                batches[-1].append((area_key, area))
+                batch_length += aoi_length + 2
+
+            # the filters of the merged query include all products any subscription accepts
+            if any(subscription.relative_orbits is None for subscription in subscriptions):
+                relative_orbit = None
+            else:
+                relative_orbit = sorted(set(orbit for subscription in subscriptions for orbit in subscription.relative_orbits))
+            max_cloud_cover = max(subscription.max_cloud_cover for subscription in subscriptions)
+            start = now - datetime.timedelta(days=max(subscription.lookback_days for subscription in subscriptions))
+            end = now + datetime.timedelta(days=1)
+
+            sensor, sensor_mode, product_type, processing_level = query_key
+
+            for batch in batches:
+                try:
+                    query_area = self._write_query_area(query_key, batch)
+                except (OSError, ValueError, KeyError, TypeError) as e:
+                    logger.error(f"Could not write merged query area of subscriptions {[s.name for s in subscriptions]}: {e}")
+                    continue
+                querySTR = CDSE_sd.build_CDSE_query_url(
+                    sensor = sensor,
+                    area = query_area,
+                    start_date = start.strftime('%Y-%m-%d'),
+                    end_date = end.strftime('%Y-%m-%d'),
+                    start_time = start.strftime('%H:%M:%S'),
+                    sensor_mode = sensor_mode,
+                    product_type = product_type,
+                    processing_level = processing_level,
+                    relative_orbit = relative_orbit,
+                    max_cloud_cover = max_cloud_cover,
+                    loglevel = self.loglevel
+                )
+                if querySTR is None:
+                    logger.error(f"Invalid search parameters of subscriptions {[s.name for s in subscriptions]}")
+                    continue
+                queries.append({'query_key': query_key, 'subscriptions': subscriptions, 'querySTR': querySTR})
+
+        logger.info(f"Merged {len(self.subscriptions)} subscriptions into {len(queries)} queries")
+
+        return queries
+
+    def _write_query_area(self, query_key, batch):
+        # merged AOI as geojson file, rewritten only on changes (keeps the AOI cache entry valid)
+        if len(batch) == 1:
+            return batch[0][1]
+
+        features = []
+        for area_key, area in batch:
+            for geometry in _geometries(CDSE_aoi_cache.get_aoi_geometry(area)):
+                features.append({'type': 'Feature', 'properties': {}, 'geometry': geometry})
+        content = json.dumps({'type': 'FeatureCollection', 'features': features})
+
+        digest = hashlib.sha1(repr((query_key, [area_key for area_key, area in batch])).encode()).hexdigest()[:16]
+        query_area_path = self.query_dir / f"query_{digest}.geojson"
+
+        if not query_area_path.is_file() or query_area_path.read_text() != content:
+            self.query_dir.mkdir(parents=True, exist_ok=True)
+            tmp_path = query_area_path.with_name(f"{query_area_path.name}.{os.getpid()}.tmp")
+            tmp_path.write_text(content)
+            os.replace(tmp_path, query_area_path)
+
+        return query_area_path
+
+    # ------------------------ #
+
+    def poll(self):
+        """
+        Run one poll cycle: query, route new products to subscriptions, download, save state
+
+        Returns
+        -------
+        summary : dict with n_queries, n_products (unique products found), n_matched (new
+                  product/subscription matches), n_downloaded and n_failed
+        """
+
+        now = datetime.datetime.now(datetime.timezone.utc)
+        summary = {'n_queries': 0, 'n_products': 0, 'n_matched': 0, 'n_downloaded': 0, 'n_failed': 0}
+
+        # renew the access token ahead of expiry (keeps the refresh token alive between cycles)
+        if self.username is not None:
+            try:
+                CDSE_atc.get_cached_access_token(self.username, self.password)
+            except Exception as e:
+                logger.error(f"Could not renew access token: {e}")
+
+        queries = self.plan_queries(now)
+        summary['n_queries'] = len(queries)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.n_query_threads) as executor:
+            futures = [executor.submit(CDSE_sd._fetch_all_pages, query['querySTR'], session=self._session) for query in queries]
+
+        # products of all queries of a filter group, each listed once
+        group_products = dict()
+        failed_groups = set()
+        for query, future in zip(queries, futures):
+            try:
+                products = future.result()
+            except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+                logger.error(f"Query failed, retrying in the next cycle: {e}")
+                failed_groups.add(query['query_key'])
+                continue
+            group = group_products.setdefault(query['query_key'], (query['subscriptions'], dict()))
+            for product in products:
+                group[1].setdefault(product['Id'], product)
+
+        for query_key, (subscriptions, products) in group_products.items():
+            summary['n_products'] += len(products)
+            summary['n_matched'] += self._route(subscriptions, products.values(), now, complete=query_key not in failed_groups)
+
+        summary['n_downloaded'], summary['n_failed'] = self._download_pending()
+
+        self.save_state()
+
+        logger.info(f"Poll cycle: {summary}")
+
+        return summary
+
+    def _route(self, subscriptions, products, now, complete):
+        # record new products of every matching subscription, returns the number of new matches
+        n_matched = 0
+
+        products = [CDSE_product.Product(product) if type(product) is dict else product for product in products]
+
+        for subscription in subscriptions:
+            with self._lock:
+                state = self._state['subscriptions'][subscription.name]
+                seen = state['seen']
+
+            try:
+                subscription.get_aoi_shape()
+            except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+                logger.error(f"Cannot route products to subscription '{subscription.name}': {e}")
+                continue
+
+            for product in products:
+                if product.Id in seen or not subscription.matches(product):
+                    continue
+
+                with self._lock:
+                    seen[product.Id] = now.timestamp()
+                    state['n_matched'] += 1
+                    if subscription.download_dir is not None:
+                        product_dict = product.to_dict()
+                        state['pending'][product.Id] = {
+                            'product': {key: product_dict[key] for key in pending_product_keys if key in product_dict},
+                            'attempts': 0,
+                        }
+                n_matched += 1
+
+                logger.info(f"New product for subscription '{subscription.name}': {product.Name}")
+                if self.on_match is not None:
+                    self.on_match(subscription, product)
+
+            with self._lock:
+                if complete:
+                    state['last_poll'] = now.isoformat()
+                # products first seen before the search window can not be found again
+                oldest = now.timestamp() - (subscription.lookback_days + 1) * 86400
+                state['seen'] = {product_id: t for product_id, t in seen.items() if t >= oldest}
+
+        return n_matched
+
+    def _download_pending(self):
+        # download pending products once per download directory, returns (n_downloaded, n_failed)
+        subscriptions = {subscription.name: subscription for subscription in self.subscriptions}
+
+        # (product Id, download_dir) -> (product, names of waiting subscriptions)
+        tasks = dict()
+        with self._lock:
+            for name, state in self._state['subscriptions'].items():
+                if name not in subscriptions or subscriptions[name].download_dir is None:
+                    continue
+                for product_id, pending in state['pending'].items():
+                    task = tasks.setdefault((product_id, subscriptions[name].download_dir), (pending['product'], []))
+                    task[1].append(name)
+
+        if not tasks:
+            return 0, 0
+
+        if self.username is None:
+            logger.warning(f"No CDSE credentials, {len(tasks)} downloads are pending")
+            return 0, 0
+
+        def download(task):
+            (product_id, download_dir), (product, names) = task
+            try:
+                download_dir.mkdir(parents=True, exist_ok=True)
+                return CDSE_sd.download_product_from_cdse(
+                    product,
+                    download_dir,
+                    self.username,
+                    self.password,
+                    lock_policy = self.lock_policy,
+                    event_callback = self.event_callback,
+                    session = self._session
+                )
+            except Exception as e:
+                # includes failed token requests (e.g. wrong credentials), counted as a failed attempt
+                logger.error(f"Download of {product['Name']} failed: {e}")
+                return False
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.n_download_threads) as executor:
+            results = list(executor.map(download, tasks.items()))
+
+        n_downloaded = 0
+        n_failed = 0
+
+        with self._lock:
+            for ((product_id, download_dir), (product, names)), downloaded in zip(tasks.items(), results):
+                n_downloaded += downloaded
+                n_failed += not downloaded
+                for name in names:
+                    state = self._state['subscriptions'][name]
+                    pending = state['pending'][product_id]
+                    pending['attempts'] += 1
+                    if downloaded:
+                        state['n_downloaded'] += 1
+                    elif pending['attempts'] >= self.max_attempts:
+                        logger.error(f"Dropping {product['Name']} of subscription '{name}' after {pending['attempts']} attempts")
+                        state['n_dropped'] += 1
+                    else:
+                        continue
+                    del state['pending'][product_id]
+
+        return n_downloaded, n_failed
+
+    # ------------------------ #
+
+    def run(self, poll_interval=default_poll_interval, max_cycles=None):
+        """
+        Poll until stop() is called (or max_cycles cycles are done)
+
+        Parameters
+        ----------
+        poll_interval : time between the starts of two poll cycles in seconds (default=600)
+        max_cycles : maximum number of poll cycles (default=None, no limit)
+        """
+
+        n_cycles = 0
+
+        while not self._stop.is_set():
+            t_start = time.monotonic()
+            try:
+                self.poll()
+            except Exception as e:
+                logger.exception(f"Poll cycle failed: {e}")
+            n_cycles += 1
+            if max_cycles is not None and n_cycles >= max_cycles:
+                break
+            self._stop.wait(max(0, poll_interval - (time.monotonic() - t_start)))
+
+        logger.info(f"Watcher stopped after {n_cycles} poll cycles")
+
+    def stop(self):
+        """
+        Stop run() after the current poll cycle
+        """
+
+        self._stop.set()
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def _get_bounds(area):
+    # (min lon, min lat) of an AOI, orders AOIs so that neighbours are merged into one query
+    coordinates = []
+    def collect(c):
+        if c and isinstance(c[0], (int, float)):
+            coordinates.append(c)
+        else:
+            for item in c:
+                collect(item)
+    for geometry in _geometries(CDSE_aoi_cache.get_aoi_geometry(area)):
+        collect(geometry.get('coordinates') or [])
+    if not coordinates:
+        return (0.0, 0.0)
+    return (min(c[0] for c in coordinates), min(c[1] for c in coordinates))
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def run_watcher(
+    config_path,
+    state_path = None,
+    username = None,
+    password = None,
+    poll_interval = default_poll_interval,
+    max_cycles = None,
+    n_download_threads = default_n_download_threads,
+    lock_policy = None,
+    loglevel = 'INFO'
+):
+    """
+    Run the watcher with subscriptions from a json file until SIGINT/SIGTERM
+
+    Parameters
+    ----------
+    config_path : json file with subscriptions (see load_subscriptions)
+    state_path : json state file (default=None, '<config>.state.json' next to the config)
+    username : CDSE username (default=None, products are recorded but not downloaded)
+    password : CDSE password (default=None)
+    poll_interval : time between the starts of two poll cycles in seconds (default=600)
+    max_cycles : maximum number of poll cycles (default=None, no limit)
+    n_download_threads : number of parallel downloads (default=2)
+    lock_policy : coordinate with other workers using lock files (None, 'wait', 'skip') (default=None)
+    loglevel : loglevel setting (default='INFO')
+
+    Returns
+    -------
+    status : status of all subscriptions (see AOIWatcher.get_status)
+    """
+
+    import signal
+
+    # remove default logger handler and add personal one
+    logger.remove()
+    logger.add(sys.stderr, level=loglevel)
+
+    config_path = pathlib.Path(config_path)
+    if state_path is None:
+        state_path = config_path.with_name(f"{config_path.stem}.state.json")
+
+    subscriptions = load_subscriptions(config_path)
+    logger.info(f"Watching {len(subscriptions)} subscriptions, state in {state_path}")
+
+    with AOIWatcher(
+        subscriptions,
+        state_path,
+        username = username,
+        password = password,
+        n_download_threads = n_download_threads,
+        lock_policy = lock_policy,
+        loglevel = loglevel
+    ) as watcher:
+
+        if threading.current_thread() is threading.main_thread():
+            for signal_number in (signal.SIGINT, signal.SIGTERM):
+                signal.signal(signal_number, lambda *args: watcher.stop())
+
+        watcher.run(poll_interval=poll_interval, max_cycles=max_cycles)
+
+        return watcher.get_status()
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+# ---- End of <watcher.py> ----
@@ -0,0 +1,55 @@
+# ---- This is <conftest.py> ----
+
+"""
+Shared fixtures: a mock CDSE server with redirected endpoints and clean per-process caches.
+"""
+
+import urllib.parse
+
+import pytest
+
+import CDSE.aoi_cache as CDSE_aoi_cache
+import CDSE.access_token_credentials as CDSE_atc
+import CDSE.mock_server as CDSE_mock
+import CDSE.s2_tile_index as CDSE_tiles
+import CDSE.tracing as CDSE_tracing
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+@pytest.fixture(autouse=True)
+def clean_caches():
+    # tokens and AOIs of one test must not leak into the next
+    CDSE_aoi_cache.invalidate_aoi_cache()
+    CDSE_atc._token_cache.clear()
+    yield
+    CDSE_aoi_cache.invalidate_aoi_cache()
+    CDSE_atc._token_cache.clear()
+
+@pytest.fixture
+def mock_server():
+    # 40 products over Svalbard (see CDSE.mock_server.build_synthetic_product), small payloads
+    server = CDSE_mock.MockCDSEServer(n_products=40, product_size=64 * 1024, seed=0)
+    with server, CDSE_mock.use_mock_endpoints(server):
+        yield server
+
+@pytest.fixture
+def catalogue_queries(monkeypatch):
+    # decoded urls of all catalogue requests
+    queries = []
+    request = CDSE_tracing.request
+    def recording_request(method, url, *args, **kwargs):
+        queries.append(urllib.parse.unquote(url))
+        return request(method, url, *args, **kwargs)
+    monkeypatch.setattr(CDSE_tracing, 'request', recording_request)
+    return queries
+
+@pytest.fixture(scope='session')
+def s2_tile_index(tmp_path_factory):
+    # tile index built once per test session, outside of the user cache
+    return CDSE_tiles.get_s2_tile_index(tmp_path_factory.mktemp('s2_tile_index'))
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+# ---- End of <conftest.py> ----
@@ -0,0 +1,101 @@
+# ---- This is <test_aoi_cache.py> ----
+
+"""
+Test the AOI cache: hits, invalidation of changed files and derived values.
+"""
+
+import os
+import json
+
+import pytest
+
+import CDSE.aoi_cache as CDSE_aoi_cache
+import CDSE.json_utils as CDSE_json
+import CDSE.search_and_download as CDSE_sd
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def _write_polygon(path, lon, lat, mtime=None):
+    geometry = {'type': 'Polygon', 'coordinates': [[[lon, lat], [lon + 1, lat], [lon + 1, lat + 1], [lon, lat + 1], [lon, lat]]]}
+    path.write_text(json.dumps(geometry))
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+    return path
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def test_hits_and_invalidation_of_changed_file(tmp_path):
+    cache = CDSE_aoi_cache.AOICache()
+    area = _write_polygon(tmp_path / 'aoi.geojson', 10, 78, mtime=1000)
+
+    first = cache.get(area)
+    assert cache.get(str(area)) is first
+    assert first.aoi_string.startswith('POLYGON((10.0000 78.0000,')
+
+    first.derived['value'] = 1
+    _write_polygon(area, 20, 78, mtime=2000)
+    second = cache.get(area)
+
+    assert second is not first
+    assert 'value' not in second.derived
+    assert second.aoi_string.startswith('POLYGON((20.0000 78.0000,')
+
+    stats = cache.get_stats()
+    assert (stats['hits'], stats['misses'], stats['invalidations']) == (1, 2, 1)
+
+def test_decimals_are_separate_entries(tmp_path):
+    cache = CDSE_aoi_cache.AOICache()
+    area = _write_polygon(tmp_path / 'aoi.geojson', 10.123456, 78.123456)
+
+    assert cache.get(area, decimals=2).aoi_string != cache.get(area, decimals=4).aoi_string
+    assert len(cache) == 2
+
+    assert cache.invalidate(area) == 2
+    assert len(cache) == 0
+
+@pytest.mark.parametrize('decimals', [4, CDSE_json.max_vectorized_decimals + 1])
+def test_geometry_is_not_modified(tmp_path, decimals):
+    geometry = {'type': 'Polygon', 'coordinates': [[[10, 78, 5], [11, 78, 5], [11, 79, 5], [10, 78, 5]]]}
+    area = tmp_path / 'aoi.geojson'
+    area.write_text(json.dumps(geometry))
+
+    entry = CDSE_aoi_cache.AOICache().get(area, decimals=decimals)
+
+    assert entry.aoi_string.startswith('POLYGON((10')
+    assert entry.geometry == geometry
+
+def test_lru_eviction():
+    cache = CDSE_aoi_cache.AOICache(max_entries=2)
+
+    cache.get({'lat': 1, 'lon': 1})
+    cache.get({'lat': 2, 'lon': 2})
+    cache.get({'lat': 1, 'lon': 1})
+    cache.get({'lat': 3, 'lon': 3})
+
+    assert cache.get_stats()['evictions'] == 1
+    # least recently used entry was evicted
+    cache.get({'lat': 1, 'lon': 1})
+    assert cache.get_stats()['misses'] == 3
+
+def test_missing_file():
+    with pytest.raises(FileNotFoundError):
+        CDSE_aoi_cache.AOICache().get('does_not_exist.geojson')
+
+def test_query_url_uses_one_cache_lookup(tmp_path):
+    area = _write_polygon(tmp_path / 'aoi.geojson', 10, 78)
+
+    querySTR = CDSE_sd.build_CDSE_query_url('SENTINEL-1', area, '2022-06-01', '2022-07-01', loglevel='ERROR')
+
+    assert querySTR is not None
+    assert CDSE_aoi_cache.get_aoi_string(area) in querySTR
+    stats = CDSE_aoi_cache.get_aoi_cache_stats()
+    assert (stats['hits'], stats['misses']) == (1, 1)
+
+    assert CDSE_sd.build_CDSE_query_url('SENTINEL-1', tmp_path / 'missing.geojson', '2022-06-01', '2022-07-01', loglevel='CRITICAL') is None
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+# ---- End of <test_aoi_cache.py> ----
@@ -0,0 +1,132 @@
+# ---- This is <test_download_lock.py> ----
+
+"""
+Test per-product download locks: exclusion, stale lock takeover and owner checks.
+"""
+
+import os
+import time
+import threading
+
+import CDSE.download_lock as CDSE_lock
+import CDSE.search_and_download as CDSE_sd
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def _lock(download_dir, **kwargs):
+    return CDSE_lock.ProductDownloadLock(download_dir, 'PRODUCT.SAFE', **kwargs)
+
+def _make_stale(lock):
+    # owner died: no more heartbeats, old mtime
+    lock._stop_heartbeat.set()
+    lock._heartbeat_thread.join()
+    t = time.time() - 3600
+    os.utime(lock.lock_path, (t, t))
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def test_lock_is_exclusive(tmp_path):
+    first = _lock(tmp_path)
+    second = _lock(tmp_path)
+
+    assert first.try_acquire()
+    assert not second.try_acquire()
+    assert second.read_owner()['token'] == first.owner['token']
+
+    first.release()
+    assert not first.lock_path.exists()
+    assert second.try_acquire()
+    second.release()
+
+def test_single_takeover_of_stale_lock(tmp_path):
+    dead = _lock(tmp_path, stale_seconds=60)
+    assert dead.try_acquire()
+    _make_stale(dead)
+
+    competitors = [_lock(tmp_path, stale_seconds=60) for i in range(8)]
+    threads = [threading.Thread(target=lock.try_acquire) for lock in competitors]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    winners = [lock for lock in competitors if lock.acquired]
+    assert len(winners) == 1
+    assert winners[0].read_owner()['token'] == winners[0].owner['token']
+    # no takeover claims are left behind
+    assert sorted(path.name for path in tmp_path.iterdir()) == [winners[0].lock_path.name]
+
+    winners[0].release()
+
+def test_takeover_after_abandoned_claim(tmp_path):
+    dead = _lock(tmp_path, stale_seconds=60)
+    assert dead.try_acquire()
+    _make_stale(dead)
+
+    # a worker died after creating its takeover claim
+    claim_path = dead.lock_path.with_name(f"{dead.lock_path.name}.takeover.{dead.owner['token']}")
+    claim_path.touch()
+    other = _lock(tmp_path, stale_seconds=60)
+    assert not other.try_acquire()
+
+    t = time.time() - 3600
+    os.utime(claim_path, (t, t))
+    assert other.try_acquire()
+    assert sorted(path.name for path in tmp_path.iterdir()) == [other.lock_path.name]
+
+    other.release()
+
+def test_fresh_lock_is_not_taken_over(tmp_path):
+    owner = _lock(tmp_path, stale_seconds=60)
+    assert owner.try_acquire()
+
+    other = _lock(tmp_path, stale_seconds=60)
+    other._break_stale_lock()
+    assert not other.try_acquire()
+    assert owner.read_owner()['token'] == owner.owner['token']
+
+    owner.release()
+
+def test_heartbeat_does_not_refresh_other_lock(tmp_path):
+    old_owner = _lock(tmp_path, stale_seconds=60, heartbeat_seconds=0.05)
+    assert old_owner.try_acquire()
+    _make_stale(old_owner)
+
+    new_owner = _lock(tmp_path, stale_seconds=60, heartbeat_seconds=3600)
+    assert new_owner.try_acquire()
+    t = time.time() - 30
+    os.utime(new_owner.lock_path, (t, t))
+
+    # the old owner resumes its heartbeat, notices the takeover and stops
+    old_owner._start_heartbeat()
+    time.sleep(0.2)
+    assert not old_owner._heartbeat_thread.is_alive()
+    assert abs(new_owner.lock_path.stat().st_mtime - t) < 1
+
+    # releasing the lost lock leaves the new owner's lock in place
+    old_owner.release()
+    assert new_owner.lock_path.exists()
+    new_owner.release()
+    assert not new_owner.lock_path.exists()
+
+def test_download_skips_locked_product(tmp_path, mock_server):
+    product = CDSE_sd.search_CDSE_catalogue('SENTINEL-1', {'lat': 77.5, 'lon': -8.5}, '2022-06-01', '2022-07-01', loglevel='ERROR')['value'][0]
+
+    lock = CDSE_lock.ProductDownloadLock(tmp_path, product['Name'])
+    assert lock.try_acquire()
+    try:
+        assert not CDSE_sd.download_product_from_cdse(product, tmp_path, 'user', 'password', lock_policy='skip')
+    finally:
+        lock.release()
+    assert mock_server.counters['download'] == 0
+
+    assert CDSE_sd.download_product_from_cdse(product, tmp_path, 'user', 'password', lock_policy='skip')
+    assert mock_server.counters['download'] == 1
+    assert not lock.lock_path.exists()
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+# ---- End of <test_download_lock.py> ----
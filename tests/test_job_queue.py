@@ -0,0 +1,125 @@
+# ---- This is <test_job_queue.py> ----
+
+"""
+Test leases of the durable download job queue and the queue worker.
+"""
+
+import time
+
+import CDSE.job_queue as CDSE_jq
+import CDSE.download_lock as CDSE_lock
+import CDSE.search_and_download as CDSE_sd
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def _products(n):
+    return [{'Id': f"id{i}", 'Name': f"PRODUCT_{i}.SAFE"} for i in range(n)]
+
+def _search_mock_products(n):
+    response_json = CDSE_sd.search_CDSE_catalogue('SENTINEL-1', {'lat': 77.5, 'lon': -8.5}, '2022-06-01', '2022-07-01', loglevel='ERROR')
+    return response_json['value'][:n]
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def test_expired_lease_is_taken_over(tmp_path):
+    queue = CDSE_jq.DownloadJobQueue(tmp_path / 'queue.db', lease_seconds=0.05)
+    queue.enqueue(_products(1))
+
+    assert queue.acquire('worker_1')['Id'] == 'id0'
+    # lease is held
+    assert queue.acquire('worker_2') is None
+
+    time.sleep(0.1)
+    assert queue.acquire('worker_2')['Id'] == 'id0'
+
+    # the first worker lost the job, its updates are ignored
+    assert not queue.heartbeat('id0', 'worker_1')
+    assert not queue.complete('id0', 'worker_1')
+    assert queue.fail('id0', 'error', 'worker_1') is None
+    assert queue.get_jobs()[0]['lease_owner'] == 'worker_2'
+
+    assert queue.complete('id0', 'worker_2')
+    assert queue.counts()[CDSE_jq.DONE] == 1
+
+def test_fail_until_max_attempts(tmp_path):
+    queue = CDSE_jq.DownloadJobQueue(tmp_path / 'queue.db', max_attempts=2)
+    queue.enqueue(_products(1))
+
+    assert queue.fail('unknown', 'error', 'worker') is None
+
+    queue.acquire('worker')
+    assert queue.fail('id0', 'first error', 'worker') == CDSE_jq.PENDING
+    queue.acquire('worker')
+    assert queue.fail('id0', 'second error', 'worker') == CDSE_jq.FAILED
+    assert queue.get_jobs()[0]['last_error'] == 'second error'
+
+    assert queue.reset_failed() == 1
+    assert queue.get_jobs()[0]['state'] == CDSE_jq.PENDING
+
+def test_crashing_job_fails_after_max_attempts(tmp_path):
+    queue = CDSE_jq.DownloadJobQueue(tmp_path / 'queue.db', lease_seconds=0.05, max_attempts=2)
+    queue.enqueue(_products(2))
+
+    # every worker that acquires id0 dies without heartbeat, fail or release
+    assert queue.acquire('worker_1')['Id'] == 'id0'
+    time.sleep(0.1)
+    assert queue.acquire('worker_2')['Id'] == 'id0'
+    time.sleep(0.1)
+
+    assert queue.acquire('worker_3')['Id'] == 'id1'
+    jobs = {job['id']: job for job in queue.get_jobs()}
+    assert jobs['id0']['state'] == CDSE_jq.FAILED
+    assert jobs['id0']['attempts'] == 2
+    assert jobs['id0']['lease_owner'] is None
+    assert not queue.heartbeat('id0', 'worker_2')
+    assert queue.acquire('worker_4') is None
+
+def test_enqueue_ignores_known_products(tmp_path):
+    queue = CDSE_jq.DownloadJobQueue(tmp_path / 'queue.db')
+
+    assert queue.enqueue(_products(2)) == 2
+    assert queue.enqueue(_products(3)) == 1
+
+def test_worker_downloads_queue(tmp_path, mock_server):
+    download_dir = tmp_path / 'downloads'
+    download_dir.mkdir()
+    queue_path = tmp_path / 'queue.db'
+
+    CDSE_jq.DownloadJobQueue(queue_path).enqueue(_search_mock_products(3))
+
+    assert CDSE_jq.run_download_worker(queue_path, download_dir, 'user', 'password', worker_id='worker', loglevel='ERROR') == 3
+    assert len(list(download_dir.glob('*.zip'))) == 3
+    assert mock_server.counters['download'] == 3
+
+    # a restarted worker finds nothing to do
+    assert CDSE_jq.run_download_worker(queue_path, download_dir, 'user', 'password', worker_id='worker', loglevel='ERROR') == 0
+    assert mock_server.counters['download'] == 3
+
+def test_worker_leaves_locked_jobs_pending(tmp_path, mock_server):
+    download_dir = tmp_path / 'downloads'
+    download_dir.mkdir()
+    queue_path = tmp_path / 'queue.db'
+
+    products = _search_mock_products(2)
+    CDSE_jq.DownloadJobQueue(queue_path).enqueue(products)
+
+    # first product is being downloaded by a worker of another queue
+    lock = CDSE_lock.ProductDownloadLock(download_dir, products[0]['Name'])
+    assert lock.try_acquire()
+    try:
+        n_done = CDSE_jq.run_download_worker(queue_path, download_dir, 'user', 'password', worker_id='worker', lock_policy='skip', loglevel='ERROR')
+    finally:
+        lock.release()
+
+    assert n_done == 1
+    jobs = {job['id']: job for job in CDSE_jq.DownloadJobQueue(queue_path).get_jobs()}
+    assert jobs[products[0]['Id']]['state'] == CDSE_jq.PENDING
+    assert jobs[products[0]['Id']]['attempts'] == 0
+    assert jobs[products[1]['Id']]['state'] == CDSE_jq.DONE
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+# ---- End of <test_job_queue.py> ----
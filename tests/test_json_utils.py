@@ -0,0 +1,49 @@
+# ---- This is <test_json_utils.py> ----
+
+"""
+Test the vectorized GeoJSON to WKT conversion against convert_geojson_obj_2_wkt.
+"""
+
+import copy
+
+import pytest
+
+import CDSE.json_utils as CDSE_json
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+polygon_3d = {'type': 'Polygon', 'coordinates': [[[10.123456, 78.5, 100], [11, 78.5, 100], [11, 79, 100], [10.123456, 78.5, 100]]]}
+
+geojson_objs = {
+    'polygon_3d': polygon_3d,
+    'feature': {'type': 'Feature', 'properties': {}, 'geometry': polygon_3d},
+    'feature_collection': {'type': 'FeatureCollection', 'features': [
+        {'type': 'Feature', 'properties': {}, 'geometry': polygon_3d},
+        {'type': 'Feature', 'properties': {}, 'geometry': {'type': 'Point', 'coordinates': [16, 78, 5]}},
+    ]},
+    # fallback of the vectorized conversion, also used for decimals > max_vectorized_decimals
+    'polygon_3d_crs': dict(polygon_3d, crs={'type': 'name', 'properties': {'name': 'EPSG:4326'}}),
+}
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+@pytest.mark.parametrize('decimals', [0, 4, 13])
+@pytest.mark.parametrize('name', sorted(geojson_objs))
+def test_same_output_and_input_not_modified(name, decimals):
+    geojson_obj = copy.deepcopy(geojson_objs[name])
+
+    expected = CDSE_json.convert_geojson_obj_2_wkt(copy.deepcopy(geojson_obj), decimals=decimals)
+
+    assert CDSE_json.convert_geojson_obj_2_wkt_vectorized(geojson_obj, decimals=decimals) == expected
+    assert geojson_obj == geojson_objs[name]
+
+def test_out_of_bounds():
+    with pytest.raises(ValueError, match='Latitude'):
+        CDSE_json.convert_geojson_obj_2_wkt_vectorized({'type': 'Point', 'coordinates': [10, 91]})
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+# ---- End of <test_json_utils.py> ----
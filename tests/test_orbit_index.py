@@ -0,0 +1,74 @@
+# ---- This is <test_orbit_index.py> ----
+
+"""
+Test S1 relative orbit queries narrowed by the orbit index, searched against the mock server.
+"""
+
+import CDSE.orbit_index as CDSE_orbits
+import CDSE.search_and_download as CDSE_sd
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+# covered by the footprints of the synthetic products 8 and 9 (relative orbits 9 and 10)
+svalbard_point = {'lat': 77.5, 'lon': -8.5}
+
+def _search(area, **kwargs):
+    return CDSE_sd.search_CDSE_catalogue('SENTINEL-1', area, '2022-06-01', '2022-07-01', loglevel='ERROR', **kwargs)
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def test_relative_orbit_query_url():
+    querySTR = CDSE_sd.build_CDSE_query_url('SENTINEL-1', svalbard_point, '2022-06-01', '2022-07-01', relative_orbit=[9, 10], loglevel='ERROR')
+
+    assert "att/OData.CSC.IntegerAttribute/Value eq 9 or att/OData.CSC.IntegerAttribute/Value eq 10" in querySTR
+    assert "relativeOrbitNumber" in querySTR
+
+def test_orbit_index_restricts_covered_areas(tmp_path, mock_server, catalogue_queries):
+    orbit_index = CDSE_orbits.RelativeOrbitIndex(tmp_path / 'orbits.json')
+
+    # unknown area: all orbits are searched and recorded
+    assert orbit_index.get_coverage(svalbard_point) == 0.0
+    _search(svalbard_point, orbit_index=orbit_index)
+    assert 'relativeOrbitNumber' not in catalogue_queries[-1]
+    assert CDSE_orbits.RelativeOrbitIndex(tmp_path / 'orbits.json').get_coverage(svalbard_point) == 1.0
+
+    relative_orbits = orbit_index.find_relative_orbits(svalbard_point)
+    assert {9, 10} <= set(relative_orbits)
+
+    # covered area: search is restricted to the known orbits
+    _search(svalbard_point, orbit_index=orbit_index)
+    assert 'relativeOrbitNumber' in catalogue_queries[-1]
+    for orbit in relative_orbits:
+        assert f"Value eq {orbit}" in catalogue_queries[-1]
+
+    # split search: one query per orbit
+    n_queries = len(catalogue_queries)
+    _search(svalbard_point, orbit_index=orbit_index, split_by_orbit=True)
+    assert len(catalogue_queries) - n_queries == len(relative_orbits)
+
+def test_orbit_index_records_all_pages(tmp_path, mock_server):
+    orbit_index = CDSE_orbits.RelativeOrbitIndex(tmp_path / 'orbits.json')
+
+    response_json = _search(svalbard_point, max_results=15)
+
+    assert orbit_index.update_from_search(response_json) == mock_server.n_products
+    assert orbit_index.update_from_search(response_json) == 0
+
+def test_partially_covered_area_is_not_restricted(tmp_path, mock_server, catalogue_queries):
+    orbit_index = CDSE_orbits.RelativeOrbitIndex(tmp_path / 'orbits.json')
+    _search(svalbard_point, orbit_index=orbit_index)
+
+    # half of the area lies south of all synthetic footprints
+    area = tmp_path / 'aoi.geojson'
+    area.write_text('{"type": "Polygon", "coordinates": [[[-9, 75], [-8, 75], [-8, 77], [-9, 77], [-9, 75]]]}')
+    assert 0 < orbit_index.get_coverage(area) < 1
+
+    _search(area, orbit_index=orbit_index)
+    assert 'relativeOrbitNumber' not in catalogue_queries[-1]
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+# ---- End of <test_orbit_index.py> ----
@@ -0,0 +1,46 @@
+# ---- This is <test_product.py> ----
+
+"""
+Test the Product object model: round trip to product dicts and lazy attributes.
+"""
+
+import pytest
+
+import CDSE.product as CDSE_product
+import CDSE.mock_server as CDSE_mock
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+@pytest.mark.parametrize('sensor', ['SENTINEL-1', 'SENTINEL-2'])
+def test_round_trip(sensor):
+    product_dict = CDSE_mock.build_synthetic_product(9, 1000, sensor=sensor)
+    product = CDSE_product.Product(product_dict)
+
+    # OData annotations (e.g. '@odata.mediaContentType') are not kept
+    expected = {key: value for key, value in product_dict.items() if not key.startswith('@')}
+    assert product.to_dict() == expected
+    assert product.get_attribute('relativeOrbitNumber') == 10
+    # decoded attributes are rebuilt
+    assert product.to_dict() == expected
+
+def test_missing_keys_are_not_listed():
+    product = CDSE_product.Product({'Id': 'id0', 'Name': 'PRODUCT_0.SAFE'})
+
+    assert product.to_dict() == {'Id': 'id0', 'Name': 'PRODUCT_0.SAFE'}
+    assert 'Assets' not in product
+    assert product.get('Assets') is None
+    with pytest.raises(KeyError):
+        product['ContentDate']
+    assert product.get_attribute('cloudCover') is None
+
+def test_empty_assets_differ_from_missing_assets():
+    product = CDSE_product.Product({'Id': 'id0', 'Name': 'PRODUCT_0.SAFE', 'Assets': []})
+
+    assert 'Assets' in product
+    assert product.get('Assets') == []
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+# ---- End of <test_product.py> ----
@@ -0,0 +1,68 @@
+# ---- This is <test_product_cache.py> ----
+
+"""
+Test the shared product cache: hits, hardlinks and size-budget eviction.
+"""
+
+import CDSE.product_cache as CDSE_cache
+import CDSE.search_and_download as CDSE_sd
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def _search_mock_products(n):
+    response_json = CDSE_sd.search_CDSE_catalogue('SENTINEL-1', {'lat': 77.5, 'lon': -8.5}, '2022-06-01', '2022-07-01', loglevel='ERROR')
+    return response_json['value'][:n]
+
+def _fetch(cache, product, download_dir):
+    download_dir.mkdir(exist_ok=True)
+    download_zip_path = download_dir / f"{product['Name'].split('.SAFE')[0]}.zip"
+    assert cache.fetch(product, download_zip_path, 'user', 'password')
+    return download_zip_path
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def test_cache_hit_is_linked(tmp_path, mock_server):
+    cache = CDSE_cache.ProductCache(tmp_path / 'cache', max_size=10 * len(mock_server.payload))
+    product = _search_mock_products(1)[0]
+
+    first = _fetch(cache, product, tmp_path / 'downloads_1')
+    second = _fetch(cache, product, tmp_path / 'downloads_2')
+
+    assert mock_server.counters['download'] == 1
+    assert first.stat().st_ino == second.stat().st_ino
+    assert product in cache
+
+def test_eviction_with_hardlinks(tmp_path, mock_server):
+    product_size = len(mock_server.payload)
+    cache = CDSE_cache.ProductCache(tmp_path / 'cache', max_size=product_size)
+    products = _search_mock_products(3)
+
+    paths = [_fetch(cache, product, tmp_path / 'downloads') for product in products]
+
+    # all products are linked into the download directory, they do not count against the budget
+    assert all(product in cache for product in products)
+    assert cache.get_size() == 3 * product_size
+
+    # copies in the download directory are deleted: the cache holds two products alone
+    paths[0].unlink()
+    paths[1].unlink()
+    assert cache.evict() == product_size
+
+    assert products[0] not in cache
+    assert products[1] in cache
+    assert products[2] in cache
+    assert cache.get_size() == 2 * product_size
+
+    # pinned products are kept
+    cache.pin(CDSE_cache.get_product_cache_key(products[1]))
+    assert cache.evict(max_size=0) == 0
+    cache.unpin(CDSE_cache.get_product_cache_key(products[1]))
+    assert cache.evict(max_size=0) == product_size
+    assert products[2] in cache
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+# ---- End of <test_product_cache.py> ----
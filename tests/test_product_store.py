@@ -0,0 +1,76 @@
+# ---- This is <test_product_store.py> ----
+
+"""
+Test recovery of the JSON-lines product store after crashed writers.
+"""
+
+import CDSE.product_store as CDSE_store
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def _product(i):
+    return {'Id': f"id{i}", 'Name': f"PRODUCT_{i}.SAFE", 'ContentLength': i}
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def test_append_and_get(tmp_path):
+    store = CDSE_store.ProductStore(tmp_path / 'products.jsonl')
+
+    assert store.append_products([_product(0), _product(1), _product(0)]) == 2
+    assert not store.append(_product(1))
+
+    assert store.get('id1') == _product(1)
+    assert store.get('PRODUCT_0.SAFE') == _product(0)
+    assert len(CDSE_store.ProductStore(tmp_path / 'products.jsonl')) == 2
+
+def test_recovery_of_unindexed_and_torn_records(tmp_path):
+    store_path = tmp_path / 'products.jsonl'
+    store = CDSE_store.ProductStore(store_path)
+    store.append(_product(0))
+    store.close()
+
+    # crash after writing a complete record but before indexing it, and in the middle of the next one
+    with open(store_path, 'a') as f:
+        f.write('{"Id":"id1","Name":"PRODUCT_1.SAFE","ContentLength":1}\n{"Id":"id2","Na')
+
+    store = CDSE_store.ProductStore(store_path)
+    assert set(store.ids()) == {'id0', 'id1'}
+
+    store.append(_product(3))
+    assert store.get('id3') == _product(3)
+    assert set(CDSE_store.ProductStore(store_path).ids()) == {'id0', 'id1', 'id3'}
+
+def test_torn_index_line_is_not_merged(tmp_path):
+    store_path = tmp_path / 'products.jsonl'
+    store = CDSE_store.ProductStore(store_path)
+    store.append(_product(0))
+    store.close()
+
+    # crash in the middle of an index line
+    with open(store.index_path, 'a') as f:
+        f.write('id9\tPRODUCT_9.SAFE\t1')
+
+    store = CDSE_store.ProductStore(store_path)
+    store.append(_product(1))
+
+    lines = store.index_path.read_text().splitlines()
+    assert [line.split('\t')[0] for line in lines] == ['id0', 'id1']
+    assert CDSE_store.ProductStore(store_path).get('id1') == _product(1)
+
+def test_other_writers_are_picked_up(tmp_path):
+    store_path = tmp_path / 'products.jsonl'
+    reader = CDSE_store.ProductStore(store_path)
+    writer = CDSE_store.ProductStore(store_path)
+
+    writer.append_products([_product(0), _product(1)])
+    assert 'id1' not in reader
+
+    reader.refresh()
+    assert reader.get('id1') == _product(1)
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+# ---- End of <test_product_store.py> ----
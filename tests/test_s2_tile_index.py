@@ -0,0 +1,57 @@
+# ---- This is <test_s2_tile_index.py> ----
+
+"""
+Test S2 tile lookup and tile-name queries, searched against the mock server.
+"""
+
+import CDSE.s2_tile_index as CDSE_tiles
+import CDSE.search_and_download as CDSE_sd
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def test_tile_ids_of_area(s2_tile_index):
+    tile_ids = CDSE_tiles.get_s2_tile_ids({'lat': 78.5, 'lon': 16.0})
+
+    assert tile_ids
+    assert all(len(tile_id) == 5 and tile_id.startswith('33X') for tile_id in tile_ids)
+
+def _box(lon_min, lat_min, lon_max, lat_max):
+    return [[[lon_min, lat_min], [lon_max, lat_min], [lon_max, lat_max], [lon_min, lat_max], [lon_min, lat_min]]]
+
+def test_antimeridian_areas(s2_tile_index):
+    east = s2_tile_index.lookup_geometry({'type': 'Polygon', 'coordinates': _box(179.2, 70.2, 180, 70.8)})
+    west = s2_tile_index.lookup_geometry({'type': 'Polygon', 'coordinates': _box(-180, 70.2, -179.2, 70.8)})
+    # a few tiles of UTM zones 60 and 1 (tiles overlap the zone borders), not the whole latitude band
+    assert {tile_id[:2] for tile_id in east + west} == {'60', '01'}
+    assert len(east) < 10 and len(west) < 10
+
+    # split at the antimeridian (RFC 7946)
+    multipolygon = {'type': 'MultiPolygon', 'coordinates': [_box(179.2, 70.2, 180, 70.8), _box(-180, 70.2, -179.2, 70.8)]}
+    assert s2_tile_index.lookup_geometry(multipolygon) == sorted(set(east + west))
+
+    # not split, longitudes jump from 179.2 to -179.2
+    polygon = {'type': 'Polygon', 'coordinates': [[[179.2, 70.2], [-179.2, 70.2], [-179.2, 70.8], [179.2, 70.8], [179.2, 70.2]]]}
+    assert s2_tile_index.lookup_geometry(polygon) == sorted(set(east + west))
+
+def test_tile_query_url(s2_tile_index):
+    querySTR = CDSE_sd.build_CDSE_query_url('SENTINEL-2', {'lat': 78.5, 'lon': 16.0}, '2022-06-01', '2022-07-01', tile_ids=['33XVG', '33XWG'], loglevel='ERROR')
+
+    assert "contains(Name,'_T33XVG_') or contains(Name,'_T33XWG_')" in querySTR
+    assert 'Intersects' not in querySTR
+
+def test_tile_search_merges_queries(s2_tile_index, mock_server, catalogue_queries):
+    area = {'lat': 78.5, 'lon': 16.0}
+    tile_ids = CDSE_tiles.get_s2_tile_ids(area)
+
+    response_json = CDSE_sd.search_CDSE_catalogue('SENTINEL-2', area, '2022-06-01', '2022-07-01', use_tile_index=True, tiles_per_query=1, loglevel='ERROR')
+
+    # one query per tile, overlapping results are listed once
+    assert len(catalogue_queries) == len(tile_ids)
+    assert len(response_json['value']) == mock_server.n_products
+    assert len(set(product['Id'] for product in response_json['value'])) == mock_server.n_products
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+# ---- End of <test_s2_tile_index.py> ----
@@ -0,0 +1,103 @@
+# ---- This is <test_watcher.py> ----
+
+"""
+Test query merging and product routing of the AOI watcher against the mock server.
+"""
+
+import json
+
+import CDSE.watcher as CDSE_watcher
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def _subscriptions(download_dir):
+    # synthetic products 8 and 9 (relative orbits 9 and 10) cover the svalbard point, none covers the other one
+    svalbard_point = {'lat': 77.5, 'lon': -8.5}
+    return [
+        CDSE_watcher.Subscription('all_orbits', 'SENTINEL-1', svalbard_point, download_dir=download_dir),
+        CDSE_watcher.Subscription('orbit_10', 'SENTINEL-1', svalbard_point, relative_orbit=10, download_dir=download_dir),
+        CDSE_watcher.Subscription('equator', 'SENTINEL-1', {'lat': 0.0, 'lon': 0.0}, download_dir=download_dir),
+    ]
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+def test_subscriptions_share_one_query(tmp_path):
+    watcher = CDSE_watcher.AOIWatcher(_subscriptions(tmp_path / 'downloads'), tmp_path / 'state.json', loglevel='ERROR')
+
+    queries = watcher.plan_queries()
+    watcher.close()
+
+    assert len(queries) == 1
+    assert [subscription.name for subscription in queries[0]['subscriptions']] == ['all_orbits', 'orbit_10', 'equator']
+    # one subscription accepts all orbits, so the merged query does too
+    assert 'relativeOrbitNumber' not in queries[0]['querySTR']
+
+def test_routing_and_downloads(tmp_path, mock_server):
+    download_dir = tmp_path / 'downloads'
+    matches = []
+
+    with CDSE_watcher.AOIWatcher(
+        _subscriptions(download_dir),
+        tmp_path / 'state.json',
+        username = 'user',
+        password = 'password',
+        on_match = lambda subscription, product: matches.append((subscription.name, product.get_attribute('relativeOrbitNumber'))),
+        loglevel = 'ERROR'
+    ) as watcher:
+        summary = watcher.poll()
+        status = watcher.get_status()
+
+    assert summary['n_queries'] == 1
+    assert summary['n_products'] == mock_server.n_products
+    assert sorted(matches) == [('all_orbits', 9), ('all_orbits', 10), ('orbit_10', 10)]
+
+    # the product of two subscriptions is downloaded once into their shared directory
+    assert (summary['n_matched'], summary['n_downloaded'], summary['n_failed']) == (3, 2, 0)
+    assert mock_server.counters['download'] == 2
+    assert len(list(download_dir.glob('*.zip'))) == 2
+
+    assert status['all_orbits']['n_downloaded'] == 2
+    assert status['orbit_10']['n_downloaded'] == 1
+    assert status['equator']['n_matched'] == 0
+    assert all(s['n_pending'] == 0 for s in status.values())
+
+    # a restarted watcher does not route the same products again
+    with CDSE_watcher.AOIWatcher(_subscriptions(download_dir), tmp_path / 'state.json', username='user', password='password', loglevel='ERROR') as watcher:
+        summary = watcher.poll()
+
+    assert (summary['n_matched'], summary['n_downloaded']) == (0, 0)
+    assert mock_server.counters['download'] == 2
+
+def test_downloads_wait_for_credentials(tmp_path, mock_server):
+    with CDSE_watcher.AOIWatcher(_subscriptions(tmp_path / 'downloads'), tmp_path / 'state.json', loglevel='ERROR') as watcher:
+        summary = watcher.poll()
+        status = watcher.get_status()
+
+    assert (summary['n_matched'], summary['n_downloaded']) == (3, 0)
+    assert status['all_orbits']['n_pending'] == 2
+    assert mock_server.counters['download'] == 0
+
+    state = json.loads((tmp_path / 'state.json').read_text())
+    assert len(state['subscriptions']['orbit_10']['pending']) == 1
+
+def test_invalid_subscriptions_are_skipped(tmp_path):
+    (tmp_path / 'aoi.geojson').write_text('{"type": "Polygon", "coordinates": [[[10, 78], [11, 78], [11, 79], [10, 79], [10, 78]]]}')
+    config = [
+        {'name': 'valid', 'sensor': 'SENTINEL-1', 'area': 'aoi.geojson', 'download_dir': 'downloads'},
+        {'name': 'missing_aoi', 'sensor': 'SENTINEL-1', 'area': 'missing.geojson'},
+        {'name': 'invalid_sensor', 'sensor': 'SENTINEL-4', 'area': 'aoi.geojson'},
+    ]
+    config_path = tmp_path / 'subscriptions.json'
+    config_path.write_text(json.dumps({'subscriptions': config}))
+
+    subscriptions = CDSE_watcher.load_subscriptions(config_path)
+
+    assert [subscription.name for subscription in subscriptions] == ['valid']
+    assert subscriptions[0].download_dir == tmp_path / 'downloads'
+
+# -------------------------------------------------------------------------- #
+# -------------------------------------------------------------------------- #
+
+# ---- End of <test_watcher.py> ----